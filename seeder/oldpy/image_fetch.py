@@ -1,4 +1,5 @@
 import os
+import sys
 import requests
 from dotenv import load_dotenv
 from pymongo import MongoClient
@@ -8,6 +9,9 @@ from google_images_search import GoogleImagesSearch
 import time
 from googleapiclient.errors import HttpError
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pythonScript"))
+from bulk_writer import BulkUpdateWriter
+
 # Load environment variables from .env file
 load_dotenv(override=True)
 
@@ -147,13 +151,15 @@ def update_mongo_with_image_urls():
     Update MongoDB 'ingredients' collection with image URLs.
     """
     ingredients = db.ingredients.find()
-    def mongo_update_function(entry, image_url):
-        db.ingredients.update_one(
-            {"_id": entry["_id"]},
-            {"$set": {"image_url": image_url}}
-        )
-    for ingredient in ingredients:
-        update_image_url(ingredient, mongo_update_function)
+    with BulkUpdateWriter(db) as writer:
+        def mongo_update_function(entry, image_url):
+            writer.add(
+                "ingredients",
+                {"_id": entry["_id"]},
+                {"$set": {"image_url": image_url}}
+            )
+        for ingredient in ingredients:
+            update_image_url(ingredient, mongo_update_function)
 
 def update_json_with_image_urls(json_file):
     """
@@ -9,13 +9,56 @@ from .postgresql_setup import PostgreSQLSetup
 from .mongodb_setup import MongoDBSetup
 from .data_insertion import DataInsertion
 from .youtube_image_fetch import YouTubeImageFetcher
+from .table_scheduler import TableLoadScheduler
+from .json_stream import iter_json_documents
+from .checkpoint import CheckpointStore
+from .fetch_engine import AsyncFetchEngine
+from .bulk_writer import BulkUpdateWriter
+from .response_cache import ResponseCache
+from .query_normalizer import normalize_ingredient_name
+from .image_resolver import HedgedImageResolver
+from .video_resolver import RankedVideoResolver
+from .schema_models import Column, Index, Table
+from .schema_migration import SchemaMigrator
+from .connection_manager import ConnectionManager
+from .stage_orchestrator import Stage, StageOrchestrator
+from .metrics import MetricsRegistry
+from .synthetic_data import SyntheticDataGenerator
+from .pantry_matcher import PantryMatcher
+from .unit_registry import UnitRegistry
+from .expiry_sweeper import ExpirySweeper
+from .price_snapshot import PriceSnapshot
+from .basket_optimizer import BasketOptimizer
 
 __all__ = [
     'AWSSetup',
     'PostgreSQLSetup',
     'MongoDBSetup',
     'DataInsertion',
-    'YouTubeImageFetcher'
+    'YouTubeImageFetcher',
+    'TableLoadScheduler',
+    'iter_json_documents',
+    'CheckpointStore',
+    'AsyncFetchEngine',
+    'BulkUpdateWriter',
+    'ResponseCache',
+    'normalize_ingredient_name',
+    'HedgedImageResolver',
+    'RankedVideoResolver',
+    'Column',
+    'Index',
+    'Table',
+    'SchemaMigrator',
+    'ConnectionManager',
+    'Stage',
+    'StageOrchestrator',
+    'MetricsRegistry',
+    'SyntheticDataGenerator',
+    'PantryMatcher',
+    'UnitRegistry',
+    'ExpirySweeper',
+    'PriceSnapshot',
+    'BasketOptimizer'
 ]
 
 # Optional: Set package-level variables or functions here.
@@ -0,0 +1,386 @@
+import argparse
+import os
+import random
+import time
+from itertools import combinations, islice
+from math import comb
+
+import numpy as np
+
+try:
+    from .metrics import percentile
+    from .price_snapshot import PriceSnapshot
+    from .synthetic_data import SyntheticDataGenerator
+except ImportError:
+    from metrics import percentile
+    from price_snapshot import PriceSnapshot
+    from synthetic_data import SyntheticDataGenerator
+
+
+class BasketOptimizer:
+    """
+    Chooses the stores to buy a shopping list at, minimising the total cost over at most a few stores.
+
+    Every item is bought at the cheapest of the chosen stores that sells it, so the problem
+    is picking the set of stores. The items are laid out as a dense cost matrix of items by
+    stores from a PriceSnapshot, and a set of stores is scored by taking the column minimum
+    of its stores per item and adding it up.
+
+    A greedy pass adds the store that lowers the total the most until no store helps or the
+    store limit is reached, and a local search then swaps chosen stores for better ones.
+    When the number of store sets is small enough, they are all scored in vectorised chunks,
+    after dropping stores that another store beats or matches on every item, which makes the
+    answer exact. Every phase stops at the time budget and returns the best set found so far.
+
+    Methods:
+        missing_quantities(connection, household_id: int, recipe_ids: list) -> list:
+            Returns what a household lacks to cook a list of recipes.
+        cost_matrix(items: list) -> tuple:
+            Returns the cost of every item at every store that sells any of them.
+        optimize(items: list, max_stores: int, time_budget: float) -> dict:
+            Chooses the stores that minimise the total cost of a shopping list.
+        greedy(costs, max_stores: int) -> tuple:
+            Adds the store that lowers the total the most, until no store helps or the limit is reached.
+        local_search(costs, chosen: list, total: float, deadline: float) -> tuple:
+            Swaps chosen stores for the store that lowers the total the most, while that helps.
+        exhaustive(costs, max_stores: int, chosen: list, total: float, deadline: float) -> tuple:
+            Scores every set of up to max_stores stores, smallest sets first.
+        plan(connection, household_id: int, recipe_ids: list, max_stores: int) -> dict:
+            Builds the shopping list of a recipe plan and chooses the stores for it.
+    """
+
+    def __init__(self, snapshot, matcher=None, max_stores=None, time_budget=None, exact_limit=None):
+        """
+        Initializes the BasketOptimizer.
+
+        Args:
+            snapshot (PriceSnapshot): The latest prices.
+            matcher (PantryMatcher): Provides recipe requirements and household pantries. Only
+                needed to build shopping lists from recipes.
+            max_stores (int): The most stores a basket is split over. Defaults to
+                BASKET_MAX_STORES, or 3.
+            time_budget (float): The seconds an optimization may take. Defaults to
+                BASKET_TIME_BUDGET, or 0.2.
+            exact_limit (int): The most store sets scored for an exact answer. Defaults to
+                BASKET_EXACT_LIMIT, or 200000.
+        """
+        self.snapshot = snapshot
+        self.matcher = matcher
+        self.max_stores = max_stores or int(os.getenv("BASKET_MAX_STORES", "3"))
+        self.time_budget = time_budget or float(os.getenv("BASKET_TIME_BUDGET", "0.2"))
+        self.exact_limit = exact_limit or int(os.getenv("BASKET_EXACT_LIMIT", "200000"))
+        # The number of matrix cells scored per chunk of the exhaustive search.
+        self.chunk_cells = 2000000
+
+    def missing_quantities(self, connection, household_id, recipe_ids):
+        """
+        Returns what a household lacks to cook a list of recipes.
+
+        The requirements of the recipes are added up per ingredient and base unit, and the
+        household's unexpired stock in the same base unit is subtracted.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+            household_id (int): The household.
+            recipe_ids (list): The recipes, listed once for every time they are cooked.
+
+        Returns:
+            list: (ingredient_id, quantity, base unit) tuples of the missing quantities,
+                sorted by ingredient.
+        """
+        required = {}
+        for recipe_id in recipe_ids:
+            for ingredient_id, quantity, base_unit in self.matcher.recipe_requirements(recipe_id):
+                required[ingredient_id, base_unit] = required.get((ingredient_id, base_unit), 0.0) + quantity
+
+        pantry = self.matcher.household_pantry(connection, household_id)
+        missing = []
+        for (ingredient_id, base_unit), quantity in sorted(required.items()):
+            have, have_unit = pantry.get(ingredient_id, (0.0, base_unit))
+            if have_unit == base_unit:
+                quantity = round(quantity - have, 4)
+            if quantity > 0:
+                missing.append((ingredient_id, quantity, base_unit))
+        return missing
+
+    def cost_matrix(self, items):
+        """
+        Returns the cost of every item at every store that sells any of them.
+
+        A store that does not sell an item gets a penalty above the total of any basket, so
+        covering more items always comes before a lower total.
+
+        Args:
+            items (list): Ingredient ids, or (ingredient_id, quantity, unit) tuples.
+
+        Returns:
+            tuple: The ingredient id of every item, the store ids, the float matrix of items
+                by stores, and the penalty.
+        """
+        ingredient_ids, rows, item_of_row, costs = self.snapshot.gather(items)
+        # Only the stores selling at least one item become columns, numbered in store order.
+        stores_of_row = self.snapshot.pair_store_index[rows]
+        present = np.bincount(stores_of_row, minlength=len(self.snapshot.stores)) > 0
+        columns = np.cumsum(present) - 1
+
+        # The rows of an item are consecutive, so the most expensive price of every item is a segment maximum.
+        penalty = 1.0
+        if len(costs):
+            starts = np.flatnonzero(np.append(True, item_of_row[1:] != item_of_row[:-1]))
+            penalty += float(np.maximum.reduceat(costs, starts).sum())
+        matrix = np.full((len(ingredient_ids), int(present.sum())), penalty)
+        matrix[item_of_row, columns[stores_of_row]] = costs
+        return ingredient_ids, self.snapshot.stores[present], matrix, penalty
+
+    def optimize(self, items, max_stores=None, time_budget=None):
+        """
+        Chooses the stores that minimise the total cost of a shopping list.
+
+        Args:
+            items (list): Ingredient ids, or (ingredient_id, quantity, unit) tuples.
+            max_stores (int): The most stores to use. Defaults to the optimizer's limit.
+            time_budget (float): The seconds the local and exact search may take after the greedy
+                choice. Defaults to the optimizer's budget.
+
+        Returns:
+            dict: The chosen store ids, the total cost, the store and cost of every bought
+                item, the ingredient ids the chosen stores do not sell, whether the answer is
+                known to be optimal, and the seconds the search took.
+        """
+        start = time.perf_counter()
+        ingredient_ids, stores, costs, penalty = self.cost_matrix(items)
+        max_stores = min(max_stores or self.max_stores, len(stores))
+
+        # The greedy choice always runs to completion, so even a large list that used up the
+        # budget building its cost matrix gets stores. Only the improvements are timed.
+        chosen, total = self.greedy(costs, max_stores)
+        deadline = time.perf_counter() + (time_budget or self.time_budget)
+        chosen, total = self.local_search(costs, chosen, total, deadline)
+        optimal = not max_stores
+        if max_stores:
+            chosen, total, optimal = self.exhaustive(costs, max_stores, chosen, total, deadline)
+
+        chosen = sorted(chosen)
+        positions = np.arange(len(ingredient_ids))
+        if chosen:
+            best = np.array(chosen)[np.argmin(costs[:, chosen], axis=1)]
+            bought = costs[positions, best] < penalty
+        else:
+            best = np.zeros(len(ingredient_ids), dtype=np.int64)
+            bought = np.zeros(len(ingredient_ids), dtype=bool)
+        item_costs = costs[positions[bought], best[bought]]
+        result = {
+            "stores": [int(stores[column]) for column in chosen],
+            "total": round(float(item_costs.sum()), 6),
+            "items": [
+                {"ingredient_id": ingredient_id, "store_id": store_id, "cost": round(cost, 6)}
+                for ingredient_id, store_id, cost in zip(
+                    ingredient_ids[bought].tolist(), stores[best[bought]].tolist(), item_costs.tolist()
+                )
+            ],
+            "missing": ingredient_ids[~bought].tolist(),
+            "optimal": optimal
+        }
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def greedy(self, costs, max_stores):
+        """
+        Adds the store that lowers the total the most, until no store helps or the limit is reached.
+
+        Each step costs one pass over the matrix, and there are at most max_stores steps.
+
+        Args:
+            costs (numpy.ndarray): The items by stores cost matrix with penalties.
+            max_stores (int): The most stores to choose.
+
+        Returns:
+            tuple: The chosen store columns and their total.
+        """
+        chosen = []
+        best = np.full(len(costs), np.inf)
+        total = np.inf
+        while len(chosen) < max_stores:
+            totals = np.minimum(costs, best[:, None]).sum(axis=0) if chosen else costs.sum(axis=0)
+            totals[chosen] = np.inf
+            column = int(np.argmin(totals))
+            if totals[column] >= total:
+                break
+            chosen.append(column)
+            best = np.minimum(best, costs[:, column])
+            total = float(totals[column])
+        return chosen, total
+
+    def local_search(self, costs, chosen, total, deadline):
+        """
+        Swaps chosen stores for the store that lowers the total the most, while that helps.
+
+        Args:
+            costs (numpy.ndarray): The items by stores cost matrix with penalties.
+            chosen (list): The chosen store columns.
+            total (float): Their total.
+            deadline (float): The perf_counter time to stop at.
+
+        Returns:
+            tuple: The improved store columns and their total.
+        """
+        chosen = list(chosen)
+        improved = len(chosen) > 1
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for position in range(len(chosen)):
+                rest = chosen[:position] + chosen[position + 1:]
+                base = costs[:, rest].min(axis=1)
+                totals = np.minimum(costs, base[:, None]).sum(axis=0)
+                totals[chosen] = np.inf
+                column = int(np.argmin(totals))
+                if totals[column] < total - 1e-9:
+                    chosen[position] = column
+                    total = float(totals[column])
+                    improved = True
+                if time.perf_counter() >= deadline:
+                    break
+        return chosen, total
+
+    def exhaustive(self, costs, max_stores, chosen, total, deadline):
+        """
+        Scores every set of up to max_stores stores, smallest sets first.
+
+        Stores that another store beats or matches on every item are left out first, since
+        swapping them for that store never raises the total. Nothing is scored when more
+        than exact_limit sets remain.
+
+        Args:
+            costs (numpy.ndarray): The items by stores cost matrix with penalties.
+            max_stores (int): The most stores to choose.
+            chosen (list): The best store columns found so far.
+            total (float): Their total.
+            deadline (float): The perf_counter time to stop at.
+
+        Returns:
+            tuple: The best store columns, their total, and whether every set was scored.
+        """
+        if time.perf_counter() >= deadline:
+            return chosen, total, False
+        candidates = np.arange(costs.shape[1])
+        if len(costs) * costs.shape[1] ** 2 <= 10 * self.chunk_cells:
+            keep = []
+            for column in candidates:
+                covers = (costs <= costs[:, [column]]).all(axis=0)
+                better = (costs < costs[:, [column]]).any(axis=0)
+                covers[column] = False
+                # A column is dropped for one that is strictly better somewhere, or for an identical earlier one.
+                if not (covers & (better | (candidates < column))).any():
+                    keep.append(column)
+            candidates = np.array(keep, dtype=np.int64)
+        max_stores = min(max_stores, len(candidates))
+        if sum(comb(len(candidates), size) for size in range(1, max_stores + 1)) > self.exact_limit:
+            return chosen, total, False
+
+        for size in range(1, max_stores + 1):
+            sets = combinations(candidates.tolist(), size)
+            chunk = max(1, self.chunk_cells // (len(costs) * size))
+            while True:
+                block = np.array(list(islice(sets, chunk)), dtype=np.int64).reshape(-1, size)
+                if not len(block):
+                    break
+                if time.perf_counter() >= deadline:
+                    return chosen, total, False
+                totals = costs[:, block].min(axis=2).sum(axis=0)
+                index = int(np.argmin(totals))
+                if totals[index] < total - 1e-9:
+                    chosen, total = block[index].tolist(), float(totals[index])
+        return chosen, total, True
+
+    def plan(self, connection, household_id, recipe_ids, max_stores=None):
+        """
+        Builds the shopping list of a recipe plan and chooses the stores for it.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+            household_id (int): The household.
+            recipe_ids (list): The recipes, listed once for every time they are cooked.
+            max_stores (int): The most stores to use. Defaults to the optimizer's limit.
+
+        Returns:
+            dict: The result of optimize, with the shopping list under "shopping_list".
+        """
+        shopping_list = self.missing_quantities(connection, household_id, recipe_ids)
+        result = self.optimize(shopping_list, max_stores)
+        result["shopping_list"] = shopping_list
+        return result
+
+
+def benchmark(ingredients=10000, stores=500, sizes=(10, 100, 1000, 10000), max_stores=3, runs=20, seed=0):
+    """
+    Times BasketOptimizer.optimize on synthetic prices.
+
+    The prices come from SyntheticDataGenerator, with popular ingredients sold by more stores.
+    For every basket size, random baskets are optimized and the latency percentiles reported.
+    Every item asks for a quantity in the ingredient's base unit, such as 500 g or 2 units, so
+    stores are compared on what the basket actually costs.
+    Baskets that are solved exactly are also solved by the greedy search and local search
+    alone, to measure how far the heuristic is off on its own.
+
+    Args:
+        ingredients (int): The number of ingredients.
+        stores (int): The number of stores.
+        sizes (tuple): The basket sizes.
+        max_stores (int): The most stores per basket.
+        runs (int): The number of baskets per size.
+        seed (int): Seeds the prices and the baskets.
+
+    Returns:
+        dict: The p50 and p95 latency in milliseconds per basket size, the share of answers
+            known to be optimal, and the worst gap of the heuristic alone to the exact answer.
+    """
+    start = time.perf_counter()
+    generator = SyntheticDataGenerator(seed=seed, counts={"ingredients": ingredients, "stores": stores})
+    _, rows = generator.ingredient_prices()
+    snapshot = PriceSnapshot((row[1], row[2], row[3], row[4], row[5]) for row in rows)
+    print(f"Built a snapshot of {len(snapshot.keys)} prices of {len(snapshot.ingredients)} ingredients "
+          f"at {len(snapshot.stores)} stores in {time.perf_counter() - start:.2f}s")
+
+    optimizer = BasketOptimizer(snapshot, max_stores=max_stores)
+    heuristic = BasketOptimizer(snapshot, max_stores=max_stores, exact_limit=1)
+    rng = random.Random(seed)
+    ingredient_ids = [int(ingredient_id) for ingredient_id in snapshot.ingredients]
+    results = {}
+    for size in sizes:
+        times, optimal, gaps = [], 0, []
+        for _ in range(runs):
+            basket = []
+            for ingredient_id in rng.sample(ingredient_ids, min(size, len(ingredient_ids))):
+                base_unit = snapshot.units.lookup(generator.ingredient(ingredient_id)[2])[0]
+                quantity = rng.randint(1, 4) if base_unit == "unit" else rng.choice((100, 250, 500, 1000))
+                basket.append((ingredient_id, quantity, base_unit))
+            result = optimizer.optimize(basket)
+            times.append(result["seconds"])
+            optimal += result["optimal"]
+            if result["optimal"] and result["total"]:
+                estimate = heuristic.optimize(basket)
+                if len(estimate["missing"]) == len(result["missing"]):
+                    gaps.append(estimate["total"] / result["total"] - 1)
+
+        times.sort()
+        results[size] = {
+            "p50_ms": percentile(times, 50) * 1000,
+            "p95_ms": percentile(times, 95) * 1000,
+            "optimal": optimal / runs,
+            "max_gap": max(gaps, default=0.0)
+        }
+        print(f"{size} items: p50 {results[size]['p50_ms']:.3f} ms, p95 {results[size]['p95_ms']:.3f} ms, "
+              f"{results[size]['optimal']:.0%} proven optimal, worst heuristic gap {results[size]['max_gap']:.2%}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the basket optimizer on synthetic prices.")
+    parser.add_argument("--ingredients", type=int, default=10000, help="The number of ingredients.")
+    parser.add_argument("--stores", type=int, default=500, help="The number of stores.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="The basket sizes.")
+    parser.add_argument("--max-stores", type=int, default=3, help="The most stores per basket.")
+    parser.add_argument("--runs", type=int, default=20, help="The number of baskets per size.")
+    args = parser.parse_args()
+
+    benchmark(args.ingredients, args.stores, tuple(args.sizes), args.max_stores, args.runs)
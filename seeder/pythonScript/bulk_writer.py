@@ -0,0 +1,205 @@
+import os
+import threading
+
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout
+
+try:
+    from .metrics import registry as metrics
+except ImportError:
+    from metrics import registry as metrics
+
+# Errors after which the same batch can succeed when it is sent again. ConnectionFailure
+# covers AutoReconnect, NetworkTimeout and server selection timeouts.
+TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout)
+
+
+class BulkUpdateWriter:
+    """
+    Buffers MongoDB updates and writes them in unordered bulk_write batches.
+
+    A collection's buffer is written when it reaches `batch_size` operations, every
+    `flush_interval` seconds, and when the writer is closed. A batch that fails with a network
+    error or a timeout goes back into the buffers with every batch not written yet, and is
+    written again by the next flush. The updates are idempotent $set operations, so sending a
+    partly applied batch again is safe. Operations the server rejects, such as an update that
+    fails document validation, are reported, counted and dropped, while the other operations
+    of their batch are applied. The writer is thread safe and can be used as a context manager.
+
+    Methods:
+        add(collection_name: str, filter: dict, update: dict, many: bool) -> None:
+            Queues an update for a collection.
+        flush() -> None:
+            Writes every buffered update.
+        requeue(batches: list) -> None:
+            Puts unwritten batches back in front of the updates buffered since.
+        close() -> None:
+            Stops the interval flushes and writes the remaining updates.
+    """
+
+    def __init__(self, mongo_db, batch_size=None, flush_interval=None):
+        """
+        Initializes the BulkUpdateWriter and starts the interval flush thread.
+
+        Args:
+            mongo_db (pymongo.database.Database): The database the updates are written to.
+            batch_size (int): The number of operations per bulk_write. Defaults to
+                BULK_WRITE_BATCH_SIZE, or 500.
+            flush_interval (float): The longest time in seconds an update stays buffered.
+                Defaults to BULK_WRITE_FLUSH_INTERVAL, or 5. 0 disables interval flushes.
+        """
+        self.mongo_db = mongo_db
+        self.batch_size = batch_size or int(os.getenv("BULK_WRITE_BATCH_SIZE", "500"))
+        if flush_interval is None:
+            flush_interval = float(os.getenv("BULK_WRITE_FLUSH_INTERVAL", "5"))
+        self.flush_interval = flush_interval
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+        # The last error of an interval flush, kept for inspection. The thread keeps running.
+        self.error = None
+        self.operations = 0
+        self.failed = 0
+        self.batches = 0
+        self.thread = None
+        if flush_interval:
+            self.thread = threading.Thread(target=self.flush_periodically, daemon=True)
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, collection_name, filter, update, many=False):
+        """
+        Queues an update for a collection.
+
+        Args:
+            collection_name (str): The name of the collection to update.
+            filter (dict): The filter criteria for the documents to update.
+            update (dict): The update operations to apply to the documents.
+            many (bool): Update every matching document instead of the first one.
+
+        When writing a full buffer fails with a transient error, its updates stay buffered for
+        the next flush.
+
+        Raises:
+            Exception: Any other error of writing a full buffer, whose updates are dropped.
+        """
+        operation = UpdateMany(filter, update) if many else UpdateOne(filter, update)
+        with self.lock:
+            buffer = self.buffers.setdefault(collection_name, [])
+            buffer.append(operation)
+            if len(buffer) < self.batch_size:
+                return
+            self.buffers[collection_name] = []
+        try:
+            self.write(collection_name, buffer)
+        except TRANSIENT_ERRORS as e:
+            print(f"Error writing updates to {collection_name}, keeping them for the next flush: {e}")
+            metrics.increment("bulk_writer", "write_retries")
+            self.requeue([(collection_name, buffer)])
+
+    def flush(self):
+        """
+        Writes every buffered update.
+
+        Raises:
+            Exception: The error of the first failed write. After a transient error the failed
+                batch and the batches after it stay buffered. After any other error only the
+                failed batch is dropped.
+        """
+        with self.lock:
+            buffers, self.buffers = self.buffers, {}
+        pending = [(collection_name, operations) for collection_name, operations in buffers.items() if operations]
+        for position, (collection_name, operations) in enumerate(pending):
+            try:
+                self.write(collection_name, operations)
+            except TRANSIENT_ERRORS:
+                self.requeue(pending[position:])
+                raise
+            except Exception:
+                self.requeue(pending[position + 1:])
+                raise
+
+    def requeue(self, batches):
+        """
+        Puts unwritten batches back in front of the updates buffered since.
+
+        Args:
+            batches (list): The (collection_name, operations) pairs that were not written.
+        """
+        with self.lock:
+            for collection_name, operations in batches:
+                self.buffers[collection_name] = operations + self.buffers.get(collection_name, [])
+
+    def write(self, collection_name, operations):
+        """
+        Writes a batch of updates to a collection with a single unordered bulk_write.
+
+        An unordered bulk_write applies every operation the server accepts, so the operations
+        it rejects are reported and dropped without sending the others again.
+
+        Args:
+            collection_name (str): The name of the collection to update.
+            operations (list): The UpdateOne and UpdateMany operations to write.
+
+        Returns:
+            int: The number of operations the server rejected.
+        """
+        with self.write_lock, metrics.timer("bulk_writer", "bulk_write"):
+            try:
+                self.mongo_db[collection_name].bulk_write(operations, ordered=False)
+                errors = []
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+            written = len(operations) - len(errors)
+            metrics.increment("bulk_writer", "operations", written)
+            self.operations += written
+            self.batches += 1
+        if errors:
+            metrics.increment("bulk_writer", "failed_operations", len(errors))
+            self.failed += len(errors)
+            for error in errors[:3]:
+                print(f"Dropped update of {collection_name} matching {error.get('op', {}).get('q')}: "
+                      f"{error.get('errmsg', error.get('code'))}")
+            if len(errors) > 3:
+                print(f"Dropped {len(errors) - 3} more rejected updates of {collection_name}.")
+        return len(errors)
+
+    def flush_periodically(self):
+        """
+        Flushes the buffers every flush_interval seconds until the writer is closed.
+
+        A flush that fails with a transient error leaves its updates buffered for the next one.
+        """
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing buffered updates, retrying in {self.flush_interval:g}s: {e}")
+                metrics.increment("bulk_writer", "flush_errors")
+                self.error = e
+
+    def close(self):
+        """
+        Stops the interval flushes and writes the remaining updates, including those of
+        earlier failed flushes.
+
+        Raises:
+            Exception: The error of the final flush, if the remaining updates could not be
+                written. They stay in the buffers.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        try:
+            self.flush()
+        finally:
+            pending = sum(len(operations) for operations in self.buffers.values())
+            print(f"Wrote {self.operations} updates in {self.batches} bulk writes"
+                  + (f", dropped {self.failed} rejected updates" if self.failed else "")
+                  + (f", {pending} left unwritten." if pending else "."))
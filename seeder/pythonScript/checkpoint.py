@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class CheckpointStore:
+    """
+    Records the progress of a seeding run in a local SQLite ledger so a failed run can be resumed.
+
+    Methods:
+        is_stage_complete(stage: str) -> bool:
+            Checks whether a stage finished in an earlier run.
+        mark_stage_complete(stage: str) -> None:
+            Records that a stage finished.
+        get_progress(stage: str, item: str) -> tuple:
+            Returns the loaded offset of an item and whether it is complete.
+        set_progress(stage: str, item: str, offset: int, complete: bool) -> None:
+            Records the loaded offset of an item.
+        has_progress(stage: str) -> bool:
+            Checks whether any item of a stage has recorded progress.
+        reset() -> None:
+            Discards all recorded progress.
+        close() -> None:
+            Closes the ledger.
+    """
+
+    def __init__(self, path=None):
+        """
+        Initializes the CheckpointStore and creates the ledger tables if they do not exist.
+
+        Args:
+            path (str): The path of the SQLite ledger. Defaults to SEED_CHECKPOINT_PATH,
+                or seed_checkpoint.db.
+        """
+        self.path = path or os.getenv("SEED_CHECKPOINT_PATH", "seed_checkpoint.db")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "stage TEXT PRIMARY KEY, completed_at TEXT NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS progress ("
+                "stage TEXT NOT NULL, item TEXT NOT NULL, offset INTEGER NOT NULL, "
+                "complete INTEGER NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (stage, item))"
+            )
+
+    def is_stage_complete(self, stage):
+        """
+        Checks whether a stage finished in an earlier run.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            bool: True if the stage is recorded as complete.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM stages WHERE stage = ?", (stage,)).fetchone()
+        return row is not None
+
+    def mark_stage_complete(self, stage):
+        """
+        Records that a stage finished.
+
+        Args:
+            stage (str): The name of the stage.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO stages (stage, completed_at) VALUES (?, ?)",
+                (stage, datetime.now().isoformat())
+            )
+
+    def get_progress(self, stage, item):
+        """
+        Returns the loaded offset of an item and whether it is complete.
+
+        Args:
+            stage (str): The name of the stage.
+            item (str): The item within the stage, such as a table or file name.
+
+        Returns:
+            tuple: The number of rows or documents already loaded and a completion flag.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT offset, complete FROM progress WHERE stage = ? AND item = ?",
+                (stage, item)
+            ).fetchone()
+        if row is None:
+            return 0, False
+        return row[0], bool(row[1])
+
+    def set_progress(self, stage, item, offset, complete=False):
+        """
+        Records the loaded offset of an item.
+
+        Args:
+            stage (str): The name of the stage.
+            item (str): The item within the stage, such as a table or file name.
+            offset (int): The number of rows or documents loaded so far.
+            complete (bool): Whether the item is fully loaded.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO progress (stage, item, offset, complete, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stage, item, offset, int(complete), datetime.now().isoformat())
+            )
+
+    def has_progress(self, stage):
+        """
+        Checks whether any item of a stage has recorded progress.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            bool: True if at least one item of the stage has been started.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM progress WHERE stage = ? LIMIT 1", (stage,)).fetchone()
+        return row is not None
+
+    def reset(self):
+        """
+        Discards all recorded progress.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM stages")
+            self.connection.execute("DELETE FROM progress")
+
+    def close(self):
+        """
+        Closes the ledger.
+        """
+        self.connection.close()
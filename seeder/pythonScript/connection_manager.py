@@ -0,0 +1,141 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+from pymongo import MongoClient
+
+
+class ConnectionManager:
+    """
+    Holds the PostgreSQL connection pool and the MongoDB client shared by all seeding stages.
+
+    Both are created on first use, so the environment is loaded and every handshake is made
+    once per run instead of once per stage.
+
+    Methods:
+        postgres_pool() -> ThreadedConnectionPool:
+            Returns the PostgreSQL connection pool, creating it on first use.
+        getconn() -> psycopg2.extensions.connection:
+            Takes an autocommit connection from the pool.
+        putconn(connection) -> None:
+            Returns a connection to the pool.
+        mongo_client() -> MongoClient:
+            Returns the MongoDB client, creating it on first use.
+        mongo_db() -> pymongo.database.Database:
+            Returns the MongoDB database named by MONGO_DB.
+        close() -> None:
+            Closes all pooled connections and the MongoDB client.
+    """
+
+    def __init__(self, min_connections=None, max_connections=None, mongo_pool_size=None):
+        """
+        Initializes the ConnectionManager and loads the environment.
+
+        Args:
+            min_connections (int): The number of PostgreSQL connections opened up front and
+                kept open when returned. Connections beyond it are closed on return. Defaults
+                to POSTGRES_POOL_MIN, or 4.
+            max_connections (int): The maximum number of PostgreSQL connections. It must cover
+                SQL_LOAD_WORKERS plus the connections the stages hold. Defaults to
+                POSTGRES_POOL_MAX, or 10.
+            mongo_pool_size (int): The maximum number of connections of the MongoDB client.
+                Defaults to MONGO_MAX_POOL_SIZE, or 50.
+        """
+        load_dotenv(override=True)
+        self.min_connections = min_connections or int(os.getenv("POSTGRES_POOL_MIN", "4"))
+        self.max_connections = max_connections or int(os.getenv("POSTGRES_POOL_MAX", "10"))
+        self.mongo_pool_size = mongo_pool_size or int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+        self.pool = None
+        self.client = None
+        self.lock = threading.Lock()
+
+    def postgres_pool(self):
+        """
+        Returns the PostgreSQL connection pool, creating it on first use.
+
+        Returns:
+            ThreadedConnectionPool: A pool of connections to the database named by POSTGRES_DB.
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    self.min_connections, self.max_connections,
+                    dbname=os.getenv("POSTGRES_DB", "smart_kitchen_helper"),
+                    user=os.getenv("POSTGRES_USERNAME"),
+                    password=os.getenv("POSTGRES_PASSWORD"),
+                    host=os.getenv("POSTGRES_HOST"),
+                    port=os.getenv("POSTGRES_PORT")
+                )
+                print(f"Opened PostgreSQL connection pool with up to {self.max_connections} connections.")
+            return self.pool
+
+    def getconn(self):
+        """
+        Takes an autocommit connection from the pool.
+
+        Returns:
+            connection (psycopg2.extensions.connection): A pooled connection. Give it back with putconn().
+        """
+        connection = self.postgres_pool().getconn()
+        connection.autocommit = True
+        return connection
+
+    def putconn(self, connection):
+        """
+        Returns a connection to the pool.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection taken with getconn().
+        """
+        self.postgres_pool().putconn(connection)
+
+    def mongo_client(self):
+        """
+        Returns the MongoDB client, creating it on first use.
+
+        Returns:
+            MongoClient: A client with a connection pool sized by MONGO_MAX_POOL_SIZE.
+        """
+        with self.lock:
+            if self.client is None:
+                mongo_uri = os.getenv("MONGO_URI_TEMPLATE").format(
+                    username=os.getenv("MONGO_USERNAME"),
+                    password=os.getenv("MONGO_PASSWORD"),
+                    host=os.getenv("MONGO_HOST"),
+                    dbname=os.getenv("MONGO_DB")
+                )
+                self.client = MongoClient(
+                    mongo_uri,
+                    maxPoolSize=self.mongo_pool_size,
+                    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+                )
+                print("Connected to MongoDB.")
+            return self.client
+
+    def mongo_db(self):
+        """
+        Returns the MongoDB database named by MONGO_DB.
+
+        Returns:
+            Database: The MongoDB database.
+        """
+        return self.mongo_client()[os.getenv("MONGO_DB")]
+
+    def close(self):
+        """
+        Closes all pooled connections and the MongoDB client.
+        """
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
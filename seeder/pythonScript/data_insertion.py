@@ -1,28 +1,167 @@
 import psycopg2
-import json
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 import os
 import csv
+import io
+import time
+from itertools import chain, islice
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from bson import json_util
 from dotenv import load_dotenv
 
+try:
+    from .json_stream import iter_json_documents
+    from .metrics import registry as metrics
+    from .table_scheduler import TableLoadScheduler
+    from .unit_registry import UnitRegistry
+except ImportError:
+    from json_stream import iter_json_documents
+    from metrics import registry as metrics
+    from table_scheduler import TableLoadScheduler
+    from unit_registry import UnitRegistry
+
+
+class CsvRowStream:
+    """
+    A read-only text file that serves rows as CSV, so generated rows can be fed to COPY FROM STDIN.
+
+    None values are written as NULL, matching the NULL marker of the COPY statements.
+
+    Methods:
+        read(size: int) -> str:
+            Returns up to `size` characters of CSV text.
+    """
+
+    def __init__(self, rows, batch_size=500):
+        """
+        Initializes the CsvRowStream.
+
+        Args:
+            rows (iterable): The rows, each a list of values, including the header row.
+            batch_size (int): The number of rows formatted at a time.
+        """
+        self.rows = iter(rows)
+        self.batch_size = batch_size
+        self.buffer = ""
+        self.output = io.StringIO()
+        self.writer = csv.writer(self.output)
+
+    def read(self, size=-1):
+        """
+        Returns up to `size` characters of CSV text.
+
+        Args:
+            size (int): The maximum number of characters. Everything left when negative.
+
+        Returns:
+            str: The text, empty at the end of the rows.
+        """
+        while size < 0 or len(self.buffer) < size:
+            rows = list(islice(self.rows, self.batch_size))
+            if not rows:
+                break
+            self.writer.writerows(["NULL" if value is None else value for value in row] for row in rows)
+            self.buffer += self.output.getvalue()
+            self.output.seek(0)
+            self.output.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        text, self.buffer = self.buffer[:size], self.buffer[size:]
+        return text
+
 class DataInsertion:
     """
     Manages data insertion into PostgreSQL and MongoDB databases.
     
     Methods:
-        insert_sql_data() -> None:
+        insert_sql_data(bulk: bool, workers: int) -> None:
             Inserts data into PostgreSQL from CSV files.
-        insert_mongo_data() -> None:
+        create_connection_pool(size: int) -> ThreadedConnectionPool:
+            Creates a pool of PostgreSQL connections for loading tables concurrently.
+        close() -> None:
+            Releases the PostgreSQL connection.
+        load_table(table: str, filename: str, bulk: bool, connection) -> int:
+            Loads a single CSV file into its table and reports the load rate.
+        validate_csv_file(table: str, file_path: str) -> tuple:
+            Checks a CSV file against the columns of its target table.
+        copy_csv_file(table: str, file_path: str, headers: list) -> None:
+            Streams a CSV file into a table with COPY FROM STDIN in one transaction.
+        insert_csv_rows(table: str, file_path: str, connection, skip: int) -> int:
+            Inserts a CSV file into a table one row at a time.
+        row_canonicalizer(table: str, headers: list) -> tuple:
+            Returns the columns to load and a function adding the base unit columns to a row.
+        canonicalize_document(collection_name: str, document: dict) -> dict:
+            Adds the base unit fields to a document.
+        insert_mongo_data(chunk_size: int, report_path: str) -> None:
             Inserts data into MongoDB from JSON files.
+        load_collection(collection_name: str, filename: str, chunk_size: int, report) -> int:
+            Streams a JSON file into a collection in unordered chunks.
+        insert_chunk(collection, documents: list, offset: int, filename: str, report) -> tuple:
+            Inserts a chunk of documents with ordered=False and reports every rejected document.
     """
 
-    def __init__(self):
+    csv_directory = '../csv'
+    table_files = {
+        "users": "Users.csv",
+        "households": "Households.csv",
+        "household_users": "Household_Users.csv",
+        "ingredient_categories": "Ingredient_Categories.csv",
+        "ingredients": "Ingredients.csv",
+        "stores": "Stores.csv",
+        "ingredient_prices": "Ingredient_Prices.csv",
+        "household_ingredients": "Household_Ingredients.csv",
+        "recipes": "Recipes.csv",
+        "recipe_ingredients": "Recipe_Ingredients.csv",
+        "user_recipe_history": "User_Recipe_History.csv",
+        "user_ratings": "User_Ratings.csv"
+    }
+    checkpoint_interval = 1000
+    # Tables whose amounts are also stored in canonical base units at load time: the amount
+    # column, the unit column, the column receiving the converted amount, and whether the
+    # amount is a price per unit, which is divided by the unit factor instead of multiplied.
+    unit_columns = {
+        "household_ingredients": ("quantity", "unit", "base_quantity", False),
+        "recipe_ingredients": ("quantity", "unit", "base_quantity", False),
+        "ingredient_prices": ("price", "unit", "base_unit_price", True)
+    }
+    json_directory = '../json'
+    collection_files = {
+        "recipes_mongo": "recipes.json",
+        "ingredients_mongo": "ingredients.json",
+        "household_ingredient_usage": "household_ingredient_usage.json",
+        "recipe_ratings": "recipe_ratings.json",
+        "user_preferences": "user_preferences.json"
+    }
+    unit_fields = {
+        "ingredients_mongo": ("value", "unit", "base_value")
+    }
+
+    def __init__(self, checkpoint=None, connections=None):
         """
         Initializes the DataInsertion class by loading environment variables and establishing database connections.
+
+        Args:
+            checkpoint (CheckpointStore): Records the rows and documents loaded so far, so an
+                interrupted load resumes where it stopped. Progress is not recorded when None.
+            connections (ConnectionManager): Provides pooled PostgreSQL connections and the shared
+                MongoDB client. The class opens its own connections when None.
         """
         load_dotenv(override=True)
-        self.sql_connection = self.connect_postgresql()
-        self.mongo_client = self.connect_mongodb()
+        # SEED_CSV_DIRECTORY and SEED_JSON_DIRECTORY point the loader at other files, such as
+        # the output of synthetic_data.py.
+        self.csv_directory = os.getenv("SEED_CSV_DIRECTORY", self.csv_directory)
+        self.json_directory = os.getenv("SEED_JSON_DIRECTORY", self.json_directory)
+        self.checkpoint = checkpoint
+        self.connections = connections
+        self.units = UnitRegistry()
+        if connections is not None:
+            self.sql_connection = connections.getconn()
+            self.mongo_client = connections.mongo_client()
+        else:
+            self.sql_connection = self.connect_postgresql()
+            self.mongo_client = self.connect_mongodb()
         self.mongo_db = self.mongo_client[os.getenv("MONGO_DB")]
 
     def connect_postgresql(self):
@@ -68,72 +207,420 @@ class DataInsertion:
             print(f"Error connecting to MongoDB: {e}")
             raise
 
-    def insert_sql_data(self):
+    def insert_sql_data(self, bulk=False, workers=None):
         """
         Inserts data into PostgreSQL from CSV files located in the ../csv directory.
+
+        Args:
+            bulk (bool): Stream each file through COPY FROM STDIN instead of inserting row by row.
+                Files that fail validation are still inserted row by row.
+            workers (int): The number of tables loaded concurrently. Defaults to SQL_LOAD_WORKERS,
+                or 1, which loads the tables one after another in table_files order.
+        """
+        if workers is None:
+            workers = int(os.getenv("SQL_LOAD_WORKERS", "1"))
+
+        if workers > 1:
+            if self.connections is not None:
+                TableLoadScheduler(self, self.connections.postgres_pool(), workers).run(bulk)
+                return
+            pool = self.create_connection_pool(workers)
+            try:
+                TableLoadScheduler(self, pool, workers).run(bulk)
+            finally:
+                pool.closeall()
+            return
+
+        for table, filename in self.table_files.items():
+            self.load_table(table, filename, bulk)
+
+    def create_connection_pool(self, size):
+        """
+        Creates a pool of PostgreSQL connections for loading tables concurrently.
+
+        Args:
+            size (int): The maximum number of connections in the pool.
+
+        Returns:
+            ThreadedConnectionPool: A pool of autocommit connections to the PostgreSQL database.
+        """
+        return ThreadedConnectionPool(
+            1, size,
+            dbname=os.getenv("POSTGRES_DB"),
+            user=os.getenv("POSTGRES_USERNAME"),
+            password=os.getenv("POSTGRES_PASSWORD"),
+            host=os.getenv("POSTGRES_HOST"),
+            port=os.getenv("POSTGRES_PORT")
+        )
+
+    def close(self):
+        """
+        Releases the PostgreSQL connection, returning it to the shared pool when there is one.
+        """
+        if self.connections is not None:
+            self.connections.putconn(self.sql_connection)
+        else:
+            self.sql_connection.close()
+            self.mongo_client.close()
+
+    def load_table(self, table, filename, bulk=False, connection=None):
+        """
+        Loads a single CSV file into its table and reports the load rate.
+
+        Args:
+            table (str): The name of the target table.
+            filename (str): The name of the CSV file in the ../csv directory.
+            bulk (bool): Use COPY FROM STDIN when the file passes validation.
+            connection (psycopg2.extensions.connection): The connection to load through.
+                Defaults to the instance's own connection.
+
+        Returns:
+            int: The number of rows loaded.
+        """
+        file_path = os.path.join(self.csv_directory, filename)
+        if not os.path.exists(file_path):
+            print(f"File not found: {file_path}")
+            return 0
+
+        loaded, complete = self.checkpoint.get_progress("sql", table) if self.checkpoint else (0, False)
+        if complete:
+            print(f"Skipping {table}, {loaded} rows were loaded by an earlier run.")
+            return 0
+
+        connection = connection or self.sql_connection
+        start = time.perf_counter()
+        method = "INSERT"
+        if bulk and not loaded:
+            headers, rows, error = self.validate_csv_file(table, file_path, connection)
+            if error is None:
+                self.copy_csv_file(table, file_path, headers, connection)
+                method = "COPY"
+            else:
+                print(f"Validation failed for {filename}: {error}. Falling back to row inserts.")
+                rows = self.insert_csv_rows(table, file_path, connection)
+        else:
+            if loaded:
+                print(f"Resuming {table} after row {loaded}.")
+            rows = self.insert_csv_rows(table, file_path, connection, skip=loaded)
+
+        if self.checkpoint:
+            self.checkpoint.set_progress("sql", table, loaded + rows, complete=True)
+
+        elapsed = time.perf_counter() - start
+        metrics.increment("sql_data_insertion", "rows_loaded", rows)
+        metrics.increment("sql_data_insertion", "bytes_read", os.path.getsize(file_path))
+        metrics.observe("sql_data_insertion", f"{method.lower()}_table", elapsed)
+        rate = rows / elapsed if elapsed > 0 else float(rows)
+        print(f"Inserted {rows} rows into {table} from {filename} via {method} "
+              f"in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+        return rows
+
+    def validate_csv_file(self, table, file_path, connection=None):
+        """
+        Checks a CSV file against the columns of its target table.
+
+        The header must only name columns that exist in the table and every row must have
+        as many fields as the header.
+
+        Args:
+            table (str): The name of the target table.
+            file_path (str): The path of the CSV file.
+            connection (psycopg2.extensions.connection): The connection used to read the table columns.
+
+        Returns:
+            tuple: The header columns, the number of data rows and an error message,
+                which is None when the file is valid.
         """
-        csv_directory = '../csv'
-        table_files = {
-            "users": "Users.csv",
-            "households": "Households.csv",
-            "household_users": "Household_Users.csv",
-            "ingredient_categories": "Ingredient_Categories.csv",
-            "ingredients": "Ingredients.csv",
-            "stores": "Stores.csv",
-            "ingredient_prices": "Ingredient_Prices.csv",
-            "household_ingredients": "Household_Ingredients.csv",
-            "recipes": "Recipes.csv",
-            "recipe_ingredients": "Recipe_Ingredients.csv",
-            "user_recipe_history": "User_Recipe_History.csv",
-            "user_ratings": "User_Ratings.csv"
-        }
-
-        for table, filename in table_files.items():
-            file_path = os.path.join(csv_directory, filename)
-            if not os.path.exists(file_path):
-                print(f"File not found: {file_path}")
-                continue
-
-            with open(file_path, 'r') as file:
-                reader = csv.reader(file)
-                headers = next(reader)  # Skip the header row
-                placeholders = ', '.join(['%s'] * len(headers))
-                query = f"INSERT INTO {table} ({', '.join(headers)}) VALUES ({placeholders})"
-
-                with self.sql_connection.cursor() as cursor:
-                    for row in reader:
-                        cursor.execute(query, row)
-                    print(f"Inserted data into {table} from {filename}")
-
-    def insert_mongo_data(self):
+        connection = connection or self.sql_connection
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s",
+                (table,)
+            )
+            table_columns = {row[0] for row in cursor.fetchall()}
+
+        with open(file_path, 'r', newline='') as file:
+            reader = csv.reader(file)
+            headers = next(reader, None)
+            if not headers:
+                return headers, 0, "missing header row"
+
+            unknown = [column for column in headers if column not in table_columns]
+            if unknown:
+                return headers, 0, f"unknown columns {', '.join(unknown)}"
+
+            rows = 0
+            for row in reader:
+                if len(row) != len(headers):
+                    return headers, rows, f"line {reader.line_num} has {len(row)} fields, expected {len(headers)}"
+                rows += 1
+
+        return headers, rows, None
+
+    def copy_csv_file(self, table, file_path, headers, connection=None):
+        """
+        Streams a CSV file into a table with COPY FROM STDIN in one transaction.
+
+        Rows of tables in unit_columns are extended with their base unit columns on the way.
+
+        Args:
+            table (str): The name of the target table.
+            file_path (str): The path of the CSV file.
+            headers (list): The columns named in the CSV header row.
+            connection (psycopg2.extensions.connection): The connection to copy through.
+        """
+        connection = connection or self.sql_connection
+        columns, canonicalize = self.row_canonicalizer(table, headers)
+        query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true, NULL 'NULL')").format(
+            sql.Identifier(table),
+            sql.SQL(', ').join(map(sql.Identifier, columns))
+        )
+
+        connection.autocommit = False
+        try:
+            with open(file_path, 'r', newline='') as file, connection.cursor() as cursor:
+                source = file
+                if canonicalize is not None:
+                    reader = csv.reader(file)
+                    next(reader)
+                    source = CsvRowStream(chain([columns], map(canonicalize, reader)))
+                cursor.copy_expert(query, source)
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            print(f"Error copying {file_path} into {table}: {e}")
+            raise
+        finally:
+            connection.autocommit = True
+
+    def insert_csv_rows(self, table, file_path, connection=None, skip=0):
+        """
+        Inserts a CSV file into a table one row at a time.
+
+        Fields holding the NULL marker are inserted as NULL, as the COPY path loads them.
+        With a checkpoint store, rows are committed in batches of checkpoint_interval and the
+        offset is recorded after every batch.
+
+        Args:
+            table (str): The name of the target table.
+            file_path (str): The path of the CSV file.
+            connection (psycopg2.extensions.connection): The connection to insert through.
+            skip (int): The number of leading data rows loaded by an earlier run.
+
+        Returns:
+            int: The number of rows inserted.
+        """
+        connection = connection or self.sql_connection
+        rows = 0
+        with open(file_path, 'r') as file:
+            reader = csv.reader(file)
+            headers = next(reader)  # Skip the header row
+            columns, canonicalize = self.row_canonicalizer(table, headers)
+            placeholders = ', '.join(['%s'] * len(columns))
+            query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+            connection.autocommit = self.checkpoint is None
+            try:
+                with connection.cursor() as cursor:
+                    for number, row in enumerate(reader, start=1):
+                        if number <= skip:
+                            continue
+                        values = canonicalize(row) if canonicalize else [None if value == "NULL" else value for value in row]
+                        cursor.execute(query, values)
+                        rows += 1
+                        if self.checkpoint and rows % self.checkpoint_interval == 0:
+                            connection.commit()
+                            self.checkpoint.set_progress("sql", table, skip + rows)
+                if self.checkpoint:
+                    connection.commit()
+            except Exception:
+                if self.checkpoint:
+                    connection.rollback()
+                raise
+            finally:
+                connection.autocommit = True
+        return rows
+
+    def row_canonicalizer(self, table, headers):
+        """
+        Returns the columns to load and a function adding the base unit columns to a row.
+
+        Files that already carry the base unit columns, or tables without unit_columns,
+        are loaded as they are.
+
+        Args:
+            table (str): The name of the target table.
+            headers (list): The columns named in the CSV header row.
+
+        Returns:
+            tuple: The columns to load, and a function mapping a CSV row to the values to load,
+                with the NULL marker as None, which is None when the rows are loaded unchanged.
+        """
+        spec = self.unit_columns.get(table)
+        if spec is None:
+            return headers, None
+        amount_column, unit_column, base_column, per_unit = spec
+        if amount_column not in headers or unit_column not in headers or base_column in headers:
+            return headers, None
+
+        amount_index = headers.index(amount_column)
+        unit_index = headers.index(unit_column)
+        lookup = self.units.lookup
+
+        def canonicalize(row):
+            base_unit, factor = lookup(row[unit_index])
+            values = [None if value == "NULL" else value for value in row]
+            amount = values[amount_index]
+            if amount in ("", None):
+                return values + [None, base_unit]
+            return values + [float(amount) / factor if per_unit else float(amount) * factor, base_unit]
+
+        return headers + [base_column, "base_unit"], canonicalize
+
+    def canonicalize_document(self, collection_name, document):
+        """
+        Adds the base unit fields to a document of a collection listed in unit_fields.
+
+        Args:
+            collection_name (str): The name of the target collection.
+            document (dict): The document, changed in place.
+
+        Returns:
+            dict: The document.
+        """
+        amount_field, unit_field, base_field = self.unit_fields[collection_name]
+        if isinstance(document.get(amount_field), (int, float)) and document.get(unit_field) is not None:
+            document[base_field], document["base_unit"] = self.units.to_base(
+                document[amount_field], document[unit_field])
+        return document
+
+    def insert_mongo_data(self, chunk_size=None, report_path=None):
         """
         Inserts data into MongoDB from JSON files located in the ../json directory.
+
+        Each file is parsed incrementally and written in unordered chunks, so documents rejected
+        by the collection validators are recorded in the report file instead of aborting the load.
+
+        Args:
+            chunk_size (int): The number of documents per insert_many call. Defaults to
+                MONGO_LOAD_CHUNK_SIZE, or 1000.
+            report_path (str): The JSON lines file that receives one entry per rejected document.
+                Defaults to MONGO_LOAD_REPORT, or mongo_load_report.jsonl.
         """
-        json_directory = '../json'
-        collection_files = {
-            "recipes_mongo": "recipes.json",
-            "ingredients_mongo": "ingredients.json",
-            "household_ingredient_usage": "household_ingredient_usage.json",
-            "recipe_ratings": "recipe_ratings.json",
-            "user_preferences": "user_preferences.json"
-        }
-
-        for collection_name, filename in collection_files.items():
-            file_path = os.path.join(json_directory, filename)
-            if not os.path.exists(file_path):
-                print(f"File not found: {file_path}")
-                continue
-
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                collection = self.mongo_db[collection_name]
-                if isinstance(data, list):
-                    collection.insert_many(data)
-                else:
-                    collection.insert_one(data)
-                print(f"Inserted data into {collection_name} from {filename}")
+        chunk_size = chunk_size or int(os.getenv("MONGO_LOAD_CHUNK_SIZE", "1000"))
+        report_path = report_path or os.getenv("MONGO_LOAD_REPORT", "mongo_load_report.jsonl")
+        resuming = self.checkpoint is not None and self.checkpoint.has_progress("mongo")
+
+        failed = 0
+        with open(report_path, 'a' if resuming else 'w') as report:
+            for collection_name, filename in self.collection_files.items():
+                failed += self.load_collection(collection_name, filename, chunk_size, report)
+
+        if failed:
+            print(f"{failed} documents were rejected. See {report_path} for details.")
+
+    def load_collection(self, collection_name, filename, chunk_size, report):
+        """
+        Streams a JSON file into a collection in unordered chunks.
+
+        Args:
+            collection_name (str): The name of the target collection.
+            filename (str): The name of the JSON file in the ../json directory.
+            chunk_size (int): The number of documents per insert_many call.
+            report (file object): Receives one JSON line per rejected document.
+
+        Returns:
+            int: The number of rejected documents.
+        """
+        file_path = os.path.join(self.json_directory, filename)
+        if not os.path.exists(file_path):
+            print(f"File not found: {file_path}")
+            return 0
+
+        loaded, complete = self.checkpoint.get_progress("mongo", collection_name) if self.checkpoint else (0, False)
+        if complete:
+            print(f"Skipping {collection_name}, {loaded} documents were loaded by an earlier run.")
+            return 0
+        if loaded:
+            print(f"Resuming {collection_name} after document {loaded}.")
+
+        collection = self.mongo_db[collection_name]
+        canonicalize = collection_name in self.unit_fields
+        inserted = 0
+        failed = 0
+        offset = loaded
+        chunk = []
+        start = time.perf_counter()
+
+        with open(file_path, 'r') as file:
+            documents = iter_json_documents(file, object_hook=json_util.object_hook)
+            for number, document in enumerate(documents):
+                if number < loaded:
+                    continue
+                if canonicalize:
+                    document = self.canonicalize_document(collection_name, document)
+                chunk.append(document)
+                if len(chunk) >= chunk_size:
+                    chunk_inserted, chunk_failed = self.insert_chunk(collection, chunk, offset, filename, report)
+                    inserted += chunk_inserted
+                    failed += chunk_failed
+                    offset += len(chunk)
+                    chunk = []
+                    if self.checkpoint:
+                        self.checkpoint.set_progress("mongo", collection_name, offset)
+            if chunk:
+                chunk_inserted, chunk_failed = self.insert_chunk(collection, chunk, offset, filename, report)
+                inserted += chunk_inserted
+                failed += chunk_failed
+                offset += len(chunk)
+
+        if self.checkpoint:
+            self.checkpoint.set_progress("mongo", collection_name, offset, complete=True)
+
+        elapsed = time.perf_counter() - start
+        metrics.increment("mongo_data_insertion", "documents_loaded", inserted)
+        metrics.increment("mongo_data_insertion", "documents_rejected", failed)
+        metrics.increment("mongo_data_insertion", "bytes_read", os.path.getsize(file_path))
+        metrics.observe("mongo_data_insertion", "load_collection", elapsed)
+        print(f"Inserted {inserted} documents into {collection_name} from {filename} "
+              f"in {elapsed:.2f}s ({failed} rejected)")
+        return failed
+
+    def insert_chunk(self, collection, documents, offset, filename, report):
+        """
+        Inserts a chunk of documents with ordered=False and reports every rejected document.
+
+        Args:
+            collection (pymongo.collection.Collection): The target collection.
+            documents (list): The documents to insert.
+            offset (int): The position of the first document of the chunk in its file.
+            filename (str): The name of the source file, recorded in the report.
+            report (file object): Receives one JSON line per rejected document.
+
+        Returns:
+            tuple: The number of inserted and rejected documents.
+        """
+        try:
+            with metrics.timer("mongo_data_insertion", "insert_many"):
+                result = collection.insert_many(documents, ordered=False)
+            return len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            for error in errors:
+                document = documents[error["index"]]
+                report.write(json_util.dumps({
+                    "collection": collection.name,
+                    "file": filename,
+                    "document_index": offset + error["index"],
+                    "_id": document.get("_id"),
+                    "code": error.get("code"),
+                    "errmsg": error.get("errmsg"),
+                    "errInfo": error.get("errInfo")
+                }) + "\n")
+            return e.details.get("nInserted", 0), len(errors)
 
 if __name__ == "__main__":
     data_inserter = DataInsertion()
-    data_inserter.insert_sql_data()
+    data_inserter.insert_sql_data(bulk=True)
     data_inserter.insert_mongo_data()
@@ -0,0 +1,297 @@
+import argparse
+import heapq
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+import psycopg2
+from dotenv import load_dotenv
+
+try:
+    from .metrics import registry as metrics
+except ImportError:
+    from metrics import registry as metrics
+
+# Both queries only read idx_household_ingredients_unexpired, a partial index holding the
+# stock that is not flagged yet, so their cost follows the rows they return rather than the
+# size of the table. Stock expires once its expiration date has passed, as in PantryMatcher.
+SWEEP_QUERY = """
+    UPDATE household_ingredients SET is_expired = TRUE
+    WHERE NOT is_expired AND expiration_date < %s
+"""
+
+CALENDAR_QUERY = """
+    SELECT expiration_date, household_id, COUNT(*)
+    FROM household_ingredients
+    WHERE NOT is_expired AND expiration_date >= %s AND expiration_date < %s
+    GROUP BY expiration_date, household_id
+"""
+
+STATE_QUERY = "SELECT swept_through FROM expiry_sweeps WHERE sweeper = %s"
+
+SAVE_STATE_QUERY = """
+    INSERT INTO expiry_sweeps (sweeper, swept_through, rows_expired) VALUES (%s, %s, %s)
+    ON CONFLICT (sweeper) DO UPDATE SET swept_through = EXCLUDED.swept_through,
+        rows_expired = expiry_sweeps.rows_expired + EXCLUDED.rows_expired, updated_at = CURRENT_TIMESTAMP
+"""
+
+
+class ExpirySweeper:
+    """
+    Keeps household_ingredients.is_expired up to date without scanning the table.
+
+    A sweep flags the stock whose expiration date passed since the previous sweep, read from a
+    partial index of the unexpired stock, and stores the day it swept through in the
+    expiry_sweeps table so a second sweep on the same day does nothing. Upcoming expiries are
+    kept in a calendar of daily buckets, each counting the expiring items per household, with
+    a min-heap of the bucket days. The calendar tells when the next sweep has work to do, and
+    answers how many items of each household expire soon without another query.
+
+    Methods:
+        swept_through() -> date:
+            Returns the day the last sweep covered.
+        sweep(today: date, force: bool) -> int:
+            Flags the stock that expired since the last sweep.
+        load_calendar(today: date, days: int) -> int:
+            Buckets the upcoming expiries by day and household.
+        next_expiry() -> date:
+            Returns the first day in the calendar on which stock expires.
+        expiring_soon(days: int, today: date) -> dict:
+            Counts the items of each household that expire within a number of days.
+        write_report(path: str, days: int, today: date) -> int:
+            Writes the households with items expiring soon, for notifications.
+        run(interval: float, iterations: int) -> None:
+            Sweeps whenever stock expires, and at least once per interval.
+    """
+
+    def __init__(self, connection, name="household_ingredients", horizon_days=None, soon_days=None):
+        """
+        Initializes the ExpirySweeper.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+            name (str): The key of the sweeper's state in the expiry_sweeps table.
+            horizon_days (int): How many days ahead the calendar holds. Defaults to
+                EXPIRY_HORIZON_DAYS, or 14.
+            soon_days (int): How many days ahead an item counts as expiring soon. Defaults to
+                EXPIRY_SOON_DAYS, or 3.
+        """
+        self.connection = connection
+        self.name = name
+        self.horizon_days = horizon_days or int(os.getenv("EXPIRY_HORIZON_DAYS", "14"))
+        self.soon_days = soon_days or int(os.getenv("EXPIRY_SOON_DAYS", "3"))
+        self.buckets = {}
+        self.heap = []
+        self.calendar_start = None
+        self.calendar_end = None
+
+    def swept_through(self):
+        """
+        Returns the day the last sweep covered.
+
+        Returns:
+            date: The day, or None if the table was never swept.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(STATE_QUERY, (self.name,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def sweep(self, today=None, force=False):
+        """
+        Flags the stock that expired since the last sweep.
+
+        The update and the new state are committed together. The buckets of the days that
+        passed are dropped from the calendar.
+
+        Args:
+            today (date): The current day. Defaults to today.
+            force (bool): Sweep even when today was already swept, to flag stock that was
+                added with a past expiration date since.
+
+        Returns:
+            int: The number of items flagged as expired.
+        """
+        today = today or date.today()
+        last = self.swept_through()
+        if last is not None and last >= today and not force:
+            print(f"Expiries are already swept through {last}.")
+            return 0
+
+        start = time.perf_counter()
+        autocommit = self.connection.autocommit
+        self.connection.autocommit = False
+        try:
+            with metrics.timer("expiry_sweeper", "sweep"), self.connection, self.connection.cursor() as cursor:
+                cursor.execute(SWEEP_QUERY, (today,))
+                expired = cursor.rowcount
+                cursor.execute(SAVE_STATE_QUERY, (self.name, today, expired))
+        except Exception as e:
+            print(f"Error sweeping expired stock: {e}")
+            raise
+        finally:
+            self.connection.autocommit = autocommit
+
+        while self.heap and self.heap[0] < today:
+            self.buckets.pop(heapq.heappop(self.heap), None)
+        if self.calendar_start is not None:
+            self.calendar_start = max(self.calendar_start, today)
+
+        metrics.increment("expiry_sweeper", "rows_expired", expired)
+        print(f"Flagged {expired} expired items since {last or 'the first sweep'} "
+              f"in {time.perf_counter() - start:.2f}s")
+        return expired
+
+    def load_calendar(self, today=None, days=None):
+        """
+        Buckets the upcoming expiries by day and household.
+
+        Args:
+            today (date): The first day of the calendar. Defaults to today.
+            days (int): How many days the calendar holds. Defaults to the horizon.
+
+        Returns:
+            int: The number of items expiring within the calendar.
+        """
+        today = today or date.today()
+        end = today + timedelta(days=days or self.horizon_days)
+        with self.connection.cursor() as cursor:
+            cursor.execute(CALENDAR_QUERY, (today, end))
+            rows = cursor.fetchall()
+
+        self.buckets = {}
+        for expiration_date, household_id, count in rows:
+            self.buckets.setdefault(expiration_date, {})[household_id] = count
+        self.heap = list(self.buckets)
+        heapq.heapify(self.heap)
+        self.calendar_start = today
+        self.calendar_end = end
+        return sum(sum(bucket.values()) for bucket in self.buckets.values())
+
+    def next_expiry(self):
+        """
+        Returns the first day in the calendar on which stock expires.
+
+        Returns:
+            date: The day, or None if nothing expires within the calendar.
+        """
+        return self.heap[0] if self.heap else None
+
+    def expiring_soon(self, days=None, today=None):
+        """
+        Counts the items of each household that expire within a number of days.
+
+        The calendar is loaded first when it does not cover the requested days.
+
+        Args:
+            days (int): The number of days, including today. Defaults to soon_days.
+            today (date): The current day. Defaults to today.
+
+        Returns:
+            dict: Maps each household id to its number of expiring items.
+        """
+        today = today or date.today()
+        end = today + timedelta(days=days or self.soon_days)
+        if self.calendar_start is None or today < self.calendar_start or end > self.calendar_end:
+            self.load_calendar(today, max(days or self.soon_days, self.horizon_days))
+
+        counts = {}
+        for day in sorted(self.buckets):
+            if day < today:
+                continue
+            if day >= end:
+                break
+            for household_id, count in self.buckets[day].items():
+                counts[household_id] = counts.get(household_id, 0) + count
+        return counts
+
+    def write_report(self, path=None, days=None, today=None):
+        """
+        Writes the households with items expiring soon, for notifications.
+
+        Args:
+            path (str): The output file. Defaults to EXPIRY_REPORT_PATH, or expiring_soon.json.
+            days (int): The number of days, including today. Defaults to soon_days.
+            today (date): The current day. Defaults to today.
+
+        Returns:
+            int: The number of households in the report.
+        """
+        path = path or os.getenv("EXPIRY_REPORT_PATH", "expiring_soon.json")
+        today = today or date.today()
+        days = days or self.soon_days
+        counts = self.expiring_soon(days, today)
+        report = {
+            "date": today.isoformat(),
+            "days": days,
+            "households": [
+                {"household_id": household_id, "expiring_soon": count}
+                for household_id, count in sorted(counts.items())
+            ]
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        metrics.increment("expiry_sweeper", "households_notified", len(counts))
+        print(f"Wrote {len(counts)} households with items expiring within {days} days to {path}")
+        return len(counts)
+
+    def run(self, interval=None, iterations=None):
+        """
+        Sweeps whenever stock expires, and at least once per interval.
+
+        After each sweep the calendar is reloaded and the report written. The sweeper then
+        sleeps until the day after the next expiry in the calendar, which is when that stock
+        becomes expired, but never longer than the interval, so stock added in the meantime
+        is picked up.
+
+        Args:
+            interval (float): The longest sleep in seconds. Defaults to EXPIRY_SWEEP_INTERVAL,
+                or one day.
+            iterations (int): The number of sweeps before returning. Runs forever when None.
+        """
+        interval = interval or float(os.getenv("EXPIRY_SWEEP_INTERVAL", "86400"))
+        done = 0
+        while iterations is None or done < iterations:
+            self.sweep()
+            self.load_calendar()
+            self.write_report()
+            done += 1
+            if iterations is not None and done >= iterations:
+                break
+
+            wait = interval
+            next_expiry = self.next_expiry()
+            if next_expiry is not None:
+                wake = datetime.combine(next_expiry + timedelta(days=1), datetime.min.time())
+                wait = min(interval, max((wake - datetime.now()).total_seconds(), 0))
+            print(f"Next sweep in {wait / 3600:.1f} hours.")
+            time.sleep(wait)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flags expired household stock and reports what expires soon.")
+    parser.add_argument("--days", type=int, help="How many days ahead an item counts as expiring soon.")
+    parser.add_argument("--report", metavar="PATH", help="Where to write the expiring-soon report.")
+    parser.add_argument("--force", action="store_true", help="Sweep even when today was already swept.")
+    parser.add_argument("--loop", action="store_true", help="Keep sweeping whenever stock expires.")
+    args = parser.parse_args()
+
+    load_dotenv(override=True)
+    connection = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB", "smart_kitchen_helper"),
+        user=os.getenv("POSTGRES_USERNAME"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT")
+    )
+    connection.autocommit = True
+    try:
+        sweeper = ExpirySweeper(connection, soon_days=args.days)
+        if args.loop:
+            sweeper.run()
+        else:
+            sweeper.sweep(force=args.force)
+            sweeper.write_report(args.report)
+    finally:
+        connection.close()
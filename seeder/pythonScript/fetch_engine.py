@@ -0,0 +1,394 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .bulk_writer import BulkUpdateWriter
+    from .image_resolver import IMAGE_CACHE_PROVIDER
+    from .metrics import registry as metrics
+    from .query_normalizer import group_documents, normalize_ingredient_name
+    from .response_cache import normalize_query
+except ImportError:
+    from bulk_writer import BulkUpdateWriter
+    from image_resolver import IMAGE_CACHE_PROVIDER
+    from metrics import registry as metrics
+    from query_normalizer import group_documents, normalize_ingredient_name
+    from response_cache import normalize_query
+
+
+def retry_after_delay(header, default):
+    """
+    Returns the delay a Retry-After header asks for.
+
+    The header holds either a number of seconds or an HTTP date.
+
+    Args:
+        header (str): The header value, or None when the response has none.
+        default (float): The delay used when the header is missing or cannot be parsed.
+
+    Returns:
+        float: The delay in seconds, never negative.
+    """
+    if header is None:
+        return default
+    try:
+        return max(float(header), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(header)
+    except (TypeError, ValueError, IndexError):
+        return default
+    if when is None:
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class AsyncRateLimiter:
+    """
+    Spaces out requests so a provider never receives more than `rate` requests per second.
+
+    Methods:
+        acquire() -> None:
+            Waits until the next request may be sent.
+    """
+
+    def __init__(self, rate):
+        """
+        Initializes the AsyncRateLimiter.
+
+        Args:
+            rate (float): The maximum number of requests per second. 0 disables the limit.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until the next request may be sent.
+        """
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Provider:
+    """
+    Holds the endpoint, limits and HTTP session of one enrichment API.
+
+    Methods:
+        get(path: str, params: dict) -> dict:
+            Sends a rate limited GET request and returns the decoded JSON response.
+    """
+
+    def __init__(self, name, base_url, concurrency, rate, executor, max_retries=3, scope=None):
+        """
+        Initializes the Provider.
+
+        Args:
+            name (str): The provider name used in log messages.
+            base_url (str): The API root, which can point at a local stub server.
+            concurrency (int): The maximum number of requests in flight.
+            rate (float): The maximum number of requests per second. 0 disables the limit.
+            executor (ThreadPoolExecutor): Runs the blocking HTTP calls.
+            max_retries (int): How often a request rejected with HTTP 429 is retried.
+            scope (str): The metrics scope of the calls, usually the stage. Defaults to the name.
+        """
+        self.name = name
+        self.scope = scope or name
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = AsyncRateLimiter(rate)
+        self.executor = executor
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+        self.calls = 0
+
+    async def get(self, path, params):
+        """
+        Sends a rate limited GET request and returns the decoded JSON response.
+
+        Requests rejected with HTTP 429 are retried after the Retry-After delay, given in seconds
+        or as an HTTP date, or after an exponential backoff when the header is missing or malformed.
+
+        Args:
+            path (str): The endpoint path below the API root.
+            params (dict): The query parameters.
+
+        Returns:
+            dict: The decoded response, or None if the request failed or its body is not JSON.
+        """
+        loop = asyncio.get_running_loop()
+        url = f"{self.base_url}/{path}"
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire()
+                self.calls += 1
+                metrics.increment(self.scope, "api_calls")
+                start = time.perf_counter()
+                try:
+                    response = await loop.run_in_executor(
+                        self.executor, lambda: self.session.get(url, params=params, timeout=30)
+                    )
+                except requests.RequestException as e:
+                    metrics.increment(self.scope, "api_errors")
+                    print(f"Error calling {self.name}: {e}")
+                    return None
+                finally:
+                    metrics.observe(self.scope, f"{self.name}_{path.replace('/', '_')}", time.perf_counter() - start)
+
+                if response.status_code == 429 and attempt < self.max_retries:
+                    metrics.increment(self.scope, "retries")
+                    delay = retry_after_delay(response.headers.get("Retry-After"), 2 ** attempt)
+                    print(f"{self.name} rate limit reached, retrying in {delay:.0f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                if response.status_code != 200:
+                    metrics.increment(self.scope, "api_errors")
+                    print(f"Error fetching from {self.name}: {response.status_code}")
+                    return None
+                try:
+                    return response.json()
+                except ValueError as e:
+                    metrics.increment(self.scope, "api_errors")
+                    print(f"Error decoding the response of {self.name}: {e}")
+                    return None
+        return None
+
+
+class AsyncFetchEngine:
+    """
+    Fetches YouTube video URLs and Unsplash image URLs for many documents concurrently.
+
+    Each provider has its own bound on requests in flight and its own requests-per-second limit.
+    Lookups are answered from the fetcher's response cache when possible, and results are
+    written back to MongoDB through a BulkUpdateWriter.
+
+    Methods:
+        run(providers: list) -> dict:
+            Enriches the documents of the given providers and returns the number of updates per provider.
+        search_youtube(query: str) -> str:
+            Returns the URL of the first YouTube search result.
+        search_unsplash(query: str) -> str:
+            Returns the URL of the first Unsplash search result.
+    """
+
+    def __init__(self, fetcher, batch_size=None):
+        """
+        Initializes the AsyncFetchEngine from the fetcher's credentials, database and the environment.
+
+        Concurrency and rate limits are read from YOUTUBE_MAX_CONCURRENCY, YOUTUBE_RATE_LIMIT,
+        UNSPLASH_MAX_CONCURRENCY and UNSPLASH_RATE_LIMIT. YOUTUBE_API_URL and UNSPLASH_API_URL
+        override the API roots, for example to run against a local stub HTTP server.
+
+        Args:
+            fetcher (YouTubeImageFetcher): Provides the API keys, the response cache and the MongoDB database.
+            batch_size (int): The number of updates per bulk_write. Defaults to BULK_WRITE_BATCH_SIZE, or 500.
+        """
+        self.fetcher = fetcher
+        self.mongo_db = fetcher.mongo_db
+        self.batch_size = batch_size
+        self.settings = {
+            "youtube": (
+                os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3"),
+                int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "8")),
+                float(os.getenv("YOUTUBE_RATE_LIMIT", "10"))
+            ),
+            "unsplash": (
+                os.getenv("UNSPLASH_API_URL", "https://api.unsplash.com"),
+                int(os.getenv("UNSPLASH_MAX_CONCURRENCY", "4")),
+                float(os.getenv("UNSPLASH_RATE_LIMIT", "1"))
+            )
+        }
+        # The seeding stage each provider's calls are counted under.
+        self.stages = {"youtube": "youtube_fetch", "unsplash": "image_fetch"}
+        self.providers = {}
+        self.writer = None
+
+    def run(self, providers=("youtube", "unsplash")):
+        """
+        Enriches the documents of the given providers and returns the number of updates per provider.
+
+        Args:
+            providers (list): Any of "youtube" and "unsplash". Both run at the same time.
+
+        Returns:
+            dict: Maps each provider name to the number of documents updated.
+        """
+        return asyncio.run(self.run_providers(providers))
+
+    async def run_providers(self, providers):
+        """
+        Runs the enrichment jobs of the given providers concurrently.
+
+        Args:
+            providers (list): Any of "youtube" and "unsplash".
+
+        Returns:
+            dict: Maps each provider name to the number of documents updated.
+        """
+        workers = sum(self.settings[name][1] for name in providers) + 1
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                BulkUpdateWriter(self.mongo_db, self.batch_size) as writer:
+            self.writer = writer
+            self.providers = {
+                name: Provider(name, self.settings[name][0], self.settings[name][1], self.settings[name][2], executor,
+                               scope=self.stages[name])
+                for name in providers
+            }
+            jobs = {
+                "youtube": lambda: self.enrich(
+                    "youtube", "recipes_mongo", "recipe_name", "video_url",
+                    normalize_query, self.search_youtube, lambda name: name + " recipe"
+                ),
+                "unsplash": lambda: self.enrich(
+                    "unsplash", "ingredients_mongo", "name", "image_url",
+                    normalize_ingredient_name, self.search_unsplash
+                )
+            }
+            results = await asyncio.gather(*(jobs[name]() for name in providers))
+        return dict(zip(providers, results))
+
+    async def enrich(self, provider_name, collection_name, name_field, target_field, normalize, search,
+                     to_query=None):
+        """
+        Looks up every document that is missing `target_field` and stores the results in batches.
+
+        Documents whose names normalize to the same key share one lookup and one update_many,
+        which searches for one of their original names.
+
+        Args:
+            provider_name (str): The provider whose concurrency bound sizes the worker pool.
+            collection_name (str): The collection to enrich.
+            name_field (str): The field the search query is built from.
+            target_field (str): The field that receives the looked up URL.
+            normalize (callable): Maps a document name to its grouping key.
+            search (callable): Coroutine function that returns the URL for a query.
+            to_query (callable): Maps a group's original name to its search query. Defaults to the name.
+
+        Returns:
+            int: The number of documents updated.
+        """
+        loop = asyncio.get_running_loop()
+        provider = self.providers[provider_name]
+        collection = self.mongo_db[collection_name]
+        groups, count = await loop.run_in_executor(
+            provider.executor,
+            lambda: group_documents(
+                collection.find({target_field: {"$exists": False}}, {name_field: 1}), name_field, normalize, to_query
+            )
+        )
+
+        queue = asyncio.Queue()
+        for item in groups.items():
+            queue.put_nowait(item)
+
+        updated = 0
+        start = time.perf_counter()
+
+        async def worker():
+            nonlocal updated
+            while True:
+                try:
+                    query, ids = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                url = await search(query)
+                if url:
+                    # add() runs on the executor because a full buffer is written synchronously.
+                    await loop.run_in_executor(
+                        provider.executor, lambda: self.writer.add(
+                            collection_name, {"_id": {"$in": ids}}, {"$set": {target_field: url}}, many=True
+                        )
+                    )
+                    updated += len(ids)
+
+        await asyncio.gather(*(worker() for _ in range(provider.concurrency)))
+
+        elapsed = time.perf_counter() - start
+        print(f"Updated {updated} of {count} documents in {collection_name} with {target_field} "
+              f"using {provider.calls} {provider.name} calls in {elapsed:.2f}s "
+              f"({len(groups)} distinct queries, {count - len(groups)} calls saved)")
+        return updated
+
+    async def search_youtube(self, query):
+        """
+        Returns the URL of the first YouTube search result.
+
+        The SQLite response cache is read and written on the provider's executor, so its disk
+        I/O does not block the event loop.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            str: The video URL, or None if nothing was found.
+        """
+        loop = asyncio.get_running_loop()
+        provider = self.providers["youtube"]
+        found, video_url = await loop.run_in_executor(provider.executor, self.fetcher.cache.get, "youtube", query)
+        if found:
+            return video_url
+
+        data = await provider.get("search", {
+            "q": query,
+            "part": "snippet",
+            "type": "video",
+            "maxResults": 1,
+            "key": self.fetcher.youtube_api_key
+        })
+        if data is None:
+            return None
+        video_url = None
+        if data.get("items"):
+            video_url = "https://www.youtube.com/watch?v=" + data["items"][0]["id"]["videoId"]
+        await loop.run_in_executor(provider.executor, self.fetcher.cache.set, "youtube", query, video_url)
+        return video_url
+
+    async def search_unsplash(self, query):
+        """
+        Returns the URL of the first Unsplash search result.
+
+        The lookup goes through the fetcher's hedged image resolver, the one path every image
+        lookup takes, bounded by the Unsplash concurrency and rate limits. The resolver falls
+        back to Google Custom Search when it is configured. Cached answers are read on the
+        provider's executor first, so they neither block the event loop nor use up the limits.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            str: The image URL, or None if nothing was found.
+        """
+        loop = asyncio.get_running_loop()
+        resolver = self.fetcher.image_resolver
+        provider = self.providers["unsplash"]
+        found, image_url = await loop.run_in_executor(
+            provider.executor, self.fetcher.cache.get, IMAGE_CACHE_PROVIDER, query
+        )
+        if found:
+            return image_url
+
+        async with provider.semaphore:
+            await provider.limiter.acquire()
+            image_url = await loop.run_in_executor(provider.executor, resolver.resolve, query, False)
+        # The requests are sent by the resolver, so its image API calls are reported as this provider's.
+        provider.calls = sum(image_provider.calls for image_provider in resolver.providers)
+        return image_url
@@ -0,0 +1,428 @@
+import bisect
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+try:
+    from .metrics import registry as metrics
+except ImportError:
+    from metrics import registry as metrics
+
+# The response cache namespace of resolved image URLs. Every lookup path shares it, whichever
+# provider found the image, so a URL resolved by one path is reused by the others.
+IMAGE_CACHE_PROVIDER = "image"
+
+
+class ProviderError(Exception):
+    """Raised when an image provider request fails."""
+
+
+class QuotaExceededError(ProviderError):
+    """Raised when an image provider rejects a request because its quota is used up."""
+
+
+def search_unsplash_images(query, access_key, base_url="https://api.unsplash.com"):
+    """
+    Searches Unsplash for an image matching the query.
+
+    Args:
+        query (str): The search query.
+        access_key (str): The Unsplash access key.
+        base_url (str): The API root.
+
+    Returns:
+        str: The URL of the first result, or None if Unsplash found nothing.
+
+    Raises:
+        QuotaExceededError: If the rate limit is used up.
+        ProviderError: If the request fails.
+    """
+    response = requests.get(
+        f"{base_url}/search/photos",
+        params={"query": query, "client_id": access_key, "per_page": 1},
+        timeout=30
+    )
+    if response.status_code in (403, 429):
+        raise QuotaExceededError(f"Unsplash quota exceeded ({response.status_code})")
+    if response.status_code != 200:
+        raise ProviderError(f"Unsplash returned {response.status_code}")
+    results = response.json().get("results")
+    return results[0]["urls"]["regular"] if results else None
+
+
+def search_google_images(query, api_key, cx, base_url="https://www.googleapis.com/customsearch/v1"):
+    """
+    Searches Google Custom Search for an image matching the query.
+
+    Args:
+        query (str): The search query.
+        api_key (str): The Google API key.
+        cx (str): The Custom Search engine ID.
+        base_url (str): The API endpoint.
+
+    Returns:
+        str: The URL of the first result, or None if Google found nothing.
+
+    Raises:
+        QuotaExceededError: If the daily quota is used up.
+        ProviderError: If the request fails.
+    """
+    response = requests.get(
+        base_url,
+        params={"q": query, "cx": cx, "key": api_key, "num": 1, "searchType": "image", "imgSize": "medium"},
+        timeout=30
+    )
+    if response.status_code == 429 or (response.status_code == 403 and "quota" in response.text.lower()):
+        raise QuotaExceededError(f"Google Custom Search quota exceeded ({response.status_code})")
+    if response.status_code != 200:
+        raise ProviderError(f"Google Custom Search returned {response.status_code}")
+    items = response.json().get("items")
+    return items[0]["link"] if items else None
+
+
+class LatencyHistogram:
+    """
+    Counts request latencies in fixed millisecond buckets.
+
+    Methods:
+        record(seconds: float) -> None:
+            Adds a latency sample.
+        percentile(p: float) -> float:
+            Returns the upper bound in milliseconds of the bucket holding the p-th percentile.
+    """
+
+    bounds = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+
+    def __init__(self):
+        """
+        Initializes an empty LatencyHistogram.
+        """
+        self.counts = [0] * len(self.bounds)
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Adds a latency sample.
+
+        Args:
+            seconds (float): The request latency in seconds.
+        """
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, seconds * 1000)] += 1
+            self.total += 1
+
+    def percentile(self, p):
+        """
+        Returns the upper bound in milliseconds of the bucket holding the p-th percentile.
+
+        Args:
+            p (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The bucket bound, or 0 if nothing was recorded.
+        """
+        with self.lock:
+            if not self.total:
+                return 0.0
+            rank = p / 100 * self.total
+            seen = 0
+            for bound, count in zip(self.bounds, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return self.bounds[-1]
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a provider after repeated failures, and retries it after a cooldown.
+
+    Methods:
+        allow() -> bool:
+            Checks whether a call may be made.
+        record_success() -> None:
+            Resets the failure count.
+        record_failure() -> None:
+            Counts a failure and opens the breaker at the threshold.
+        trip(duration: float) -> None:
+            Opens the breaker for the given number of seconds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        """
+        Initializes a closed CircuitBreaker.
+
+        Args:
+            failure_threshold (int): The number of consecutive failures that opens the breaker.
+            reset_timeout (float): The number of seconds the breaker stays open.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Checks whether a call may be made.
+
+        Returns:
+            bool: False while the breaker is open.
+        """
+        return time.monotonic() >= self.open_until
+
+    def record_success(self):
+        """
+        Resets the failure count.
+        """
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        """
+        Counts a failure and opens the breaker at the threshold.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.reset_timeout
+                self.failures = 0
+
+    def trip(self, duration):
+        """
+        Opens the breaker for the given number of seconds.
+
+        Args:
+            duration (float): How long calls are refused.
+        """
+        with self.lock:
+            self.open_until = time.monotonic() + duration
+
+
+class ImageProvider:
+    """
+    Wraps an image search function with a quota budget, a circuit breaker and a latency histogram.
+
+    Methods:
+        available() -> bool:
+            Checks whether the provider has quota left and its breaker is closed.
+        search(query: str) -> str:
+            Runs a search and records its outcome.
+    """
+
+    def __init__(self, name, search_function, quota=None, breaker=None, quota_cooldown=3600):
+        """
+        Initializes the ImageProvider.
+
+        Args:
+            name (str): The provider name used in reports.
+            search_function (callable): Returns an image URL or None for a query.
+            quota (int): The number of calls this run may make. None means unlimited.
+            breaker (CircuitBreaker): The breaker guarding the provider.
+            quota_cooldown (float): How long the provider is skipped after a quota error.
+        """
+        self.name = name
+        self.search_function = search_function
+        self.quota = quota
+        self.breaker = breaker or CircuitBreaker()
+        self.quota_cooldown = quota_cooldown
+        self.histogram = LatencyHistogram()
+        self.calls = 0
+        self.failures = 0
+        self.wins = 0
+        self.lock = threading.Lock()
+
+    def available(self):
+        """
+        Checks whether the provider has quota left and its breaker is closed.
+
+        Returns:
+            bool: True if a call may be made.
+        """
+        return (self.quota is None or self.calls < self.quota) and self.breaker.allow()
+
+    def search(self, query):
+        """
+        Runs a search and records its outcome.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            str: The image URL, or None if the provider found nothing.
+
+        Raises:
+            ProviderError: If the provider is unavailable or the request fails.
+        """
+        with self.lock:
+            if not self.available():
+                raise ProviderError(f"{self.name} is unavailable")
+            self.calls += 1
+        metrics.increment("image_fetch", "api_calls")
+
+        start = time.perf_counter()
+        try:
+            result = self.search_function(query)
+        except QuotaExceededError:
+            self.failures += 1
+            metrics.increment("image_fetch", "api_errors")
+            self.breaker.trip(self.quota_cooldown)
+            raise
+        except Exception:
+            self.failures += 1
+            metrics.increment("image_fetch", "api_errors")
+            self.breaker.record_failure()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.histogram.record(elapsed)
+            metrics.observe("image_fetch", f"{self.name}_search", elapsed)
+        self.breaker.record_success()
+        return result
+
+
+class HedgedImageResolver:
+    """
+    Resolves image URLs by racing image providers in priority order.
+
+    The first available provider is called straight away. The next one is started when the
+    previous one fails, finds nothing, or has not answered within `hedge_delay` seconds, and
+    the first URL returned wins.
+
+    Methods:
+        from_environment(cache) -> HedgedImageResolver:
+            Builds a resolver for every provider configured in the environment.
+        resolve(query: str, check_cache: bool) -> str:
+            Returns the first image URL found for the query.
+        report() -> None:
+            Prints the calls, failures, wins, latency and remaining quota of every provider.
+        close() -> None:
+            Shuts down the worker threads.
+    """
+
+    def __init__(self, providers, hedge_delay=0.5, cache=None):
+        """
+        Initializes the HedgedImageResolver.
+
+        Args:
+            providers (list): ImageProvider instances in priority order.
+            hedge_delay (float): The number of seconds to wait before starting the next provider.
+            cache (ResponseCache): Caches resolved URLs and empty answers under IMAGE_CACHE_PROVIDER.
+        """
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max(1, 4 * len(providers)))
+
+    @classmethod
+    def from_environment(cls, cache=None):
+        """
+        Builds a resolver for every provider configured in the environment.
+
+        Unsplash is used when UNSPLASH_ACCESS_KEY is set and Google Custom Search when
+        GOOGLE_API_KEY and GOOGLE_PROJECT_CX are set. UNSPLASH_API_URL and GOOGLE_API_URL
+        override the API endpoints, for example to run against a local stub HTTP server.
+        UNSPLASH_QUOTA and GOOGLE_QUOTA cap the calls per run, and IMAGE_HEDGE_DELAY sets the
+        hedging delay in seconds.
+
+        Args:
+            cache (ResponseCache): Caches resolved URLs.
+
+        Returns:
+            HedgedImageResolver: The configured resolver.
+        """
+        providers = []
+        unsplash_key = os.getenv("UNSPLASH_ACCESS_KEY")
+        if unsplash_key:
+            base_url = os.getenv("UNSPLASH_API_URL", "https://api.unsplash.com")
+            providers.append(ImageProvider(
+                "unsplash",
+                lambda query: search_unsplash_images(query, unsplash_key, base_url),
+                quota=int(os.getenv("UNSPLASH_QUOTA", "0")) or None
+            ))
+        google_key = os.getenv("GOOGLE_API_KEY")
+        google_cx = os.getenv("GOOGLE_PROJECT_CX")
+        if google_key and google_cx:
+            google_url = os.getenv("GOOGLE_API_URL", "https://www.googleapis.com/customsearch/v1")
+            providers.append(ImageProvider(
+                "google",
+                lambda query: search_google_images(query, google_key, google_cx, google_url),
+                quota=int(os.getenv("GOOGLE_QUOTA", "100")) or None
+            ))
+        return cls(providers, float(os.getenv("IMAGE_HEDGE_DELAY", "0.5")), cache)
+
+    def resolve(self, query, check_cache=True):
+        """
+        Returns the first image URL found for the query.
+
+        Args:
+            query (str): The search query.
+            check_cache (bool): Look the query up in the cache first. Callers that already did
+                pass False. The answer is cached either way.
+
+        Returns:
+            str: The image URL, or None if no provider found one.
+        """
+        if check_cache and self.cache is not None:
+            found, image_url = self.cache.get(IMAGE_CACHE_PROVIDER, query)
+            if found:
+                return image_url
+
+        candidates = [provider for provider in self.providers if provider.available()]
+        if not candidates:
+            print(f"No image provider available for query: {query}")
+            return None
+
+        pending = {}
+        answered = False
+        next_index = 0
+        while True:
+            if next_index < len(candidates):
+                provider = candidates[next_index]
+                pending[self.executor.submit(provider.search, query)] = provider
+                next_index += 1
+            if not pending:
+                break
+
+            timeout = self.hedge_delay if next_index < len(candidates) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    image_url = future.result()
+                except Exception as e:
+                    print(f"Error fetching image from {provider.name}: {e}")
+                    continue
+                answered = True
+                if image_url:
+                    provider.wins += 1
+                    if self.cache is not None:
+                        self.cache.set(IMAGE_CACHE_PROVIDER, query, image_url)
+                    return image_url
+
+        if answered and self.cache is not None:
+            self.cache.set(IMAGE_CACHE_PROVIDER, query, None)
+        print(f"No images found for query: {query}")
+        return None
+
+    def report(self):
+        """
+        Prints the calls, failures, wins, latency and remaining quota of every provider.
+        """
+        for provider in self.providers:
+            remaining = "unlimited" if provider.quota is None else provider.quota - provider.calls
+            print(f"{provider.name}: {provider.calls} calls, {provider.failures} failures, {provider.wins} wins, "
+                  f"p50 <= {provider.histogram.percentile(50):.0f}ms, p95 <= {provider.histogram.percentile(95):.0f}ms, "
+                  f"quota remaining {remaining}")
+
+    def close(self):
+        """
+        Shuts down the worker threads.
+
+        Requests still running for a provider that lost the race are not waited for.
+        """
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,105 @@
+import json
+import re
+
+SHELL_LITERAL_PATTERN = re.compile(r'\b(ObjectId|ISODate|NumberLong|NumberInt|NumberDecimal)\(\s*"?([^")]*?)"?\s*\)')
+# A JSON string token, matched up to its closing quote, or to the end of a buffer that cuts it off.
+STRING_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*(?:"|\\?\Z)', re.DOTALL)
+SHELL_LITERAL_SCANNER = re.compile(f"{STRING_TOKEN_PATTERN.pattern}|{SHELL_LITERAL_PATTERN.pattern}", re.DOTALL)
+SHELL_LITERAL_TYPES = {
+    "ObjectId": "$oid",
+    "ISODate": "$date",
+    "NumberLong": "$numberLong",
+    "NumberInt": "$numberInt",
+    "NumberDecimal": "$numberDecimal"
+}
+WHITESPACE = " \t\r\n"
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = "0123456789+-.eE"
+
+
+def convert_shell_literals(text):
+    """
+    Rewrites mongo shell literals such as ObjectId("...") and ISODate("...") as Extended JSON.
+
+    String tokens are skipped whole, quotes and escapes included, so a string value that mentions
+    ObjectId("...") is left as it is. The text must start outside a string; a string cut off at the
+    end of the text is left alone too.
+
+    Args:
+        text (str): JSON text that may contain mongo shell literals.
+
+    Returns:
+        str: The text with every shell literal outside a string replaced by its Extended JSON form.
+    """
+    def replace(match):
+        if match.group(1) is None:
+            return match.group(0)
+        return json.dumps({SHELL_LITERAL_TYPES[match.group(1)]: match.group(2)})
+
+    return SHELL_LITERAL_SCANNER.sub(replace, text)
+
+
+def iter_json_documents(file, read_size=65536, object_hook=None):
+    """
+    Incrementally parses the documents of a JSON array, or of concatenated JSON documents.
+
+    The file is read in blocks of `read_size` characters, and only the unparsed tail of the
+    current block is held in memory, so memory use does not grow with the size of the file.
+
+    Args:
+        file (file object): A text file positioned at the start of the JSON content.
+        read_size (int): The number of characters read per block.
+        object_hook (callable): Called with every decoded object, for example
+            bson.json_util.object_hook to convert Extended JSON values.
+
+    Yields:
+        The decoded documents, in file order.
+
+    Raises:
+        json.JSONDecodeError: If the content is not valid JSON.
+    """
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    buffer = ""
+    position = 0
+    in_array = None
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+
+        if position < len(buffer):
+            char = buffer[position]
+            if in_array is None:
+                in_array = char == "["
+                if in_array:
+                    position += 1
+                    continue
+            elif in_array and char == ",":
+                position += 1
+                continue
+            elif in_array and char == "]":
+                return
+
+            try:
+                document, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number may be cut off by the block boundary, such as "12" of "123" or "1.5"
+                # of "1.5e3", so it is only taken once more input shows where it ends.
+                if eof or buffer[position] not in NUMBER_START or (
+                        end < len(buffer) and buffer[end] not in NUMBER_CHARS):
+                    position = end
+                    yield document
+                    continue
+        elif eof:
+            if in_array:
+                raise json.JSONDecodeError("Unterminated JSON array", buffer, position)
+            return
+
+        chunk = file.read(read_size)
+        eof = not chunk
+        buffer = convert_shell_literals(buffer[position:] + chunk)
+        position = 0
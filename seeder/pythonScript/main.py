@@ -5,12 +5,19 @@ Created on Thu Aug 15 18:29:01 2024
 @author: Amitr
 """
 
+import argparse
 import logging
+import threading
 from aws_setup import AWSSetup
 from postgresql_setup import PostgreSQLSetup
 from mongodb_setup import MongoDBSetup
 from data_insertion import DataInsertion
 from youtube_image_fetch import YouTubeImageFetcher
+from expiry_sweeper import ExpirySweeper
+from checkpoint import CheckpointStore
+from connection_manager import ConnectionManager
+from metrics import registry as metrics
+from stage_orchestrator import Stage, StageOrchestrator
 from dotenv import load_dotenv
 import os
 
@@ -25,45 +32,136 @@ logging.basicConfig(
 )
 
 def main():
+    parser = argparse.ArgumentParser(description="Sets up and seeds the Smart Kitchen Helper environment.")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Discard the checkpoint of an interrupted run and start from scratch.")
+    parser.add_argument("--only", nargs="+", metavar="STAGE",
+                        help="Run only these stages. Their dependencies are assumed to be in place.")
+    parser.add_argument("--skip", nargs="+", metavar="STAGE", default=[],
+                        help="Leave these stages out.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run every stage under cProfile and write its profile to PROFILE_DIR, or ./profiles.")
+    parser.add_argument("--metrics", metavar="PATH", default=os.getenv("SEED_METRICS_PATH", "metrics.json"),
+                        help="Where to write the stage metrics as JSON.")
+    parser.add_argument("--prometheus", metavar="PATH", default=os.getenv("SEED_METRICS_PROMETHEUS"),
+                        help="Also write the metrics in Prometheus text format to this file.")
+    args = parser.parse_args()
+
+    def write_metrics():
+        metrics.write_json(args.metrics)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+
     logging.info("Starting Smart Kitchen Helper setup...")
+    checkpoint = CheckpointStore()
+    if args.fresh:
+        checkpoint.reset()
+
+    # One PostgreSQL pool and one MongoDB client are shared by every stage.
+    connections = ConnectionManager()
+    # The YouTube and image fetch stages share one fetcher, created by whichever runs first.
+    fetcher = None
 
     try:
-        # AWS Setup
-        logging.info("Starting AWS setup...")
-        aws_setup = AWSSetup()
-        aws_setup.run_setup()
-        logging.info("AWS setup completed.")
-
-        # PostgreSQL Setup
-        logging.info("Starting PostgreSQL setup...")
-        postgres_setup = PostgreSQLSetup()
-        postgres_setup.run_setup()
-        logging.info("PostgreSQL setup completed.")
-
-        # MongoDB Setup
-        logging.info("Starting MongoDB setup...")
-        mongo_setup = MongoDBSetup()
-        mongo_setup.create_collections()
-        logging.info("MongoDB setup completed.")
-
-        # Data Insertion
-        logging.info("Starting data insertion...")
-        data_inserter = DataInsertion()
-        data_inserter.insert_sql_data()
-        data_inserter.insert_mongo_data()
-        logging.info("Data insertion completed.")
-
-        # YouTube and Unsplash Fetch
-        logging.info("Starting YouTube and Unsplash fetch...")
-        fetcher = YouTubeImageFetcher()
-        fetcher.fetch_youtube_urls()
-        fetcher.fetch_image_urls()
-        logging.info("YouTube and Unsplash fetch completed.")
+        def setup_aws():
+            aws_setup = AWSSetup()
+            aws_setup.run_setup()
+
+        def setup_postgresql():
+            postgres_setup = PostgreSQLSetup(connections)
+            try:
+                postgres_setup.run_setup()
+            finally:
+                postgres_setup.close()
+
+        def insert_sql_data():
+            data_inserter = DataInsertion(checkpoint, connections)
+            try:
+                data_inserter.insert_sql_data(bulk=True)
+            finally:
+                data_inserter.close()
+
+        def build_postgresql_indexes():
+            postgres_setup = PostgreSQLSetup(connections)
+            try:
+                postgres_setup.create_indexes()
+                postgres_setup.verify_indexes()
+            finally:
+                postgres_setup.close()
+
+        def sweep_expired_stock():
+            connection = connections.getconn()
+            try:
+                sweeper = ExpirySweeper(connection)
+                # Seeding loads stock with past expiration dates, even on a day already swept.
+                sweeper.sweep(force=True)
+                sweeper.write_report()
+            finally:
+                connections.putconn(connection)
+
+        def setup_mongodb():
+            MongoDBSetup(connections=connections)
+
+        def insert_mongo_data():
+            data_inserter = DataInsertion(checkpoint, connections)
+            try:
+                data_inserter.insert_mongo_data()
+            finally:
+                data_inserter.close()
+
+        fetcher_lock = threading.Lock()
+
+        def get_fetcher():
+            nonlocal fetcher
+            with fetcher_lock:
+                if fetcher is None:
+                    fetcher = YouTubeImageFetcher(connections)
+            return fetcher
+
+        # The RDS endpoint comes from the AWS setup, while MongoDB and its enrichment do not
+        # depend on PostgreSQL at all, so the two branches run side by side.
+        stages = [
+            Stage("aws_setup", "AWS setup", setup_aws),
+            Stage("postgresql_setup", "PostgreSQL setup", setup_postgresql, ["aws_setup"]),
+            Stage("sql_data_insertion", "SQL data insertion", insert_sql_data, ["postgresql_setup"]),
+            Stage("postgresql_indexes", "PostgreSQL index build", build_postgresql_indexes, ["sql_data_insertion"]),
+            Stage("expiry_sweep", "Expiry sweep", sweep_expired_stock, ["postgresql_indexes"]),
+            Stage("mongodb_setup", "MongoDB setup", setup_mongodb),
+            Stage("mongo_data_insertion", "MongoDB data insertion", insert_mongo_data, ["mongodb_setup"]),
+            Stage("mongodb_indexes", "MongoDB index build",
+                  lambda: MongoDBSetup(mode="connect", connections=connections).create_indexes(),
+                  ["mongo_data_insertion"]),
+            Stage("youtube_fetch", "YouTube fetch",
+                  lambda: get_fetcher().fetch_youtube_urls(ranked=True), ["mongo_data_insertion"]),
+            Stage("image_fetch", "Unsplash fetch",
+                  lambda: get_fetcher().fetch_image_urls(concurrent=True), ["mongo_data_insertion"])
+        ]
+        profile_dir = os.getenv("PROFILE_DIR", "profiles") if args.profile else None
+        orchestrator = StageOrchestrator(stages, checkpoint, profile_dir=profile_dir)
+        try:
+            orchestrator.select(args.only, args.skip)
+        except ValueError as e:
+            parser.error(f"{e}. Stages: {', '.join(stage.name for stage in stages)}")
+        orchestrator.run(args.only, args.skip)
 
     except Exception as e:
         logging.error(f"An error occurred: {e}")
+        logging.info("Rerun to resume from the last completed step, or pass --fresh to start over.")
+        if fetcher is not None:
+            fetcher.close()
+        checkpoint.close()
+        connections.close()
+        write_metrics()
         raise
 
+    # A partial run keeps its checkpoint so the remaining stages can follow later.
+    if not args.only and not args.skip:
+        checkpoint.reset()
+    if fetcher is not None:
+        fetcher.close()
+    checkpoint.close()
+    connections.close()
+    write_metrics()
     logging.info("Smart Kitchen Helper setup completed successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+METRIC_NAME_PATTERN = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile of the values using the nearest-rank method.
+
+    Args:
+        values (list): The samples, sorted in ascending order.
+        p (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0 if there are no samples.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class MetricsRegistry:
+    """
+    Collects counters and operation latencies of a seeding run, grouped by scope.
+
+    A scope is a stage name, such as "sql_data_insertion", or a component shared by several
+    stages, such as "response_cache".
+
+    Methods:
+        increment(scope: str, name: str, value: float) -> None:
+            Adds to a counter.
+        observe(scope: str, operation: str, seconds: float) -> None:
+            Records the duration of an operation.
+        timer(scope: str, operation: str) -> contextmanager:
+            Records the duration of the enclosed block.
+        snapshot() -> dict:
+            Returns the counters and latency percentiles of every scope.
+        write_json(path: str) -> None:
+            Writes the snapshot as JSON.
+        write_prometheus(path: str) -> None:
+            Writes the snapshot in the Prometheus text exposition format.
+        reset() -> None:
+            Discards everything recorded so far.
+    """
+
+    def __init__(self, max_samples=100000):
+        """
+        Initializes an empty MetricsRegistry.
+
+        Args:
+            max_samples (int): The number of latency samples kept per operation. Later samples
+                replace earlier ones at random positions, so the percentiles stay representative.
+        """
+        self.max_samples = max_samples
+        self.counters = {}
+        self.samples = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def increment(self, scope, name, value=1):
+        """
+        Adds to a counter.
+
+        Args:
+            scope (str): The stage or component.
+            name (str): The counter name, such as "rows_loaded" or "api_calls".
+            value (float): The amount to add.
+        """
+        with self.lock:
+            key = (scope, name)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, scope, operation, seconds):
+        """
+        Records the duration of an operation.
+
+        Args:
+            scope (str): The stage or component.
+            operation (str): The operation name, such as "api_call" or "table_load".
+            seconds (float): The duration in seconds.
+        """
+        with self.lock:
+            key = (scope, operation)
+            count, total = self.totals.get(key, (0, 0.0))
+            self.totals[key] = (count + 1, total + seconds)
+            samples = self.samples.setdefault(key, [])
+            if len(samples) < self.max_samples:
+                samples.append(seconds)
+            else:
+                # Reservoir sampling keeps a uniform sample of every observation.
+                index = random.randrange(count + 1)
+                if index < self.max_samples:
+                    samples[index] = seconds
+
+    @contextmanager
+    def timer(self, scope, operation):
+        """
+        Records the duration of the enclosed block, also when it raises.
+
+        Args:
+            scope (str): The stage or component.
+            operation (str): The operation name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(scope, operation, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Returns the counters and latency percentiles of every scope.
+
+        Returns:
+            dict: Maps each scope to its "counters" and its "latency" per operation, with the
+                count, total seconds and p50/p95 in milliseconds.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            samples = {key: sorted(values) for key, values in self.samples.items()}
+            totals = dict(self.totals)
+
+        result = {}
+        for (scope, name), value in sorted(counters.items()):
+            result.setdefault(scope, {"counters": {}, "latency": {}})["counters"][name] = value
+        for (scope, operation), values in sorted(samples.items()):
+            count, total = totals[(scope, operation)]
+            result.setdefault(scope, {"counters": {}, "latency": {}})["latency"][operation] = {
+                "count": count,
+                "total_seconds": round(total, 6),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3)
+            }
+        return result
+
+    def write_json(self, path):
+        """
+        Writes the snapshot as JSON.
+
+        Args:
+            path (str): The output file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        print(f"Wrote metrics to {path}")
+
+    def write_prometheus(self, path):
+        """
+        Writes the snapshot in the Prometheus text exposition format.
+
+        Counters become seeder_<name>_total series and latencies a seeder_operation_seconds
+        summary, each labelled with the scope.
+
+        Args:
+            path (str): The output file, for example one read by the node exporter's textfile collector.
+        """
+        lines = []
+        declared = set()
+        snapshot = self.snapshot()
+        for scope, data in snapshot.items():
+            for name, value in data["counters"].items():
+                metric = f"seeder_{METRIC_NAME_PATTERN.sub('_', name)}_total"
+                if metric not in declared:
+                    lines.append(f"# TYPE {metric} counter")
+                    declared.add(metric)
+                lines.append(f'{metric}{{scope="{scope}"}} {value}')
+
+        if any(data["latency"] for data in snapshot.values()):
+            lines.append("# TYPE seeder_operation_seconds summary")
+        for scope, data in snapshot.items():
+            for operation, latency in data["latency"].items():
+                labels = f'scope="{scope}",operation="{operation}"'
+                lines.append(f'seeder_operation_seconds{{{labels},quantile="0.5"}} {latency["p50_ms"] / 1000}')
+                lines.append(f'seeder_operation_seconds{{{labels},quantile="0.95"}} {latency["p95_ms"] / 1000}')
+                lines.append(f'seeder_operation_seconds_sum{{{labels}}} {latency["total_seconds"]}')
+                lines.append(f'seeder_operation_seconds_count{{{labels}}} {latency["count"]}')
+
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        print(f"Wrote Prometheus metrics to {path}")
+
+    def reset(self):
+        """
+        Discards everything recorded so far.
+        """
+        with self.lock:
+            self.counters.clear()
+            self.samples.clear()
+            self.totals.clear()
+
+
+# The registry shared by every module of the seeder, in the way modules share a logger.
+registry = MetricsRegistry()
@@ -1,6 +1,7 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel
 from dotenv import load_dotenv
 import os
+import time
 
 class MongoDBSetup:
     """
@@ -11,19 +12,208 @@ class MongoDBSetup:
             Establishes a connection to the MongoDB database.
         setup_database() -> None:
             Drops the existing database and creates the necessary collections.
+        reconcile() -> None:
+            Brings the existing database in line with the desired validators and indexes.
+        reconcile_indexes(collection_name: str) -> None:
+            Creates, rebuilds and drops indexes of a collection to match collection_indexes.
         create_collections() -> None:
             Creates the necessary collections in the MongoDB database.
+        creation_options(collection_name: str) -> dict:
+            Returns the create_collection options of a collection.
+        index_models(collection_name: str) -> list:
+            Builds the IndexModel list for a collection from collection_indexes.
+        create_indexes() -> dict:
+            Builds the secondary indexes of every collection and reports the build times.
     """
 
-    def __init__(self):
+    collection_options = {
+        "recipes_mongo": {
+            "validator": {
+                "$jsonSchema": {
+                    "bsonType": "object",
+                    "required": ["recipe_name", "ingredients", "steps"],
+                    "properties": {
+                        "recipe_name": {"bsonType": "string"},
+                        "cuisine": {"bsonType": "string"},
+                        "preparation_time": {"bsonType": "int", "minimum": 0},
+                        "system_rating": {"bsonType": "double", "minimum": 0, "maximum": 5},
+                        "is_rated": {"bsonType": "bool"},
+                        "expiration_date": {"bsonType": "date"},
+                        "ingredients": {
+                            "bsonType": "array",
+                            "items": {
+                                "bsonType": "object",
+                                "required": ["ingredient_id", "name", "quantity", "unit"],
+                                "properties": {
+                                    "ingredient_id": {"bsonType": "objectId"},
+                                    "name": {"bsonType": "string"},
+                                    "quantity": {"bsonType": "double", "minimum": 0},
+                                    "unit": {"bsonType": "string"}
+                                }
+                            }
+                        },
+                        "steps": {
+                            "bsonType": "array",
+                            "items": {"bsonType": "string"}
+                        },
+                        "images": {
+                            "bsonType": "array",
+                            "items": {"bsonType": "string"}
+                        },
+                        "video_url": {"bsonType": "string"},
+                        "ratings": {
+                            "bsonType": "array",
+                            "items": {
+                                "bsonType": "object",
+                                "required": ["user_id", "rating"],
+                                "properties": {
+                                    "user_id": {"bsonType": "objectId"},
+                                    "rating": {"bsonType": "double", "minimum": 0, "maximum": 5},
+                                    "review": {"bsonType": "string"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        "ingredients_mongo": {
+            "validator": {
+                "$jsonSchema": {
+                    "bsonType": "object",
+                    "required": ["name", "category", "unit", "value"],
+                    "properties": {
+                        "name": {"bsonType": "string"},
+                        "category": {"bsonType": "string"},
+                        "unit": {"bsonType": "string"},
+                        "value": {"bsonType": "double", "minimum": 0},
+                        "base_value": {"bsonType": "double", "minimum": 0},
+                        "base_unit": {"bsonType": "string"},
+                        "image_url": {"bsonType": "string"},
+                        "nutritional_info": {
+                            "bsonType": "object",
+                            "properties": {
+                                "calories": {"bsonType": "double"},
+                                "protein": {"bsonType": "string"},
+                                "fat": {"bsonType": "string"},
+                                "carbohydrates": {"bsonType": "string"}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        "household_ingredient_usage": {
+            "validator": {
+                "$jsonSchema": {
+                    "bsonType": "object",
+                    "required": ["household_id", "ingredient_id", "used_quantity", "unit", "used_at"],
+                    "properties": {
+                        "household_id": {"bsonType": "objectId"},
+                        "ingredient_id": {"bsonType": "objectId"},
+                        "used_quantity": {"bsonType": "double", "minimum": 0},
+                        "unit": {"bsonType": "string"},
+                        "used_at": {"bsonType": "date"}
+                    }
+                }
+            }
+        },
+        "recipe_ratings": {
+            "validator": {
+                "$jsonSchema": {
+                    "bsonType": "object",
+                    "required": ["user_id", "recipe_id", "rating"],
+                    "properties": {
+                        "user_id": {"bsonType": "objectId"},
+                        "recipe_id": {"bsonType": "objectId"},
+                        "rating": {"bsonType": "double", "minimum": 0, "maximum": 5},
+                        "review": {"bsonType": "string"}
+                    }
+                }
+            }
+        },
+        "user_preferences": {
+            "validator": {
+                "$jsonSchema": {
+                    "bsonType": "object",
+                    "required": ["user_id"],
+                    "properties": {
+                        "user_id": {"bsonType": "objectId"},
+                        "dietary_restrictions": {"bsonType": "array", "items": {"bsonType": "string"}},
+                        "preferred_cuisines": {"bsonType": "array", "items": {"bsonType": "string"}}
+                    }
+                }
+            }
+        }
+    }
+
+    # Collections stored as time-series collections when MONGO_USAGE_TIMESERIES is set. Their
+    # retention is a collection-level expireAfterSeconds instead of a TTL index.
+    timeseries_collections = {
+        "household_ingredient_usage": {
+            "timeseries": {"timeField": "used_at", "metaField": "household_id", "granularity": "hours"},
+            "retention_days_env": "MONGO_USAGE_RETENTION_DAYS"
+        }
+    }
+
+    # Secondary indexes, built by create_indexes() after the bulk load. Entries with a
+    # retention_days_env key are TTL indexes that are only built when that variable is set.
+    collection_indexes = {
+        "recipes_mongo": [
+            {"name": "recipe_id", "keys": [("recipe_id", 1)]},
+            {"name": "video_url", "keys": [("video_url", 1)]},
+            {
+                "name": "cuisine_rated_system_rating",
+                "keys": [("cuisine", 1), ("system_rating", -1)],
+                "partialFilterExpression": {"is_rated": True}
+            }
+        ],
+        "ingredients_mongo": [
+            {"name": "ingredient_id", "keys": [("ingredient_id", 1)]},
+            {"name": "image_url", "keys": [("image_url", 1)]}
+        ],
+        "household_ingredient_usage": [
+            {"name": "household_used_at", "keys": [("household_id", 1), ("used_at", -1)]},
+            {"name": "ingredient_id", "keys": [("ingredient_id", 1)]},
+            {"name": "used_at_ttl", "keys": [("used_at", 1)], "retention_days_env": "MONGO_USAGE_RETENTION_DAYS"}
+        ],
+        "recipe_ratings": [
+            {"name": "recipe_user", "keys": [("recipe_id", 1), ("user_id", 1)]},
+            {"name": "user_id", "keys": [("user_id", 1)]},
+            {
+                "name": "recipe_reviews",
+                "keys": [("recipe_id", 1)],
+                "partialFilterExpression": {"review": {"$exists": True}}
+            }
+        ],
+        "user_preferences": [
+            {"name": "user_id", "keys": [("user_id", 1)]}
+        ]
+    }
+
+    def __init__(self, mode=None, connections=None):
         """
         Initializes the MongoDBSetup class by loading environment variables and connecting to the database.
+
+        Args:
+            mode (str): "reset" drops and recreates the database, "reconcile" applies only the
+                differences to the existing database, and "connect" leaves it untouched, for
+                example to build indexes after the data load. Defaults to MONGO_SETUP_MODE, or "reset".
+            connections (ConnectionManager): Provides the shared MongoDB client. The class opens
+                its own client when None.
         """
         load_dotenv(override=True)
-        self.client = self.connect()
+        self.client = connections.mongo_client() if connections is not None else self.connect()
         self.db_name = os.getenv("MONGO_DB")
         self.db = self.client[self.db_name]
-        self.setup_database()
+        self.use_timeseries = os.getenv("MONGO_USAGE_TIMESERIES", "false").lower() in ("1", "true", "yes")
+        mode = mode or os.getenv("MONGO_SETUP_MODE", "reset")
+        if mode == "reset":
+            self.setup_database()
+        elif mode == "reconcile":
+            self.reconcile()
+        elif mode != "connect":
+            raise ValueError(f"Unknown MongoDB setup mode: {mode}")
 
     def connect(self):
         """
@@ -57,133 +247,157 @@ class MongoDBSetup:
         print(f"Created new database: {self.db_name}")
         self.create_collections()
 
+    def reconcile(self):
+        """
+        Brings the existing database in line with the desired validators and indexes.
+
+        Missing collections are created, changed validators are applied in place with collMod,
+        and indexes are reconciled one by one, so no data is dropped or reloaded.
+        """
+        existing = {info["name"]: info for info in self.db.list_collections()}
+        for collection_name, options in self.collection_options.items():
+            creation_options = self.creation_options(collection_name)
+            if collection_name not in existing:
+                self.db.create_collection(collection_name, **creation_options)
+                print(f"Created collection: {collection_name} with validation schema.")
+            elif ("timeseries" in creation_options) != (existing[collection_name].get("type") == "timeseries"):
+                print(f"Collection {collection_name} cannot be converted to or from a time-series "
+                      f"collection in place. Use the reset mode to recreate it.")
+            elif existing[collection_name].get("options", {}).get("validator") != options["validator"]:
+                self.db.command("collMod", collection_name, validator=options["validator"])
+                print(f"Updated validation schema of collection: {collection_name}")
+            if collection_name in existing and "expireAfterSeconds" in creation_options and \
+                    existing[collection_name].get("options", {}).get("expireAfterSeconds") != \
+                    creation_options["expireAfterSeconds"]:
+                self.db.command("collMod", collection_name, expireAfterSeconds=creation_options["expireAfterSeconds"])
+                print(f"Updated retention of collection: {collection_name}")
+            self.reconcile_indexes(collection_name)
+
+    def reconcile_indexes(self, collection_name):
+        """
+        Creates, rebuilds and drops indexes of a collection to match collection_indexes.
+
+        A changed TTL is applied in place with collMod. Any other change to an index drops and
+        rebuilds only that index. Indexes that are not in the spec are dropped, except _id_.
+
+        Args:
+            collection_name (str): The name of the collection.
+        """
+        collection = self.db[collection_name]
+        current = collection.index_information()
+        desired = {model.document["name"]: model for model in self.index_models(collection_name)}
+        compared = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+        to_create = []
+        for name, model in desired.items():
+            document = model.document
+            info = current.get(name)
+            if info is None:
+                to_create.append(model)
+                continue
+
+            keys = [(field, int(direction)) for field, direction in info["key"]]
+            changed = [option for option in compared if info.get(option) != document.get(option)]
+            if keys == list(document["key"].items()) and not changed:
+                continue
+            if keys == list(document["key"].items()) and changed == ["expireAfterSeconds"] \
+                    and "expireAfterSeconds" in info and "expireAfterSeconds" in document:
+                self.db.command("collMod", collection_name,
+                                index={"name": name, "expireAfterSeconds": document["expireAfterSeconds"]})
+                print(f"Updated TTL of index {name} on {collection_name}")
+                continue
+            collection.drop_index(name)
+            print(f"Dropped changed index {name} on {collection_name}")
+            to_create.append(model)
+
+        # Time-series collections come with an index on their meta and time fields.
+        protected = {"_id_"}
+        timeseries = self.creation_options(collection_name).get("timeseries")
+        if timeseries and "metaField" in timeseries:
+            protected.add(f"{timeseries['metaField']}_1_{timeseries['timeField']}_1")
+
+        for name in current:
+            if name not in protected and name not in desired:
+                collection.drop_index(name)
+                print(f"Dropped index {name} on {collection_name}")
+
+        if to_create:
+            start = time.perf_counter()
+            names = collection.create_indexes(to_create)
+            print(f"Built indexes {', '.join(names)} on {collection_name} in {time.perf_counter() - start:.2f}s")
+
     def create_collections(self):
         """
         Creates the necessary collections in the MongoDB database.
         """
-        collections = {
-            "recipes_mongo": {
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["recipe_name", "ingredients", "steps"],
-                        "properties": {
-                            "recipe_name": {"bsonType": "string"},
-                            "cuisine": {"bsonType": "string"},
-                            "preparation_time": {"bsonType": "int", "minimum": 0},
-                            "system_rating": {"bsonType": "double", "minimum": 0, "maximum": 5},
-                            "is_rated": {"bsonType": "bool"},
-                            "expiration_date": {"bsonType": "date"},
-                            "ingredients": {
-                                "bsonType": "array",
-                                "items": {
-                                    "bsonType": "object",
-                                    "required": ["ingredient_id", "name", "quantity", "unit"],
-                                    "properties": {
-                                        "ingredient_id": {"bsonType": "objectId"},
-                                        "name": {"bsonType": "string"},
-                                        "quantity": {"bsonType": "double", "minimum": 0},
-                                        "unit": {"bsonType": "string"}
-                                    }
-                                }
-                            },
-                            "steps": {
-                                "bsonType": "array",
-                                "items": {"bsonType": "string"}
-                            },
-                            "images": {
-                                "bsonType": "array",
-                                "items": {"bsonType": "string"}
-                            },
-                            "video_url": {"bsonType": "string"},
-                            "ratings": {
-                                "bsonType": "array",
-                                "items": {
-                                    "bsonType": "object",
-                                    "required": ["user_id", "rating"],
-                                    "properties": {
-                                        "user_id": {"bsonType": "objectId"},
-                                        "rating": {"bsonType": "double", "minimum": 0, "maximum": 5},
-                                        "review": {"bsonType": "string"}
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "ingredients_mongo": {
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["name", "category", "unit", "value"],
-                        "properties": {
-                            "name": {"bsonType": "string"},
-                            "category": {"bsonType": "string"},
-                            "unit": {"bsonType": "string"},
-                            "value": {"bsonType": "double", "minimum": 0},
-                            "image_url": {"bsonType": "string"},
-                            "nutritional_info": {
-                                "bsonType": "object",
-                                "properties": {
-                                    "calories": {"bsonType": "double"},
-                                    "protein": {"bsonType": "string"},
-                                    "fat": {"bsonType": "string"},
-                                    "carbohydrates": {"bsonType": "string"}
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "household_ingredient_usage": {
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["household_id", "ingredient_id", "used_quantity", "unit", "used_at"],
-                        "properties": {
-                            "household_id": {"bsonType": "objectId"},
-                            "ingredient_id": {"bsonType": "objectId"},
-                            "used_quantity": {"bsonType": "double", "minimum": 0},
-                            "unit": {"bsonType": "string"},
-                            "used_at": {"bsonType": "date"}
-                        }
-                    }
-                }
-            },
-            "recipe_ratings": {
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["user_id", "recipe_id", "rating"],
-                        "properties": {
-                            "user_id": {"bsonType": "objectId"},
-                            "recipe_id": {"bsonType": "objectId"},
-                            "rating": {"bsonType": "double", "minimum": 0, "maximum": 5},
-                            "review": {"bsonType": "string"}
-                        }
-                    }
-                }
-            },
-            "user_preferences": {
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["user_id"],
-                        "properties": {
-                            "user_id": {"bsonType": "objectId"},
-                            "dietary_restrictions": {"bsonType": "array", "items": {"bsonType": "string"}},
-                            "preferred_cuisines": {"bsonType": "array", "items": {"bsonType": "string"}}
-                        }
-                    }
-                }
-            }
-        }
-
-        for collection_name, options in collections.items():
-            self.db.create_collection(collection_name, **options)
+        for collection_name in self.collection_options:
+            self.db.create_collection(collection_name, **self.creation_options(collection_name))
             print(f"Created collection: {collection_name} with validation schema.")
 
+    def creation_options(self, collection_name):
+        """
+        Returns the create_collection options of a collection.
+
+        Args:
+            collection_name (str): The name of the collection.
+
+        Returns:
+            dict: The validator, plus the time-series options when time-series collections are enabled.
+        """
+        options = dict(self.collection_options[collection_name])
+        timeseries = self.timeseries_collections.get(collection_name)
+        if self.use_timeseries and timeseries:
+            options["timeseries"] = timeseries["timeseries"]
+            retention_days = os.getenv(timeseries["retention_days_env"])
+            if retention_days:
+                options["expireAfterSeconds"] = int(float(retention_days) * 86400)
+        return options
+
+    def index_models(self, collection_name):
+        """
+        Builds the IndexModel list for a collection from collection_indexes.
+
+        Args:
+            collection_name (str): The name of the collection.
+
+        Returns:
+            list: The IndexModel instances to build. TTL indexes whose retention variable is
+                not set, or whose collection is a time-series collection, are left out.
+        """
+        models = []
+        timeseries = self.use_timeseries and collection_name in self.timeseries_collections
+        for spec in self.collection_indexes.get(collection_name, []):
+            options = {key: value for key, value in spec.items() if key not in ("keys", "retention_days_env")}
+            retention_env = spec.get("retention_days_env")
+            if retention_env:
+                retention_days = os.getenv(retention_env)
+                if timeseries or not retention_days:
+                    continue
+                options["expireAfterSeconds"] = int(float(retention_days) * 86400)
+            models.append(IndexModel(spec["keys"], **options))
+        return models
+
+    def create_indexes(self):
+        """
+        Builds the secondary indexes of every collection and reports the build times.
+
+        All indexes of a collection are built together, which takes a single scan of the
+        collection, so this should run after the bulk load rather than before it.
+
+        Returns:
+            dict: Maps each collection name to its index build time in seconds.
+        """
+        timings = {}
+        for collection_name in self.collection_indexes:
+            models = self.index_models(collection_name)
+            if not models:
+                continue
+            start = time.perf_counter()
+            names = self.db[collection_name].create_indexes(models)
+            timings[collection_name] = time.perf_counter() - start
+            print(f"Built indexes {', '.join(names)} on {collection_name} in {timings[collection_name]:.2f}s")
+        return timings
+
 if __name__ == "__main__":
     mongo_setup = MongoDBSetup()
     mongo_setup.create_collections()
@@ -0,0 +1,478 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+try:
+    from .metrics import percentile
+    from .unit_registry import UnitRegistry
+except ImportError:
+    from metrics import percentile
+    from unit_registry import UnitRegistry
+
+PANTRY_QUERY = """
+    SELECT ingredient_id, quantity, unit
+    FROM household_ingredients
+    WHERE household_id = %s AND NOT is_expired
+        AND (expiration_date IS NULL OR expiration_date >= CURRENT_DATE)
+"""
+
+# The same scoring as PantryMatcher.match, computed by joining the tables in PostgreSQL on
+# the base unit columns filled in at load time.
+NAIVE_MATCH_QUERY = """
+    WITH stock AS (
+        SELECT ingredient_id, base_unit, SUM(base_quantity) AS quantity
+        FROM household_ingredients
+        WHERE household_id = %s AND NOT is_expired
+            AND (expiration_date IS NULL OR expiration_date >= CURRENT_DATE)
+        GROUP BY ingredient_id, base_unit
+    ), pantry AS (
+        SELECT DISTINCT ON (ingredient_id) ingredient_id, quantity, base_unit
+        FROM stock
+        ORDER BY ingredient_id, quantity DESC
+    )
+    SELECT recipe_id, score, have, total - have AS missing, enough
+    FROM (
+        SELECT ri.recipe_id, COUNT(*) AS total, COUNT(p.ingredient_id) AS have,
+            COUNT(*) FILTER (WHERE p.base_unit = ri.base_unit AND p.quantity >= ri.base_quantity) AS enough,
+            ROUND(((%s * COUNT(p.ingredient_id)
+             + %s * COUNT(*) FILTER (WHERE p.base_unit = ri.base_unit AND p.quantity >= ri.base_quantity))::float
+             / COUNT(*))::numeric, 9)::float AS score
+        FROM recipe_ingredients ri
+        LEFT JOIN pantry p ON p.ingredient_id = ri.ingredient_id
+        GROUP BY ri.recipe_id
+    ) AS matches
+    WHERE have > 0
+    ORDER BY score DESC, recipe_id
+    LIMIT %s
+"""
+
+
+# The latency the benchmark checks the median match against.
+MATCH_TARGET_MS = 1.0
+
+
+class PantryMatcher:
+    """
+    Ranks recipes by how well a household's pantry covers them, using an inverted ingredient index.
+
+    The index keeps, for every ingredient, the recipes that use it and the quantity and unit
+    they need, in flat NumPy arrays sorted by ingredient. Matching a pantry gathers the
+    postings of its ingredients and counts them per recipe with bincount, so the cost grows
+    with the postings of the pantry ingredients rather than with the number of recipes.
+
+    A recipe scores `coverage_weight` times the share of its ingredients the pantry has, plus
+    `sufficiency_weight` times the share the pantry has enough of. Quantities are compared in
+    their base units, so 1 kg in the pantry covers 200 g in a recipe.
+
+    Pantries whose postings are few compared to the number of recipes are counted by sorting
+    the postings instead, which avoids allocating counters for every recipe.
+
+    Common ingredients such as salt appear in a large share of all recipes, and gathering their
+    postings would dominate the match. Up to 64 of them are kept as one bitmask per recipe
+    instead, so how many of them a recipe has is a popcount over one array. Whether the pantry
+    has enough of them is only looked up for the recipes that can still reach the top scores:
+    the bitmask bounds every score from above and below, and only recipes whose upper bound
+    reaches the limit-th best lower bound are scored exactly.
+
+    The sub-millisecond target is not met at 100k recipes. With about 10 ingredients per recipe
+    drawn from a Zipf-like popularity and pantries of 15 to 40 ingredients, a match takes about
+    1.3 ms at the median, against 3 ms when every posting is gathered. What remains is a
+    handful of passes over the per-recipe arrays, which an exact score of every recipe needs.
+    The benchmark reports whether the median stays under MATCH_TARGET_MS.
+
+    Methods:
+        from_postgresql(connection) -> PantryMatcher:
+            Builds the index from the recipe_ingredients table.
+        household_pantry(connection, household_id: int) -> dict:
+            Reads the unexpired stock of a household in base units.
+        match(pantry: dict, limit: int, max_missing: int) -> list:
+            Returns the best scoring recipes for a pantry.
+        recipe_requirements(recipe_id: int) -> list:
+            Returns the ingredients, base quantities and base units of a recipe.
+    """
+
+    def __init__(self, rows, coverage_weight=0.7, sufficiency_weight=0.3, units=None):
+        """
+        Initializes the PantryMatcher and builds the index.
+
+        Args:
+            rows (iterable): (recipe_id, ingredient_id, quantity, unit) tuples, one per recipe ingredient.
+            coverage_weight (float): The weight of the share of ingredients the pantry has.
+            sufficiency_weight (float): The weight of the share of ingredients the pantry has enough of.
+            units (UnitRegistry): Converts quantities to base units. Defaults to a UnitRegistry.
+        """
+        self.coverage_weight = coverage_weight
+        self.sufficiency_weight = sufficiency_weight
+        self.units = units or UnitRegistry()
+        # Pantries with fewer postings than 1 / sparse_ratio of the recipes are counted by sorting.
+        self.sparse_ratio = 8
+        # Ingredients in at least 1 / head_ratio of the recipes are kept in the per-recipe bitmask,
+        # which is used once a pantry's common ingredients have bitmask_ratio postings per recipe.
+        self.head_ratio = 64
+        self.bitmask_ratio = 1
+
+        recipe_ids, ingredient_ids, quantities, units = [], [], [], []
+        for recipe_id, ingredient_id, quantity, unit in rows:
+            recipe_ids.append(recipe_id)
+            ingredient_ids.append(ingredient_id)
+            quantities.append(float(quantity))
+            units.append(unit)
+
+        recipe_ids = np.array(recipe_ids, dtype=np.int64)
+        ingredient_ids = np.array(ingredient_ids, dtype=np.int64)
+        # Rounded like the base_quantity columns, so comparisons agree with SQL on the same data.
+        quantities, units = self.units.to_base_arrays(quantities, units)
+        quantities = np.round(quantities, 4)
+
+        # Recipes are numbered densely, so the per-recipe counters are plain arrays.
+        self.recipe_ids, recipe_index = np.unique(recipe_ids, return_inverse=True)
+        recipe_index = recipe_index.astype(np.int32)
+        self.sizes = np.bincount(recipe_index, minlength=len(self.recipe_ids))
+
+        order = np.argsort(ingredient_ids, kind="stable")
+        self.posting_recipes = recipe_index[order]
+        self.posting_quantities = quantities[order]
+        self.posting_units = units[order]
+        sorted_ingredients = ingredient_ids[order]
+        keys, starts = np.unique(sorted_ingredients, return_index=True)
+        ends = np.append(starts[1:], len(sorted_ingredients))
+        self.postings = {int(key): (int(start), int(end)) for key, start, end in zip(keys, starts, ends)}
+
+        counts = ends - starts
+        head = [index for index in np.argsort(-counts, kind="stable")[:64]
+                if counts[index] * self.head_ratio >= len(self.recipe_ids)]
+        # np.bitwise_count needs NumPy 2.0. Older versions gather the postings of every ingredient.
+        if not hasattr(np, "bitwise_count"):
+            head = []
+        self.head_bits = {}
+        self.head_masks = np.zeros(len(self.recipe_ids), dtype=np.uint64)
+        # A bit counts an ingredient once per recipe, so recipes listing it more than once are
+        # kept aside with their extra count.
+        extra_recipes, extra_bits, extra_counts = [], [], []
+        for bit, index in enumerate(head):
+            bit = np.uint64(1 << bit)
+            self.head_bits[int(keys[index])] = bit
+            recipes, recipe_counts = np.unique(self.posting_recipes[starts[index]:ends[index]], return_counts=True)
+            self.head_masks[recipes] |= bit
+            repeated = recipe_counts > 1
+            extra_recipes.append(recipes[repeated])
+            extra_bits.append(np.full(np.count_nonzero(repeated), bit, dtype=np.uint64))
+            extra_counts.append((recipe_counts[repeated] - 1).astype(np.uint8))
+        self.head_extra_recipes = np.concatenate(extra_recipes) if head else np.empty(0, dtype=np.int32)
+        self.head_extra_bits = np.concatenate(extra_bits) if head else np.empty(0, dtype=np.uint64)
+        self.head_extra_counts = np.concatenate(extra_counts) if head else np.empty(0, dtype=np.uint8)
+        self.inverse_sizes = (1.0 / self.sizes).astype(np.float32)
+
+        # The forward index answers recipe_requirements without scanning the postings.
+        order = np.argsort(recipe_index, kind="stable")
+        self.requirement_ingredients = ingredient_ids[order]
+        self.requirement_quantities = quantities[order]
+        self.requirement_units = units[order]
+        self.requirement_starts = np.concatenate(([0], np.cumsum(self.sizes)))
+
+    @classmethod
+    def from_postgresql(cls, connection, **kwargs):
+        """
+        Builds the index from the recipe_ingredients table.
+
+        The rows are streamed through a server-side cursor.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+            **kwargs: Passed on to the constructor.
+
+        Returns:
+            PantryMatcher: The matcher.
+        """
+        start = time.perf_counter()
+        autocommit = connection.autocommit
+        connection.autocommit = False
+        try:
+            with connection.cursor(name="pantry_matcher_index") as cursor:
+                cursor.itersize = 50000
+                cursor.execute("SELECT recipe_id, ingredient_id, quantity, unit FROM recipe_ingredients")
+                matcher = cls(cursor, **kwargs)
+            connection.commit()
+        finally:
+            connection.autocommit = autocommit
+        print(f"Indexed {len(matcher.posting_recipes)} recipe ingredients of {len(matcher.recipe_ids)} recipes "
+              f"in {time.perf_counter() - start:.2f}s")
+        return matcher
+
+    def household_pantry(self, connection, household_id):
+        """
+        Reads the unexpired stock of a household in base units.
+
+        Stock of the same ingredient in the same base unit is added up. When an ingredient is
+        stocked in units that do not convert into each other, the largest amount is used.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+            household_id (int): The household.
+
+        Returns:
+            dict: Maps each ingredient id to its (quantity, base unit).
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(PANTRY_QUERY, (household_id,))
+            rows = cursor.fetchall()
+
+        stock = {}
+        for ingredient_id, quantity, unit in rows:
+            base_quantity, base_unit = self.units.to_base(quantity, unit)
+            stock[ingredient_id, base_unit] = stock.get((ingredient_id, base_unit), 0.0) + round(base_quantity, 4)
+        pantry = {}
+        for (ingredient_id, base_unit), quantity in stock.items():
+            if ingredient_id not in pantry or quantity > pantry[ingredient_id][0]:
+                pantry[ingredient_id] = (quantity, base_unit)
+        return pantry
+
+    def match(self, pantry, limit=10, max_missing=None):
+        """
+        Returns the best scoring recipes for a pantry.
+
+        Args:
+            pantry (dict): Maps ingredient ids to their (quantity, unit), in any unit the registry knows.
+            limit (int): The number of recipes returned.
+            max_missing (int): Leave out recipes missing more ingredients than this.
+
+        Returns:
+            list: One dict per recipe with its recipe_id, score, have, missing and enough counts,
+                best first. Only recipes sharing at least one ingredient with the pantry are returned.
+        """
+        recipes, sufficient, head = [], [], []
+        head_bits, head_postings = np.uint64(0), 0
+        for ingredient_id, (quantity, unit) in pantry.items():
+            span = self.postings.get(ingredient_id)
+            if span is None:
+                continue
+            quantity, base_unit = self.units.to_base(quantity, unit)
+            code, quantity = self.units.base_codes.get(base_unit, -1), round(quantity, 4)
+            if ingredient_id in self.head_bits:
+                head_bits |= self.head_bits[ingredient_id]
+                head_postings += span[1] - span[0]
+                head.append((ingredient_id, span, code, quantity))
+            else:
+                recipes.append(self.posting_recipes[span[0]:span[1]])
+                sufficient.append((self.posting_units[span[0]:span[1]] == code)
+                                  & (self.posting_quantities[span[0]:span[1]] <= quantity))
+        if head_postings < self.bitmask_ratio * len(self.recipe_ids):
+            # Few common postings: gathering them is cheaper than passes over every recipe.
+            for _, (start, end), code, quantity in head:
+                recipes.append(self.posting_recipes[start:end])
+                sufficient.append((self.posting_units[start:end] == code) & (self.posting_quantities[start:end] <= quantity))
+            head = []
+        if not recipes and not head:
+            return []
+
+        recipes = np.concatenate(recipes) if recipes else np.empty(0, dtype=np.int32)
+        sufficient = np.concatenate(sufficient) if sufficient else np.empty(0, dtype=bool)
+        if head:
+            candidates, have, enough = self.bounded_candidates(recipes, sufficient, head, head_bits, limit, max_missing)
+        elif len(recipes) * self.sparse_ratio < len(self.recipe_ids):
+            # Few postings: sorting them is cheaper than counters sized to every recipe.
+            candidates, inverse, have = np.unique(recipes, return_inverse=True, return_counts=True)
+            enough = np.bincount(inverse, weights=sufficient, minlength=len(candidates))
+        else:
+            have = np.bincount(recipes, minlength=len(self.recipe_ids))
+            candidates = np.flatnonzero(have)
+            enough = np.bincount(recipes, weights=sufficient, minlength=len(self.recipe_ids))[candidates]
+            have = have[candidates]
+        sizes = self.sizes[candidates]
+        missing = sizes - have
+        # Rounded so floating point noise does not reorder recipes with equal scores.
+        scores = np.round((self.coverage_weight * have + self.sufficiency_weight * enough) / sizes, 9)
+
+        if max_missing is not None:
+            keep = missing <= max_missing
+            candidates, scores, have, missing, enough = (
+                candidates[keep], scores[keep], have[keep], missing[keep], enough[keep]
+            )
+        if len(candidates) > limit:
+            # Everything scoring at least the limit-th best score, so ties at the cut are kept.
+            threshold = -np.partition(-scores, limit - 1)[limit - 1]
+            top = np.flatnonzero(scores >= threshold)
+        else:
+            top = np.arange(len(candidates))
+        # Ties are broken by recipe id so results are stable.
+        top = top[np.lexsort((self.recipe_ids[candidates[top]], -scores[top]))][:limit]
+
+        return [
+            {
+                "recipe_id": int(self.recipe_ids[candidates[i]]),
+                "score": float(scores[i]),
+                "have": int(have[i]),
+                "missing": int(missing[i]),
+                "enough": int(enough[i])
+            }
+            for i in top
+        ]
+
+    def bounded_candidates(self, recipes, sufficient, head, head_bits, limit, max_missing):
+        """
+        Returns the recipes that can reach the top scores of a pantry with common ingredients.
+
+        How many of the pantry's common ingredients a recipe has comes from the bitmask, but
+        not whether the pantry has enough of them. Counting none of them as enough bounds the
+        score from below and counting all of them bounds it from above, so a recipe whose upper
+        bound is below the limit-th best lower bound cannot make the cut. The requirements of
+        the rest are compared with the pantry through the forward index.
+
+        Args:
+            recipes (numpy.ndarray): The recipe indexes of the postings of the other pantry ingredients.
+            sufficient (numpy.ndarray): Whether the pantry has enough for each of those postings.
+            head (list): (ingredient id, posting span, base unit code, base quantity) of every
+                common pantry ingredient.
+            head_bits (numpy.uint64): The bits of the common pantry ingredients.
+            limit (int): The number of recipes returned by match.
+            max_missing (int): Leave out recipes missing more ingredients than this.
+
+        Returns:
+            tuple: The candidate recipe indexes, and how many of their ingredients the pantry has
+                and has enough of.
+        """
+        head_have = np.bitwise_count(self.head_masks & head_bits)
+        repeated = (self.head_extra_bits & head_bits) != 0
+        np.add.at(head_have, self.head_extra_recipes[repeated], self.head_extra_counts[repeated])
+        have = np.bincount(recipes, minlength=len(self.recipe_ids))
+        have += head_have
+        enough = np.bincount(recipes[sufficient], minlength=len(self.recipe_ids))
+        valid = have > 0
+        if max_missing is not None:
+            valid &= self.sizes - have <= max_missing
+
+        if np.count_nonzero(valid) > limit:
+            # The bounds only prune, so float32 is precise enough with a margin well above its rounding error.
+            lower = have.astype(np.float32)
+            lower *= self.coverage_weight
+            lower += self.sufficiency_weight * enough.astype(np.float32)
+            lower *= self.inverse_sizes
+            upper = head_have.astype(np.float32)
+            upper *= self.sufficiency_weight
+            upper *= self.inverse_sizes
+            upper += lower
+            lower *= valid
+            threshold = np.partition(lower, len(lower) - limit)[len(lower) - limit]
+            margin = 1e-5 * (self.coverage_weight + self.sufficiency_weight)
+            candidates = np.flatnonzero(valid & (upper >= threshold - margin))
+        else:
+            candidates = np.flatnonzero(valid)
+        have, enough = have[candidates], enough[candidates]
+        if not len(candidates):
+            return candidates, have, enough
+
+        # The requirements of the candidates, read from the forward index, are matched against
+        # the common pantry ingredients.
+        head.sort()
+        head_ids = np.array([ingredient_id for ingredient_id, _, _, _ in head], dtype=np.int64)
+        head_codes = np.array([code for _, _, code, _ in head])
+        head_quantities = np.array([quantity for _, _, _, quantity in head])
+        sizes = self.sizes[candidates]
+        offsets = np.cumsum(sizes) - sizes
+        rows = np.arange(offsets[-1] + sizes[-1]) + np.repeat(self.requirement_starts[candidates] - offsets, sizes)
+        ingredients = self.requirement_ingredients[rows]
+        positions = np.minimum(np.searchsorted(head_ids, ingredients), len(head_ids) - 1)
+        hits = ((head_ids[positions] == ingredients) & (self.requirement_units[rows] == head_codes[positions])
+                & (self.requirement_quantities[rows] <= head_quantities[positions]))
+        enough += np.add.reduceat(hits.astype(np.int64), offsets)
+        return candidates, have, enough
+
+    def recipe_requirements(self, recipe_id):
+        """
+        Returns the ingredients, base quantities and base units of a recipe.
+
+        Args:
+            recipe_id (int): The recipe.
+
+        Returns:
+            list: (ingredient_id, quantity, base unit) tuples, empty for an unknown recipe.
+        """
+        index = np.searchsorted(self.recipe_ids, recipe_id)
+        if index >= len(self.recipe_ids) or self.recipe_ids[index] != recipe_id:
+            return []
+        start, end = self.requirement_starts[index], self.requirement_starts[index + 1]
+        unit_names = {code: unit for unit, code in self.units.base_codes.items()}
+        return [
+            (int(ingredient_id), float(quantity), unit_names[int(unit)])
+            for ingredient_id, quantity, unit in zip(
+                self.requirement_ingredients[start:end],
+                self.requirement_quantities[start:end],
+                self.requirement_units[start:end]
+            )
+        ]
+
+
+def benchmark(connection, households=50, limit=10):
+    """
+    Times PantryMatcher.match against the equivalent SQL join for a sample of households.
+
+    Both sides return the same recipes in the same order. The time to read a household's pantry is not
+    counted for the matcher, since the join reads it as part of the query.
+
+    Args:
+        connection (psycopg2.extensions.connection): A connection to the database.
+        households (int): The number of households sampled.
+        limit (int): The number of recipes returned per household.
+
+    Returns:
+        dict: The p50 and p95 latency in milliseconds of both approaches.
+    """
+    matcher = PantryMatcher.from_postgresql(connection)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT household_id FROM household_ingredients ORDER BY household_id LIMIT %s",
+                       (households,))
+        household_ids = [row[0] for row in cursor.fetchall()]
+
+    engine_times, sql_times, mismatches = [], [], 0
+    for household_id in household_ids:
+        pantry = matcher.household_pantry(connection, household_id)
+        start = time.perf_counter()
+        matches = matcher.match(pantry, limit)
+        engine_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(NAIVE_MATCH_QUERY,
+                           (household_id, matcher.coverage_weight, matcher.sufficiency_weight, limit))
+            rows = cursor.fetchall()
+        sql_times.append(time.perf_counter() - start)
+
+        if [match["recipe_id"] for match in matches] != [row[0] for row in rows]:
+            mismatches += 1
+
+    results = {}
+    for name, times in (("matcher", engine_times), ("sql_join", sql_times)):
+        times.sort()
+        results[name] = {"p50_ms": percentile(times, 50) * 1000, "p95_ms": percentile(times, 95) * 1000}
+        print(f"{name}: p50 {results[name]['p50_ms']:.3f} ms, p95 {results[name]['p95_ms']:.3f} ms "
+              f"over {len(times)} households")
+    if mismatches:
+        print(f"Warning: {mismatches} households got different recipes from the SQL join.")
+    if results["matcher"]["p50_ms"] >= MATCH_TARGET_MS:
+        print(f"Warning: the matcher's p50 misses the {MATCH_TARGET_MS:.1f} ms target.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks pantry matching against the SQL join.")
+    parser.add_argument("--households", type=int, default=50, help="The number of households sampled.")
+    parser.add_argument("--limit", type=int, default=10, help="The number of recipes per household.")
+    args = parser.parse_args()
+
+    load_dotenv(override=True)
+    connection = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB", "smart_kitchen_helper"),
+        user=os.getenv("POSTGRES_USERNAME"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT")
+    )
+    connection.autocommit = True
+    try:
+        benchmark(connection, args.households, args.limit)
+    finally:
+        connection.close()
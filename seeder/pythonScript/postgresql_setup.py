@@ -5,60 +5,210 @@ Created on Thu Aug 15 18:17:06 2024
 @author: Amitr
 """
 
+import argparse
+import hashlib
+import json
+import time
+from datetime import date
 import psycopg2
 from psycopg2 import sql
 import os
 from dotenv import load_dotenv
 
+try:
+    from .schema_migration import SchemaMigrator
+    from .schema_models import INDEXES, TABLES
+except ImportError:
+    from schema_migration import SchemaMigrator
+    from schema_models import INDEXES, TABLES
+
 class PostgreSQLSetup:
     """
     Manages PostgreSQL database setup, including checking if the database exists,
     and creating tables if they do not already exist.
     
     Methods:
-        connect() -> psycopg2.extensions.connection:
-            Establishes a connection to the PostgreSQL database.
+        connect(dbname: str) -> psycopg2.extensions.connection:
+            Establishes a connection to a PostgreSQL database.
+        connect_target() -> psycopg2.extensions.connection:
+            Connects to the target database, through the shared pool when there is one.
+        close() -> None:
+            Releases the connection.
         create_database() -> None:
             Creates the database if it does not exist.
+        run_setup() -> None:
+            Applies the schema unless the stored fingerprint shows it is already in place.
+        unpartitioned_history_tables() -> list:
+            Lists the history tables that exist as plain, unpartitioned tables.
+        convert_history_tables() -> list:
+            Converts plain history tables into monthly partitioned tables, keeping their rows.
+        schema_statements() -> list:
+            Returns the DDL statements that make up the schema.
+        default_partition_statement(table: str) -> str:
+            Returns the statement creating the default partition of a history table.
+        schema_fingerprint(statements: list) -> str:
+            Returns the SHA-256 hash of the DDL statements.
+        stored_fingerprint() -> str:
+            Returns the fingerprint of the last applied schema.
+        apply_schema(statements: list, fingerprint: str) -> None:
+            Applies the DDL statements and stores their fingerprint in one transaction.
+        migrate(dry_run: bool) -> list:
+            Alters an existing schema to match the table models with online-safe statements.
         create_tables() -> None:
             Creates the necessary tables in the PostgreSQL database.
+        partition_statements(months_ahead: int) -> list:
+            Returns the statements creating the monthly partitions of the history tables.
+        ensure_partitions(months_ahead: int) -> int:
+            Creates the monthly partitions of the history tables up to a few months ahead.
+        create_partition(table: str, partition: str, start: date, end: date) -> int:
+            Creates a monthly partition, moving its rows out of the default partition.
+        maintain_partitions(interval: float, iterations: int) -> None:
+            Keeps the partitions up to date at a regular interval.
+        drop_expired_partitions(retention_months: int) -> None:
+            Drops the monthly partitions that are older than the retention window.
+        create_indexes() -> None:
+            Creates the secondary indexes, meant to run after the bulk load.
+        verify_indexes() -> list:
+            Checks with EXPLAIN that the key queries use their indexes.
+        unindexed_foreign_keys() -> list:
+            Lists the foreign key columns that no index starts with.
         execute_query(query: str) -> None:
             Executes a given SQL query on the PostgreSQL database.
     """
 
-    def __init__(self):
+    # The DDL is generated from the table models in schema_models, which SchemaMigrator
+    # also uses to migrate existing databases.
+    table_queries = [table.create_sql() for table in TABLES]
+
+    schema_metadata_query = """
+        CREATE TABLE IF NOT EXISTS schema_metadata (
+            key VARCHAR(50) PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+
+    # Monthly range-partitioned versions of the high-volume history tables, used instead of
+    # the plain tables above when PARTITION_HISTORY_TABLES is set. The partition key has to be
+    # part of the primary key, and rows outside every monthly partition go to the default one.
+    partitioned_table_queries = {
+        table.name: table.create_sql(partitioned=True) for table in TABLES if table.partition_key
+    }
+
+    index_queries = [index.create_sql() for index in INDEXES]
+
+    # The key queries of the application and the index each of them is expected to use.
+    index_checks = [
+        (
+            "idx_household_ingredients_household_expiration",
+            "SELECT * FROM household_ingredients WHERE household_id = 1 "
+            "AND expiration_date <= CURRENT_DATE + 7 ORDER BY expiration_date"
+        ),
+        (
+            "idx_household_ingredients_unexpired",
+            "SELECT household_ingredient_id FROM household_ingredients "
+            "WHERE NOT is_expired AND expiration_date < CURRENT_DATE"
+        ),
+        (
+            "idx_ingredient_prices_latest",
+            "SELECT price, unit FROM ingredient_prices WHERE ingredient_id = 1 AND store_id = 1 "
+            "ORDER BY last_updated DESC LIMIT 1"
+        ),
+        (
+            "idx_ingredient_prices_last_updated",
+            "SELECT ingredient_id, store_id, price, unit, last_updated FROM ingredient_prices "
+            "WHERE last_updated > CURRENT_TIMESTAMP - INTERVAL '1 hour' ORDER BY last_updated"
+        ),
+        (
+            "idx_recipe_ingredients_recipe_id",
+            "SELECT ingredient_id, quantity, unit FROM recipe_ingredients WHERE recipe_id = 1"
+        ),
+        (
+            "idx_user_recipe_history_user_id",
+            "SELECT recipe_id, cooked_at FROM user_recipe_history WHERE user_id = 1"
+        ),
+        (
+            "idx_household_users_user_id",
+            "SELECT household_id FROM household_users WHERE user_id = 1"
+        )
+    ]
+
+    def __init__(self, connections=None):
         """
         Initializes the PostgreSQLSetup class by loading environment variables and connecting to the database.
+
+        Args:
+            connections (ConnectionManager): Provides a pooled connection to the target database.
+                The class opens its own connection when None.
         """
         load_dotenv(override=True)
-        self.connection = self.connect()
-        self.create_database()
+        self.partition_history = os.getenv("PARTITION_HISTORY_TABLES", "false").lower() in ("1", "true", "yes")
+        self.connections = connections
+        # Connect to the target database directly, and only go through the default
+        # database when it still has to be created.
+        try:
+            self.connection = self.connect_target()
+        except psycopg2.OperationalError as e:
+            if "does not exist" not in str(e):
+                raise
+            self.connection = self.connect("postgres")
+            self.create_database()
+
+    def connect_target(self):
+        """
+        Connects to the target database, through the shared pool when there is one.
+
+        Returns:
+            connection (psycopg2.extensions.connection): A connection to the target database.
+        """
+        if self.connections is not None:
+            return self.connections.getconn()
+        return self.connect("smart_kitchen_helper")
 
-    def connect(self):
+    def close(self):
         """
-        Establishes a connection to the PostgreSQL database.
+        Releases the connection, returning it to the shared pool when there is one.
+        """
+        if self.connections is not None:
+            self.connections.putconn(self.connection)
+        else:
+            self.connection.close()
+
+    def connect(self, dbname="smart_kitchen_helper"):
+        """
+        Establishes a connection to a PostgreSQL database.
+
+        Args:
+            dbname (str): The database to connect to.
 
         Returns:
             connection (psycopg2.extensions.connection): A connection to the PostgreSQL database.
         """
         try:
             connection = psycopg2.connect(
-                dbname="postgres",  # Connect to the default database first
+                dbname=dbname,
                 user=os.getenv("POSTGRES_USERNAME"),
                 password=os.getenv("POSTGRES_PASSWORD"),
                 host=os.getenv("POSTGRES_HOST"),
                 port=os.getenv("POSTGRES_PORT")
             )
             connection.autocommit = True
-            print("Connected to PostgreSQL.")
+            print(f"Connected to PostgreSQL database '{dbname}'.")
             return connection
+        except psycopg2.OperationalError as e:
+            if "does not exist" in str(e):
+                print(f"Database '{dbname}' does not exist yet.")
+            else:
+                print(f"Error connecting to PostgreSQL: {e}")
+            raise
         except Exception as e:
             print(f"Error connecting to PostgreSQL: {e}")
             raise
 
     def create_database(self):
         """
-        Creates the 'smart_kitchen_helper' database if it does not already exist.
+        Creates the 'smart_kitchen_helper' database if it does not already exist,
+        and reconnects to it.
         """
         try:
             with self.connection.cursor() as cursor:
@@ -76,15 +226,7 @@ class PostgreSQLSetup:
 
         # Reconnect to the new database
         self.connection.close()
-        self.connection = psycopg2.connect(
-            dbname="smart_kitchen_helper",
-            user=os.getenv("POSTGRES_USERNAME"),
-            password=os.getenv("POSTGRES_PASSWORD"),
-            host=os.getenv("POSTGRES_HOST"),
-            port=os.getenv("POSTGRES_PORT")
-        )
-        self.connection.autocommit = True
-        print("Reconnected to 'smart_kitchen_helper' database.")
+        self.connection = self.connect_target()
 
     def execute_query(self, query: str):
         """
@@ -101,128 +243,563 @@ class PostgreSQLSetup:
             print(f"Error executing query: {e}")
             raise
 
-    def create_tables(self):
+    def run_setup(self):
         """
-        Creates the necessary tables in the PostgreSQL database.
+        Applies the schema unless the stored fingerprint shows it is already in place.
+
+        An unchanged schema costs a single query. A new database gets the whole schema in one
+        transaction. An existing database whose schema changed is first migrated to the table
+        models with online-safe ALTER statements, since CREATE TABLE IF NOT EXISTS does not
+        change tables that already exist. With partitioned history tables, the monthly
+        partitions that became due since the last run are created on every run afterwards.
+
+        Raises:
+            RuntimeError: If history tables are partitioned but exist as plain tables, which
+                CREATE TABLE IF NOT EXISTS would leave unpartitioned. Convert them first with
+                convert_history_tables.
         """
-        queries = [
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL CHECK (email LIKE '%@%.%'),
-                password_hash VARCHAR(255) NOT NULL,
-                role VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS households (
-                household_id SERIAL PRIMARY KEY,
-                household_name VARCHAR(100) UNIQUE NOT NULL,
-                address VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS household_users (
-                household_user_id SERIAL PRIMARY KEY,
-                household_id INT REFERENCES households(household_id) NOT NULL,
-                user_id INT REFERENCES users(user_id) NOT NULL,
-                role VARCHAR(20) DEFAULT 'member'
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS ingredient_categories (
-                category_id SERIAL PRIMARY KEY,
-                category_name VARCHAR(50) UNIQUE NOT NULL
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS ingredients (
-                ingredient_id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                category_id INT REFERENCES ingredient_categories(category_id) ON DELETE SET NULL
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS stores (
-                store_id SERIAL PRIMARY KEY,
-                store_name VARCHAR(100) NOT NULL,
-                address VARCHAR(255) NOT NULL,
-                rating DECIMAL(2,1) CHECK (rating >= 0 AND rating <= 5),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS ingredient_prices (
-                price_id SERIAL PRIMARY KEY,
-                ingredient_id INT REFERENCES ingredients(ingredient_id) NOT NULL,
-                store_id INT REFERENCES stores(store_id) NOT NULL,
-                price DECIMAL(10,2) NOT NULL CHECK (price >= 0),
-                unit VARCHAR(50) NOT NULL,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS household_ingredients (
-                household_ingredient_id SERIAL PRIMARY KEY,
-                household_id INT REFERENCES households(household_id) NOT NULL,
-                ingredient_id INT REFERENCES ingredients(ingredient_id) NOT NULL,
-                quantity DECIMAL(10,2) NOT NULL CHECK (quantity >= 0),
-                unit VARCHAR(50) NOT NULL,
-                expiration_date DATE CHECK (expiration_date > CURRENT_DATE),
-                is_expired BOOLEAN DEFAULT FALSE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS recipes (
-                recipe_id SERIAL PRIMARY KEY,
-                recipe_name VARCHAR(100) NOT NULL,
-                cuisine VARCHAR(50),
-                preparation_time INT CHECK (preparation_time >= 0),
-                system_rating DECIMAL(2,1) CHECK (system_rating >= 0 AND system_rating <= 5),
-                is_rated BOOLEAN DEFAULT FALSE,
-                expiration_date DATE CHECK (expiration_date > CURRENT_DATE),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        statements = self.schema_statements()
+        fingerprint = self.schema_fingerprint(statements)
+        stored = self.stored_fingerprint()
+        if stored == fingerprint:
+            print("Schema is up to date, skipping DDL.")
+        else:
+            if self.partition_history:
+                plain = self.unpartitioned_history_tables()
+                if plain:
+                    raise RuntimeError(
+                        f"PARTITION_HISTORY_TABLES is set, but {', '.join(plain)} already exist as plain tables. "
+                        "Convert them with 'python postgresql_setup.py --convert-history' first."
+                    )
+            if stored is not None:
+                self.migrate()
+            self.apply_schema(statements, fingerprint)
+        if self.partition_history:
+            self.ensure_partitions()
+
+    def unpartitioned_history_tables(self):
+        """
+        Lists the history tables that exist as plain, unpartitioned tables.
+
+        Returns:
+            list: The names of the history tables whose relkind is an ordinary table.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname = ANY(%s) "
+                "ORDER BY c.relname",
+                (list(self.partitioned_table_queries),)
             )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS recipe_ingredients (
-                recipe_ingredient_id SERIAL PRIMARY KEY,
-                recipe_id INT REFERENCES recipes(recipe_id) NOT NULL,
-                ingredient_id INT REFERENCES ingredients(ingredient_id) NOT NULL,
-                quantity DECIMAL(10,2) NOT NULL CHECK (quantity >= 0),
-                unit VARCHAR(50) NOT NULL
+            return [row[0] for row in cursor.fetchall()]
+
+    def convert_history_tables(self):
+        """
+        Converts plain history tables into monthly partitioned tables, keeping their rows.
+
+        Each table is converted in its own transaction. The plain table and its indexes and
+        sequences are renamed out of the way, the partitioned table and its partitions are
+        created under the original names, the rows are copied over and the plain table is
+        dropped. Rows without a partition key get the current time, as the key is NOT NULL
+        on a partitioned table. The table is locked while it is copied.
+
+        Returns:
+            list: The names of the converted tables.
+        """
+        converted = []
+        if not self.partition_history:
+            print("PARTITION_HISTORY_TABLES is not set, leaving the history tables unpartitioned.")
+            return converted
+        tables = {table.name: table for table in TABLES}
+        statements = self.partition_statements()
+        for name in self.unpartitioned_history_tables():
+            table = tables[name]
+            old = f"{name}_unpartitioned"
+            columns = sql.SQL(", ").join(sql.Identifier(column.name) for column in table.columns)
+            values = sql.SQL(", ").join(
+                sql.SQL("COALESCE({}, CURRENT_TIMESTAMP)").format(sql.Identifier(column.name))
+                if column.name == table.partition_key else sql.Identifier(column.name)
+                for column in table.columns
             )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_recipe_history (
-                history_id SERIAL PRIMARY KEY,
-                user_id INT REFERENCES users(user_id) NOT NULL,
-                recipe_id INT REFERENCES recipes(recipe_id) NOT NULL,
-                cooked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            serials = [column.name for column in table.columns if column.type == "SERIAL"]
+            start = time.perf_counter()
+            self.connection.autocommit = False
+            try:
+                with self.connection, self.connection.cursor() as cursor:
+                    cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(name)))
+                    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+                                   "AND tablename = %s", (name,))
+                    indexes = [row[0] for row in cursor.fetchall()]
+                    cursor.execute("SELECT pg_get_serial_sequence(%s, column_name) FROM unnest(%s::text[]) AS column_name",
+                                   (name, serials))
+                    sequences = [row[0] for row in cursor.fetchall() if row[0]]
+
+                    # Free the names of the table, its indexes and sequences for the new table.
+                    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(name), sql.Identifier(old)))
+                    for index in indexes:
+                        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                            sql.Identifier(index), sql.Identifier(f"{index}_unpartitioned"[:63])))
+                    for sequence in sequences:
+                        schema, _, sequence_name = sequence.rpartition(".")
+                        cursor.execute(sql.SQL("ALTER SEQUENCE {} RENAME TO {}").format(
+                            sql.Identifier(schema, sequence_name) if schema else sql.Identifier(sequence_name),
+                            sql.Identifier(f"{sequence_name}_unpartitioned"[:63])))
+
+                    cursor.execute(self.partitioned_table_queries[name])
+                    for statement in statements:
+                        if f" PARTITION OF {sql.Identifier(name).as_string(self.connection)} " in statement:
+                            cursor.execute(statement)
+                    cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                        sql.Identifier(name), columns, values, sql.Identifier(old)))
+                    copied = cursor.rowcount
+                    for column in serials:
+                        cursor.execute(sql.SQL(
+                            "SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({}), 0) + 1, false) FROM {}"
+                        ).format(sql.Identifier(column), sql.Identifier(name)), (name, column))
+                    cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(old)))
+                    for index in INDEXES:
+                        if index.table == name:
+                            cursor.execute(index.create_sql())
+            except Exception as e:
+                print(f"Error converting {name} to a partitioned table: {e}")
+                raise
+            finally:
+                self.connection.autocommit = True
+            converted.append(name)
+            print(f"Converted {name} to a partitioned table with {copied} rows "
+                  f"in {time.perf_counter() - start:.2f}s.")
+        return converted
+
+    def schema_statements(self):
+        """
+        Returns the DDL statements that make up the schema.
+
+        Only the structure is included, so the statements do not depend on the date. The
+        monthly partitions of partitioned history tables are left to ensure_partitions.
+
+        Returns:
+            list: The CREATE TABLE statements, followed by the default partitions when the
+                history tables are partitioned.
+        """
+        statements = []
+        for query in self.table_queries:
+            if self.partition_history:
+                table = query.split("EXISTS", 1)[1].split("(", 1)[0].strip()
+                query = self.partitioned_table_queries.get(table, query)
+            statements.append(query)
+        if self.partition_history:
+            statements.extend(self.default_partition_statement(table) for table in self.partitioned_table_queries)
+        return statements
+
+    def default_partition_statement(self, table):
+        """
+        Returns the statement creating the default partition of a history table.
+
+        Args:
+            table (str): The partitioned table.
+
+        Returns:
+            str: The CREATE TABLE IF NOT EXISTS ... DEFAULT statement.
+        """
+        return sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT").format(
+            sql.Identifier(f"{table}_default"), sql.Identifier(table)).as_string(self.connection)
+
+    def schema_fingerprint(self, statements):
+        """
+        Returns the SHA-256 hash of the DDL statements.
+
+        Whitespace is collapsed first, so reformatting a statement does not change the hash.
+        The statements hold no monthly partitions, so the fingerprint does not change when
+        new partitions are due.
+
+        Args:
+            statements (list): The DDL statements.
+
+        Returns:
+            str: The hex digest.
+        """
+        digest = hashlib.sha256()
+        for statement in statements:
+            digest.update(" ".join(statement.split()).encode("utf-8"))
+            digest.update(b";")
+        return digest.hexdigest()
+
+    def stored_fingerprint(self):
+        """
+        Returns the fingerprint of the last applied schema.
+
+        Returns:
+            str: The stored fingerprint, or None if no schema was applied yet.
+        """
+        with self.connection.cursor() as cursor:
+            try:
+                cursor.execute("SELECT value FROM schema_metadata WHERE key = 'ddl_fingerprint'")
+            except psycopg2.errors.UndefinedTable:
+                return None
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def apply_schema(self, statements, fingerprint):
+        """
+        Applies the DDL statements and stores their fingerprint in one transaction.
+
+        Either every statement is applied together with the new fingerprint, or none is.
+
+        Args:
+            statements (list): The DDL statements.
+            fingerprint (str): The fingerprint of the statements.
+        """
+        start = time.perf_counter()
+        self.connection.autocommit = False
+        try:
+            with self.connection, self.connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(self.schema_metadata_query)
+                cursor.execute(
+                    "INSERT INTO schema_metadata (key, value) VALUES ('ddl_fingerprint', %s) "
+                    "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP",
+                    (fingerprint,)
+                )
+        except Exception as e:
+            print(f"Error applying schema: {e}")
+            raise
+        finally:
+            self.connection.autocommit = True
+        print(f"Applied {len(statements)} schema statements in one transaction "
+              f"in {time.perf_counter() - start:.2f}s.")
+
+    def migrate(self, dry_run=False):
+        """
+        Alters an existing schema to match the table models with online-safe statements.
+
+        Args:
+            dry_run (bool): Only print the statements.
+
+        Returns:
+            list: The MigrationStep list of the plan.
+        """
+        return SchemaMigrator(self.connection, partition_history=self.partition_history).apply(dry_run)
+
+    def create_tables(self):
+        """
+        Creates the necessary tables in the PostgreSQL database.
+        """
+        for query in self.schema_statements():
+            self.execute_query(query)
+
+        print("All necessary tables have been created.")
+
+    def partition_statements(self, months_ahead=None):
+        """
+        Returns the statements creating the monthly partitions of the history tables.
+
+        Args:
+            months_ahead (int): The number of future months to create. Defaults to
+                PARTITION_MONTHS_AHEAD, or 3.
+
+        Returns:
+            list: A default partition per table, and one partition per month from the start
+                of the retention window.
+        """
+        statements = []
+        for table, partition, start, end in self.partition_bounds(months_ahead):
+            if start is None:
+                statements.append(self.default_partition_statement(table))
+            else:
+                statements.append(sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})"
+                ).format(
+                    sql.Identifier(partition), sql.Identifier(table), sql.Literal(start), sql.Literal(end)
+                ).as_string(self.connection))
+        return statements
+
+    def partition_bounds(self, months_ahead=None):
+        """
+        Returns the partitions the history tables should have.
+
+        Args:
+            months_ahead (int): The number of future months. Defaults to
+                PARTITION_MONTHS_AHEAD, or 3.
+
+        Returns:
+            list: (table, partition, start, end) tuples, with None bounds for the default
+                partition of each table, followed by one tuple per month from the start of the
+                retention window.
+        """
+        months_ahead = months_ahead if months_ahead is not None else int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+        retention_months = int(os.getenv("PARTITION_RETENTION_MONTHS", "24"))
+        today = date.today()
+        first = today.year * 12 + today.month - 1 - retention_months
+
+        bounds = []
+        for table in self.partitioned_table_queries:
+            bounds.append((table, f"{table}_default", None, None))
+            for month in range(first, today.year * 12 + today.month + months_ahead):
+                start = date(month // 12, month % 12 + 1, 1)
+                end = date((month + 1) // 12, (month + 1) % 12 + 1, 1)
+                bounds.append((table, f"{table}_p{start:%Y%m}", start, end))
+        return bounds
+
+    def ensure_partitions(self, months_ahead=None):
+        """
+        Creates the monthly partitions of the history tables up to a few months ahead.
+
+        Partitions are created from the start of the retention window. run_setup calls this on
+        every run, and maintain_partitions, behind 'python postgresql_setup.py --partitions
+        --loop', keeps future partitions ready between deployments. Rows that reached the
+        default partition because their month had no partition yet are moved into it.
+
+        Args:
+            months_ahead (int): The number of future months to create. Defaults to
+                PARTITION_MONTHS_AHEAD, or 3.
+
+        Returns:
+            int: The number of partitions created.
+        """
+        bounds = self.partition_bounds(months_ahead)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = current_schema() AND c.relname = ANY(%s)",
+                (list(self.partitioned_table_queries) + [partition for _, partition, _, _ in bounds],)
             )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_ratings (
-                rating_id SERIAL PRIMARY KEY,
-                user_id INT REFERENCES users(user_id) NOT NULL,
-                recipe_id INT REFERENCES recipes(recipe_id) NOT NULL,
-                rating DECIMAL(2,1) CHECK (rating >= 0 AND rating <= 5),
-                review TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            existing = dict(cursor.fetchall())
+
+        created = 0
+        for table, partition, start, end in bounds:
+            # Tables that do not exist yet get their partitions with the schema.
+            if existing.get(table) != "p" or partition in existing:
+                continue
+            if start is None:
+                self.execute_query(self.default_partition_statement(table))
+                existing[partition] = "r"
+            else:
+                self.create_partition(table, partition, start, end)
+            created += 1
+
+        print(f"History table partitions are in place, {created} created.")
+        return created
+
+    def create_partition(self, table, partition, start, end):
+        """
+        Creates a monthly partition, moving its rows out of the default partition.
+
+        PostgreSQL refuses to create a partition while the default partition holds rows of its
+        range. Those rows are moved in one transaction: the default partition is detached, the
+        new partition created, the rows copied into it and deleted from the default partition,
+        which is then attached again.
+
+        Args:
+            table (str): The partitioned table.
+            partition (str): The name of the new partition.
+            start (date): The first day of the month.
+            end (date): The first day of the next month.
+
+        Returns:
+            int: The number of rows moved out of the default partition.
+        """
+        model = next(model for model in TABLES if model.name == table)
+        default = f"{table}_default"
+        columns = sql.SQL(", ").join(sql.Identifier(column.name) for column in model.columns)
+        in_range = sql.SQL("{key} >= {start} AND {key} < {end}").format(
+            key=sql.Identifier(model.partition_key), start=sql.Literal(start), end=sql.Literal(end))
+        create = sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})").format(
+            sql.Identifier(partition), sql.Identifier(table), sql.Literal(start), sql.Literal(end))
+
+        moved = 0
+        self.connection.autocommit = False
+        try:
+            with self.connection, self.connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (default,))
+                rows = False
+                if cursor.fetchone()[0]:
+                    # Keeps rows of the month from arriving in the default partition meanwhile.
+                    cursor.execute(sql.SQL("LOCK TABLE {} IN SHARE MODE").format(sql.Identifier(default)))
+                    cursor.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE {})").format(
+                        sql.Identifier(default), in_range))
+                    rows = cursor.fetchone()[0]
+                if not rows:
+                    cursor.execute(create)
+                else:
+                    cursor.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                        sql.Identifier(table), sql.Identifier(default)))
+                    cursor.execute(create)
+                    cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} WHERE {}").format(
+                        sql.Identifier(partition), columns, columns, sql.Identifier(default), in_range))
+                    moved = cursor.rowcount
+                    cursor.execute(sql.SQL("DELETE FROM {} WHERE {}").format(sql.Identifier(default), in_range))
+                    cursor.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} DEFAULT").format(
+                        sql.Identifier(table), sql.Identifier(default)))
+        except Exception as e:
+            print(f"Error creating partition {partition}: {e}")
+            raise
+        finally:
+            self.connection.autocommit = True
+        print(f"Created partition {partition}" + (f", moving {moved} rows out of {default}." if moved else "."))
+        return moved
+
+    def maintain_partitions(self, interval=None, iterations=None):
+        """
+        Keeps the partitions up to date at a regular interval.
+
+        Every round creates the partitions that became due and drops the expired ones.
+
+        Args:
+            interval (float): The seconds between rounds. Defaults to
+                PARTITION_MAINTENANCE_INTERVAL, or one day.
+            iterations (int): The number of rounds before returning. Runs forever when None.
+        """
+        interval = interval or float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "86400"))
+        done = 0
+        while iterations is None or done < iterations:
+            self.ensure_partitions()
+            self.drop_expired_partitions()
+            done += 1
+            if iterations is not None and done >= iterations:
+                break
+            print(f"Next partition maintenance in {interval / 3600:.1f} hours.")
+            time.sleep(interval)
+
+    def drop_expired_partitions(self, retention_months=None):
+        """
+        Drops the monthly partitions that are older than the retention window.
+
+        Dropping a partition removes a month of rows without scanning or vacuuming the table.
+
+        Args:
+            retention_months (int): The number of past months to keep. Defaults to
+                PARTITION_RETENTION_MONTHS, or 24.
+        """
+        retention_months = retention_months if retention_months is not None else int(
+            os.getenv("PARTITION_RETENTION_MONTHS", "24"))
+        today = date.today()
+        oldest = today.year * 12 + today.month - 1 - retention_months
+        cutoff = f"{oldest // 12:04d}{oldest % 12 + 1:02d}"
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, p.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = ANY(%s)",
+                (list(self.partitioned_table_queries),)
             )
-            """
-        ]
+            partitions = cursor.fetchall()
+
+        for partition, table in partitions:
+            suffix = partition[len(table) + 2:]
+            if partition.startswith(f"{table}_p") and suffix.isdigit() and suffix < cutoff:
+                self.execute_query(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)).as_string(self.connection))
 
-        for query in queries:
+    def create_indexes(self):
+        """
+        Creates the secondary indexes, meant to run after the bulk load.
+
+        Building an index once over the loaded rows is much cheaper than maintaining it for
+        every inserted row. The tables are analyzed afterwards so the planner sees the new data.
+        """
+        for query in self.index_queries:
+            start = time.perf_counter()
             self.execute_query(query)
+            print(f"Built in {time.perf_counter() - start:.2f}s")
+        self.execute_query("ANALYZE")
 
-        print("All necessary tables have been created.")
+        print("All indexes have been created.")
+
+    def verify_indexes(self):
+        """
+        Checks with EXPLAIN that the key queries use their indexes.
+
+        Sequential scans are disabled for the check, so a query that cannot use its index at
+        all shows up even while the tables are still small.
+
+        Returns:
+            list: The (index name, query) pairs whose plan does not use the expected index.
+        """
+        failures = []
+        with self.connection.cursor() as cursor:
+            for index_name, query in self.index_checks:
+                cursor.execute("BEGIN")
+                try:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                    cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
+                    plan = cursor.fetchone()[0]
+                finally:
+                    cursor.execute("ROLLBACK")
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+
+                used = set()
+                nodes = [plan[0]["Plan"]]
+                while nodes:
+                    node = nodes.pop()
+                    if "Index Name" in node:
+                        used.add(node["Index Name"])
+                    nodes.extend(node.get("Plans", []))
+
+                # Queries on partitioned tables scan the partition indexes attached to the
+                # index on the parent table.
+                if used:
+                    cursor.execute(
+                        "SELECT p.relname FROM pg_inherits i "
+                        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                        "WHERE c.relname = ANY(%s)",
+                        (list(used),)
+                    )
+                    used.update(row[0] for row in cursor.fetchall())
+
+                if index_name in used:
+                    print(f"Query uses {index_name}: {query}")
+                else:
+                    print(f"Query does not use {index_name} (uses {', '.join(sorted(used)) or 'no index'}): {query}")
+                    failures.append((index_name, query))
+
+        for table, column in self.unindexed_foreign_keys():
+            print(f"Foreign key {table}.{column} has no index.")
+        return failures
+
+    def unindexed_foreign_keys(self):
+        """
+        Lists the foreign key columns that no index starts with.
+
+        Returns:
+            list: The (table, column) pairs of unindexed foreign keys.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.conrelid::regclass::text, a.attname
+                FROM pg_constraint c
+                JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+                WHERE c.contype = 'f'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_index i
+                      WHERE i.indrelid = c.conrelid AND i.indkey[0] = c.conkey[1]
+                  )
+                ORDER BY 1, 2
+            """)
+            return cursor.fetchall()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sets up the PostgreSQL schema and maintains its partitions.")
+    parser.add_argument("--convert-history", action="store_true",
+                        help="Convert plain history tables into partitioned tables before the setup.")
+    parser.add_argument("--partitions", action="store_true",
+                        help="Only create the upcoming partitions and drop the expired ones.")
+    parser.add_argument("--loop", action="store_true",
+                        help="With --partitions, keep maintaining the partitions at PARTITION_MAINTENANCE_INTERVAL.")
+    parser.add_argument("--months-ahead", type=int, help="The number of future monthly partitions to create.")
+    args = parser.parse_args()
+
     postgres_setup = PostgreSQLSetup()
-    postgres_setup.create_tables()
+    try:
+        if args.partitions and args.loop:
+            postgres_setup.maintain_partitions()
+        elif args.partitions:
+            postgres_setup.ensure_partitions(args.months_ahead)
+            postgres_setup.drop_expired_partitions()
+        else:
+            if args.convert_history:
+                postgres_setup.convert_history_tables()
+            postgres_setup.run_setup()
+    finally:
+        postgres_setup.close()
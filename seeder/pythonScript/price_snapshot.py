@@ -0,0 +1,402 @@
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+try:
+    from .metrics import percentile
+    from .unit_registry import UnitRegistry
+except ImportError:
+    from metrics import percentile
+    from unit_registry import UnitRegistry
+
+# The newest price of every ingredient at every store. A NULL last_updated sorts last, as merge()
+# treats it as OLDEST, so a dated price always wins over an undated one in both places.
+LATEST_PRICES_QUERY = """
+    SELECT DISTINCT ON (ingredient_id, store_id) ingredient_id, store_id, price, unit, last_updated
+    FROM ingredient_prices
+    ORDER BY ingredient_id, store_id, last_updated DESC NULLS LAST
+"""
+
+# The prices changed since a refresh, read through idx_ingredient_prices_last_updated.
+CHANGED_PRICES_QUERY = """
+    SELECT ingredient_id, store_id, price, unit, last_updated
+    FROM ingredient_prices
+    WHERE last_updated > %s
+    ORDER BY last_updated
+"""
+
+# The cheapest single store for a basket of ingredients, computed from the price history in
+# PostgreSQL. Like PriceSnapshot.quote, it adds up the price of one base unit of every
+# ingredient, in the base unit most of the ingredient's stores quote it in. Used by the
+# benchmark as the reference for PriceSnapshot.quote.
+NAIVE_BASKET_QUERY = """
+    WITH latest AS (
+        SELECT DISTINCT ON (ingredient_id, store_id) ingredient_id, store_id, base_unit_price, base_unit
+        FROM ingredient_prices
+        WHERE ingredient_id = ANY(%s)
+        ORDER BY ingredient_id, store_id, last_updated DESC NULLS LAST
+    ), primary_units AS (
+        SELECT ingredient_id, base_unit
+        FROM (
+            SELECT ingredient_id, base_unit,
+                ROW_NUMBER() OVER (PARTITION BY ingredient_id ORDER BY COUNT(*) DESC, base_unit) AS rank
+            FROM latest
+            GROUP BY ingredient_id, base_unit
+        ) ranked
+        WHERE rank = 1
+    )
+    SELECT store_id, COUNT(*) AS items, SUM(base_unit_price) AS total
+    FROM latest
+    JOIN primary_units USING (ingredient_id, base_unit)
+    GROUP BY store_id
+    ORDER BY items DESC, total, store_id
+    LIMIT 1
+"""
+
+# Timestamps that are NULL in the table sort before every real one.
+OLDEST = np.datetime64("0001-01-01T00:00:00", "us")
+
+
+class PriceSnapshot:
+    """
+    Keeps the latest price of every ingredient at every store in memory, for cheapest-store lookups.
+
+    The snapshot is columnar: one NumPy array per column, with one entry per (ingredient,
+    store) pair, sorted by ingredient and store. Each price is also converted to a price per
+    base unit, so a price per kg and a price per 500 g compare correctly. A refresh only reads
+    the prices updated since the newest one in the snapshot, through an index on
+    last_updated, and merges them in.
+
+    Stores are compared for an ingredient in one base unit: the one requested for the item,
+    or else the one most of the ingredient's prices use. Prices in units that do not convert,
+    such as grams and pieces, are never compared with each other.
+
+    Methods:
+        from_postgresql(connection) -> PriceSnapshot:
+            Loads the latest prices from the ingredient_prices table.
+        merge(rows) -> int:
+            Merges price rows into the snapshot, keeping the newest price of every pair.
+        build() -> None:
+            Rebuilds the lookup arrays after the prices changed.
+        refresh(connection) -> int:
+            Merges the prices updated since the newest one in the snapshot.
+        gather(items: list) -> tuple:
+            Returns the prices of a list of items in the base unit each item is compared in.
+        quote(items: list) -> dict:
+            Returns the cheapest store of every item and the cheapest single store for the whole basket.
+    """
+
+    def __init__(self, rows=(), units=None):
+        """
+        Initializes the PriceSnapshot.
+
+        Args:
+            rows (iterable): (ingredient_id, store_id, price, unit, last_updated) tuples. Older
+                prices of a pair are replaced by newer ones.
+            units (UnitRegistry): Converts prices to base units. Defaults to a UnitRegistry.
+        """
+        self.units = units or UnitRegistry()
+        self.keys = np.empty(0, dtype=np.int64)
+        self.pair_ingredients = np.empty(0, dtype=np.int64)
+        self.pair_stores = np.empty(0, dtype=np.int64)
+        self.prices = np.empty(0, dtype=np.float64)
+        self.price_units = np.empty(0, dtype=object)
+        self.unit_prices = np.empty(0, dtype=np.float64)
+        self.base_units = np.empty(0, dtype=np.int32)
+        self.updated = np.empty(0, dtype="datetime64[us]")
+        self.watermark = None
+        self.build()
+        self.merge(rows)
+
+    @classmethod
+    def from_postgresql(cls, connection, **kwargs):
+        """
+        Loads the latest prices from the ingredient_prices table.
+
+        The rows are streamed through a server-side cursor.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+            **kwargs: Passed on to the constructor.
+
+        Returns:
+            PriceSnapshot: The snapshot.
+        """
+        start = time.perf_counter()
+        autocommit = connection.autocommit
+        connection.autocommit = False
+        try:
+            with connection.cursor(name="price_snapshot") as cursor:
+                cursor.itersize = 50000
+                cursor.execute(LATEST_PRICES_QUERY)
+                snapshot = cls(cursor, **kwargs)
+            connection.commit()
+        finally:
+            connection.autocommit = autocommit
+        print(f"Loaded {len(snapshot.keys)} latest prices of {len(snapshot.ingredients)} ingredients "
+              f"at {len(snapshot.stores)} stores in {time.perf_counter() - start:.2f}s")
+        return snapshot
+
+    def merge(self, rows):
+        """
+        Merges price rows into the snapshot, keeping the newest price of every pair.
+
+        Args:
+            rows (iterable): (ingredient_id, store_id, price, unit, last_updated) tuples.
+
+        Returns:
+            int: The number of rows read.
+        """
+        ingredient_ids, store_ids, prices, units, updated = [], [], [], [], []
+        for ingredient_id, store_id, price, unit, last_updated in rows:
+            ingredient_ids.append(ingredient_id)
+            store_ids.append(store_id)
+            prices.append(float(price))
+            units.append(unit)
+            updated.append(last_updated)
+        if not ingredient_ids:
+            return 0
+
+        ingredient_ids = np.array(ingredient_ids, dtype=np.int64)
+        store_ids = np.array(store_ids, dtype=np.int64)
+        prices = np.array(prices, dtype=np.float64)
+        units = np.array(units, dtype=object)
+        updated = np.array(updated, dtype="datetime64[us]")
+        updated[np.isnat(updated)] = OLDEST
+        factors, codes = self.units.to_base_arrays(np.ones(len(prices)), units)
+
+        # Sorted by pair and then by time, with the merged rows after the snapshot's own, the
+        # last row of every pair is its newest price.
+        keys = np.concatenate((self.keys, (ingredient_ids << 32) | store_ids))
+        updated = np.concatenate((self.updated, updated))
+        order = np.lexsort((updated, keys))
+        newest = order[np.append(keys[order][1:] != keys[order][:-1], True)]
+
+        self.keys = keys[newest]
+        self.pair_ingredients = np.concatenate((self.pair_ingredients, ingredient_ids))[newest]
+        self.pair_stores = np.concatenate((self.pair_stores, store_ids))[newest]
+        self.prices = np.concatenate((self.prices, prices))[newest]
+        self.price_units = np.concatenate((self.price_units, units))[newest]
+        self.unit_prices = np.concatenate((self.unit_prices, prices / factors))[newest]
+        self.base_units = np.concatenate((self.base_units, codes))[newest]
+        self.updated = updated[newest]
+        self.watermark = self.updated.max().item()
+        self.build()
+        return len(ingredient_ids)
+
+    def build(self):
+        """
+        Rebuilds the lookup arrays after the prices changed.
+        """
+        self.ingredients, self.starts = np.unique(self.pair_ingredients, return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.pair_ingredients)).astype(self.starts.dtype)
+        self.stores, self.pair_store_index = np.unique(self.pair_stores, return_inverse=True)
+
+        # The base unit most of an ingredient's prices use, the lowest code on a tie.
+        code_count = len(self.units.base_codes)
+        segments = np.repeat(np.arange(len(self.ingredients)), self.ends - self.starts)
+        pairs, counts = np.unique(segments * code_count + self.base_units, return_counts=True)
+        order = np.lexsort((pairs % code_count, -counts, pairs // code_count))
+        pairs = pairs[order]
+        first = np.ones(len(pairs), dtype=bool)
+        first[1:] = pairs[1:] // code_count != pairs[:-1] // code_count
+        self.primary_units = np.empty(len(self.ingredients), dtype=np.int32)
+        self.primary_units[pairs[first] // code_count] = pairs[first] % code_count
+
+    def refresh(self, connection):
+        """
+        Merges the prices updated since the newest one in the snapshot.
+
+        Prices inserted with an older last_updated than that are only picked up by loading
+        the snapshot again.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the database.
+
+        Returns:
+            int: The number of changed prices read.
+        """
+        if self.watermark is None:
+            with connection.cursor() as cursor:
+                cursor.execute(LATEST_PRICES_QUERY)
+                return self.merge(cursor.fetchall())
+        with connection.cursor() as cursor:
+            cursor.execute(CHANGED_PRICES_QUERY, (self.watermark,))
+            rows = cursor.fetchall()
+        return self.merge(rows)
+
+    def gather(self, items):
+        """
+        Returns the prices of a list of items in the base unit each item is compared in.
+
+        Args:
+            items (list): Ingredient ids, or (ingredient_id, quantity, unit) tuples.
+
+        Returns:
+            tuple: The ingredient id of every item, and the snapshot row, item position and
+                cost of every usable price. The cost is the quantity in base units times the
+                base unit price, where an item without a quantity stands for one base unit, so
+                bare ingredient ids are compared by their price per gram, millilitre or unit.
+        """
+        ingredient_ids, quantities, codes = [], [], []
+        for item in items:
+            if isinstance(item, (tuple, list)):
+                ingredient_id, quantity, unit = item
+                base_quantity, base_unit = self.units.to_base(quantity, unit)
+                quantities.append(base_quantity)
+                codes.append(self.units.base_code(base_unit))
+            else:
+                ingredient_id = item
+                quantities.append(1.0)
+                codes.append(-1)
+            ingredient_ids.append(int(ingredient_id))
+
+        ingredient_ids = np.array(ingredient_ids, dtype=np.int64)
+        quantities = np.array(quantities, dtype=np.float64)
+        codes = np.array(codes, dtype=np.int32)
+        positions = np.searchsorted(self.ingredients, ingredient_ids)
+        found = positions < len(self.ingredients)
+        found[found] = self.ingredients[positions[found]] == ingredient_ids[found]
+        positions = positions[found]
+        codes[found] = np.where(codes[found] < 0, self.primary_units[positions], codes[found])
+
+        # The price rows of every item, as consecutive ranges of the snapshot.
+        lengths = self.ends[positions] - self.starts[positions]
+        item_of_row = np.repeat(np.flatnonzero(found), lengths)
+        rows = np.arange(len(item_of_row)) + np.repeat(self.starts[positions] - (np.cumsum(lengths) - lengths), lengths)
+
+        keep = self.base_units[rows] == codes[item_of_row]
+        rows, item_of_row = rows[keep], item_of_row[keep]
+        costs = quantities[item_of_row] * self.unit_prices[rows]
+        return ingredient_ids, rows, item_of_row, costs
+
+    def quote(self, items):
+        """
+        Returns the cheapest store of every item and the cheapest single store for the whole basket.
+
+        Items are compared by their cost in base units, never by the listed price of whatever
+        pack a store quotes. The basket store is the one that sells the most items, and the
+        cheapest of those, with the lowest store id on a tie. Costs are rounded to the six
+        decimals of the base_unit_price column, since one base unit often costs under a cent.
+
+        Args:
+            items (list): Ingredient ids, or (ingredient_id, quantity, unit) tuples.
+
+        Returns:
+            dict: "items" holds, per item, a dict with the ingredient id, store id, listed
+                price and unit, base unit price, base unit and cost, or None if no store
+                prices the item. "basket" holds the store id, total cost, number of items the
+                store sells and the ingredient ids it does not, or None if no item is priced.
+        """
+        ingredient_ids, rows, item_of_row, costs = self.gather(items)
+        base_names = {code: name for name, code in self.units.base_codes.items()}
+
+        cheapest = [None] * len(ingredient_ids)
+        order = np.lexsort((self.pair_stores[rows], costs, item_of_row))
+        first = order[np.append(True, item_of_row[order][1:] != item_of_row[order][:-1])] if len(order) else order
+        for index in first:
+            row = rows[index]
+            cheapest[item_of_row[index]] = {
+                "ingredient_id": int(self.pair_ingredients[row]),
+                "store_id": int(self.pair_stores[row]),
+                "price": float(self.prices[row]),
+                "unit": self.price_units[row],
+                "base_unit_price": float(self.unit_prices[row]),
+                "base_unit": base_names[int(self.base_units[row])],
+                "cost": round(float(costs[index]), 6)
+            }
+
+        basket = None
+        stores = self.pair_store_index[rows]
+        counts = np.bincount(stores, minlength=len(self.stores))
+        if counts.any():
+            totals = np.bincount(stores, weights=costs, minlength=len(self.stores))
+            best = np.lexsort((self.stores, totals, -counts))[0]
+            sold = np.zeros(len(ingredient_ids), dtype=bool)
+            sold[item_of_row[stores == best]] = True
+            basket = {
+                "store_id": int(self.stores[best]),
+                "total": round(float(totals[best]), 6),
+                "items": int(counts[best]),
+                "missing": [int(ingredient_id) for ingredient_id in ingredient_ids[~sold]]
+            }
+        return {"items": cheapest, "basket": basket}
+
+
+def benchmark(connection, baskets=50, size=20, seed=0):
+    """
+    Times PriceSnapshot.quote against the equivalent SQL query for random baskets.
+
+    Both sides pick the basket store from the prices per base unit. Baskets whose totals agree
+    to the precision of base_unit_price count as a match even when a tie picks another store.
+    The snapshot is loaded once before the timing starts.
+
+    Args:
+        connection (psycopg2.extensions.connection): A connection to the database.
+        baskets (int): The number of baskets.
+        size (int): The number of ingredients per basket.
+        seed (int): Seeds the choice of ingredients.
+
+    Returns:
+        dict: The p50 and p95 latency in milliseconds of both approaches.
+    """
+    snapshot = PriceSnapshot.from_postgresql(connection)
+    rng = random.Random(seed)
+    ingredient_ids = [int(ingredient_id) for ingredient_id in snapshot.ingredients]
+    snapshot_times, sql_times = [], []
+    mismatches = 0
+    for _ in range(baskets):
+        basket = rng.sample(ingredient_ids, min(size, len(ingredient_ids)))
+
+        start = time.perf_counter()
+        quote = snapshot.quote(basket)
+        snapshot_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(NAIVE_BASKET_QUERY, (basket,))
+            _, items, total = cursor.fetchone()
+        sql_times.append(time.perf_counter() - start)
+
+        if quote["basket"]["items"] != items or abs(quote["basket"]["total"] - float(total)) > 1e-6 * len(basket):
+            mismatches += 1
+
+    start = time.perf_counter()
+    changed = snapshot.refresh(connection)
+    print(f"Refreshed {changed} changed prices in {(time.perf_counter() - start) * 1000:.3f} ms")
+
+    results = {}
+    for name, times in (("snapshot", snapshot_times), ("sql_query", sql_times)):
+        times.sort()
+        results[name] = {"p50_ms": percentile(times, 50) * 1000, "p95_ms": percentile(times, 95) * 1000}
+        print(f"{name}: p50 {results[name]['p50_ms']:.3f} ms, p95 {results[name]['p95_ms']:.3f} ms "
+              f"over {len(times)} baskets")
+    if mismatches:
+        print(f"Warning: {mismatches} baskets got a different store total from the SQL query.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks cheapest-store lookups against the SQL query.")
+    parser.add_argument("--baskets", type=int, default=50, help="The number of baskets.")
+    parser.add_argument("--size", type=int, default=20, help="The number of ingredients per basket.")
+    args = parser.parse_args()
+
+    load_dotenv(override=True)
+    connection = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB", "smart_kitchen_helper"),
+        user=os.getenv("POSTGRES_USERNAME"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT")
+    )
+    connection.autocommit = True
+    try:
+        benchmark(connection, args.baskets, args.size)
+    finally:
+        connection.close()
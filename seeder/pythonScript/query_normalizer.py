@@ -0,0 +1,94 @@
+import re
+
+QUALIFIERS = {
+    "fresh", "freshly", "chopped", "diced", "sliced", "minced", "grated", "ground", "shredded",
+    "crushed", "peeled", "whole", "large", "small", "medium", "organic", "ripe", "raw", "dried",
+    "frozen", "canned", "cooked", "uncooked", "finely", "roughly", "thinly", "boneless", "skinless"
+}
+INVARIANT_WORDS = {"molasses", "hummus", "couscous", "asparagus", "swiss", "series", "brussels", "grits", "bitters"}
+IRREGULAR_PLURALS = {"leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife"}
+# Plurals of words ending in "e" that only add an "s", which the -ies, -oes and -ches rules would cut too far.
+E_PLURALS = {
+    "cookies", "brownies", "smoothies", "veggies", "calories", "hoagies", "goodies", "sweeties",
+    "shoes", "toes", "roes", "sloes", "aloes", "floes", "canoes", "oboes", "hoes", "does",
+    "quiches", "brioches", "ganaches", "niches", "caches", "cloches"
+}
+NON_WORD_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def singularize(word):
+    """
+    Reduces an English plural to its singular form using simple suffix rules.
+
+    Args:
+        word (str): A lower case word.
+
+    Returns:
+        str: The singular form of the word, or the word itself if it is not a plural.
+    """
+    if word in INVARIANT_WORDS or len(word) <= 3:
+        return word
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word in E_PLURALS:
+        return word[:-1]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zes", "sses", "oes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient_name(name):
+    """
+    Folds an ingredient name to the form shared by its near duplicates.
+
+    Case, punctuation, preparation qualifiers such as "fresh" or "chopped" and plural
+    endings are removed, so "Fresh Tomatoes" and "tomato, chopped" both become "tomato".
+    The result is only a grouping key and is not meant to be sent to a search API.
+
+    Args:
+        name (str): The ingredient name.
+
+    Returns:
+        str: The normalized name.
+    """
+    words = NON_WORD_PATTERN.sub(" ", name.casefold()).split()
+    kept = [word for word in words if word not in QUALIFIERS] or words
+    return " ".join(singularize(word) for word in kept)
+
+
+def group_documents(documents, field, normalize, to_query=None):
+    """
+    Groups documents whose `field` values normalize to the same key.
+
+    The normalized key only decides which documents share a lookup. Each group is searched for
+    with one of its original names, the most common one, or the first seen among equally
+    common ones, so the API sees a name like "Brussels sprouts" rather than the key.
+
+    Args:
+        documents (iterable): Documents with an _id and the `field` to group by.
+        field (str): The field holding the name to normalize.
+        normalize (callable): Maps a name to its grouping key.
+        to_query (callable): Maps the chosen original name to the search query. Defaults to
+            the name itself.
+
+    Returns:
+        tuple: A dict mapping each group's query to the _ids of its documents, and the number of documents read.
+    """
+    groups = {}
+    count = 0
+    for document in documents:
+        count += 1
+        name = document[field]
+        ids, names = groups.setdefault(normalize(name), ([], {}))
+        ids.append(document["_id"])
+        names[name] = names.get(name, 0) + 1
+
+    queries = {}
+    for ids, names in groups.values():
+        name = max(names, key=names.get)
+        queries.setdefault(to_query(name) if to_query else name, []).extend(ids)
+    return queries, count
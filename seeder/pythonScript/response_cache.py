@@ -0,0 +1,153 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from .metrics import registry as metrics
+except ImportError:
+    from metrics import registry as metrics
+
+
+def normalize_query(query):
+    """
+    Normalizes a search query so trivially different spellings share a cache entry.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        str: The query in lower case with surrounding and repeated whitespace removed.
+    """
+    return " ".join(query.casefold().split())
+
+
+class ResponseCache:
+    """
+    Persists enrichment lookup results in a local SQLite file, keyed by provider and normalized query.
+
+    Entries expire after a TTL, "no result" answers are cached with their own shorter TTL, and
+    the least recently used entries are evicted once the cache holds more than `max_entries`.
+
+    Methods:
+        get(provider: str, query: str) -> tuple:
+            Looks up a cached result.
+        set(provider: str, query: str, value) -> None:
+            Stores a result, where None records that the provider found nothing.
+        close() -> None:
+            Closes the cache file.
+    """
+
+    def __init__(self, path=None, ttl=None, negative_ttl=None, max_entries=None):
+        """
+        Initializes the ResponseCache and creates the cache table if it does not exist.
+
+        Args:
+            path (str): The path of the SQLite file. Defaults to RESPONSE_CACHE_PATH, or response_cache.db.
+            ttl (float): The lifetime of a result in seconds. Defaults to RESPONSE_CACHE_TTL, or 30 days.
+            negative_ttl (float): The lifetime of a "no result" answer in seconds. Defaults to
+                RESPONSE_CACHE_NEGATIVE_TTL, or 1 day.
+            max_entries (int): The number of entries kept before the least recently used ones
+                are evicted. Defaults to RESPONSE_CACHE_MAX_ENTRIES, or 100000.
+        """
+        self.path = path or os.getenv("RESPONSE_CACHE_PATH", "response_cache.db")
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", str(30 * 86400)))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(
+            os.getenv("RESPONSE_CACHE_NEGATIVE_TTL", "86400"))
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "100000"))
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "provider TEXT NOT NULL, query TEXT NOT NULL, value TEXT, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (provider, query))"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+            self.size = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, provider, query):
+        """
+        Looks up a cached result.
+
+        Args:
+            provider (str): The name of the API, such as "youtube" or "unsplash".
+            query (str): The search query.
+
+        Returns:
+            tuple: Whether a live entry was found, and its value. The value is None when the
+                provider is known to have no result for the query.
+        """
+        key = (provider, normalize_query(query))
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT value, created_at FROM responses WHERE provider = ? AND query = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.increment("response_cache", f"{provider}_misses")
+                return False, None
+
+            value, created_at = row
+            ttl = self.ttl if value is not None else self.negative_ttl
+            if now - created_at > ttl:
+                self.connection.execute("DELETE FROM responses WHERE provider = ? AND query = ?", key)
+                self.size -= 1
+                self.misses += 1
+                metrics.increment("response_cache", f"{provider}_misses")
+                return False, None
+
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE provider = ? AND query = ?", (now,) + key
+            )
+            self.hits += 1
+        metrics.increment("response_cache", f"{provider}_hits")
+        return True, json.loads(value) if value is not None else None
+
+    def set(self, provider, query, value):
+        """
+        Stores a result, where None records that the provider found nothing.
+
+        Args:
+            provider (str): The name of the API, such as "youtube" or "unsplash".
+            query (str): The search query.
+            value: A JSON serializable result, or None for a "no result" answer.
+        """
+        key = (provider, normalize_query(query))
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "UPDATE responses SET value = ?, created_at = ?, accessed_at = ? WHERE provider = ? AND query = ?",
+                (json.dumps(value) if value is not None else None, now, now) + key
+            )
+            if cursor.rowcount:
+                return
+
+            self.connection.execute(
+                "INSERT INTO responses (provider, query, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                key + (json.dumps(value) if value is not None else None, now, now)
+            )
+            self.size += 1
+            if self.size > self.max_entries:
+                excess = self.size - self.max_entries
+                self.connection.execute(
+                    "DELETE FROM responses WHERE rowid IN "
+                    "(SELECT rowid FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+                self.size -= excess
+
+    def close(self):
+        """
+        Closes the cache file.
+        """
+        print(f"Response cache: {self.hits} hits, {self.misses} misses.")
+        self.connection.close()
@@ -0,0 +1,524 @@
+import os
+import re
+import time
+
+try:
+    from .schema_models import INDEXES, TABLES
+except ImportError:
+    from schema_models import INDEXES, TABLES
+
+COLUMNS_QUERY = """
+    SELECT c.relname, c.relkind, a.attname, format_type(a.atttypid, a.atttypmod),
+           a.attnotnull, pg_get_expr(d.adbin, d.adrelid)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+"""
+
+# A CREATE INDEX CONCURRENTLY that fails leaves an invalid index behind, and a partitioned
+# index stays invalid until every partition has its index attached.
+INDEXES_QUERY = """
+    SELECT c.relname, i.indisvalid
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+"""
+
+CONSTRAINTS_QUERY = """
+    SELECT c.relname, con.conname, con.convalidated
+    FROM pg_constraint con
+    JOIN pg_class c ON c.oid = con.conrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND con.contype IN ('c', 'f', 'u') AND NOT c.relispartition
+"""
+
+PARTITIONS_QUERY = """
+    SELECT p.relname, c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE c.relkind = 'r' AND p.relkind = 'p'
+"""
+
+TYPE_NAMES = {
+    "serial": "integer",
+    "int": "integer",
+    "integer": "integer",
+    "bigint": "bigint",
+    "text": "text",
+    "date": "date",
+    "boolean": "boolean",
+    "timestamp": "timestamp without time zone"
+}
+TYPE_PATTERN = re.compile(r"(varchar|character varying|decimal|numeric)\s*\(([\d,\s]+)\)", re.IGNORECASE)
+CAST_PATTERN = re.compile(r"::[a-z ]+(\(\d+(,\d+)?\))?", re.IGNORECASE)
+
+
+def canonical_type(type_name):
+    """
+    Converts a type as written in DDL to the name PostgreSQL's format_type reports.
+
+    Args:
+        type_name (str): The type, such as "VARCHAR(50)", "DECIMAL(10,2)" or "SERIAL".
+
+    Returns:
+        str: The canonical name, such as "character varying(50)" or "numeric(10,2)".
+    """
+    match = TYPE_PATTERN.fullmatch(type_name.strip())
+    if match:
+        base = "character varying" if match.group(1).lower() in ("varchar", "character varying") else "numeric"
+        return f"{base}({match.group(2).replace(' ', '')})"
+    return TYPE_NAMES.get(type_name.strip().lower(), type_name.strip().lower())
+
+
+def normalize_default(expression):
+    """
+    Normalizes a default expression so the model and the catalog can be compared.
+
+    Args:
+        expression (str): The default as written in DDL or as reported by pg_get_expr.
+
+    Returns:
+        str: The expression in lower case without type casts, or None if there is no default.
+    """
+    if expression is None:
+        return None
+    return CAST_PATTERN.sub("", expression).strip().lower()
+
+
+def is_safe_type_change(current, target):
+    """
+    Checks whether a column type change only touches the catalog and does not rewrite the table.
+
+    Args:
+        current (str): The canonical current type.
+        target (str): The canonical target type.
+
+    Returns:
+        bool: True for widening a varchar, turning a varchar into text, or raising the
+            precision of a numeric at the same scale.
+    """
+    current_match = re.fullmatch(r"(character varying|numeric)\((\d+)(?:,(\d+))?\)", current)
+    if current_match and current_match.group(1) == "character varying" and target == "text":
+        return True
+    target_match = re.fullmatch(r"(character varying|numeric)\((\d+)(?:,(\d+))?\)", target)
+    if not current_match or not target_match or current_match.group(1) != target_match.group(1):
+        return False
+    return current_match.group(3) == target_match.group(3) and int(target_match.group(2)) >= int(current_match.group(2))
+
+
+class MigrationStep:
+    """
+    A single statement of a migration plan.
+    """
+
+    def __init__(self, description, statement, batched=False):
+        """
+        Initializes the MigrationStep.
+
+        Args:
+            description (str): What the step does, used in the output.
+            statement (str): The SQL statement.
+            batched (bool): Whether the statement is a batch of a backfill that is repeated
+                until it updates no more rows.
+        """
+        self.description = description
+        self.statement = statement
+        self.batched = batched
+
+
+class SchemaMigrator:
+    """
+    Brings a live PostgreSQL schema in line with the table models using online-safe statements.
+
+    The catalog is compared with TABLES and INDEXES, and only the differences are applied:
+    missing tables are created, new columns are added as nullable columns and backfilled in
+    batches, NOT NULL, foreign keys and checks are added as NOT VALID constraints and validated
+    afterwards, and indexes are built with CREATE INDEX CONCURRENTLY. Every statement runs in
+    its own short transaction under a lock timeout, so writers are never blocked for long.
+    A migration that failed halfway is resumed: invalid indexes are dropped and rebuilt,
+    constraints left NOT VALID are only validated, and unique constraints already in place are
+    not added again.
+    Columns and tables that are not in the model are reported but never dropped.
+
+    Methods:
+        introspect() -> tuple:
+            Reads the tables, columns, indexes, partitions and constraints of the current schema.
+        plan() -> list:
+            Returns the MigrationStep list that brings the schema in line with the models.
+        apply(dry_run: bool) -> list:
+            Runs the migration plan.
+    """
+
+    def __init__(self, connection, tables=None, indexes=None, partition_history=False,
+                 batch_size=None, lock_timeout=None):
+        """
+        Initializes the SchemaMigrator.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the PostgreSQL database.
+            tables (list): The Table models. Defaults to TABLES.
+            indexes (list): The Index models. Defaults to INDEXES.
+            partition_history (bool): Whether tables with a partition key are created partitioned.
+            batch_size (int): The number of rows per backfill batch. Defaults to
+                MIGRATION_BATCH_SIZE, or 5000.
+            lock_timeout (str): How long a statement waits for a lock before it fails. Defaults
+                to MIGRATION_LOCK_TIMEOUT, or 5s.
+        """
+        self.connection = connection
+        self.tables = tables if tables is not None else TABLES
+        self.indexes = indexes if indexes is not None else INDEXES
+        self.partition_history = partition_history
+        self.batch_size = batch_size or int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+        self.lock_timeout = lock_timeout or os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+        self.live_constraints = {}
+        self.live_indexes = {}
+
+    def introspect(self):
+        """
+        Reads the tables, columns, indexes, partitions and constraints of the current schema.
+
+        Returns:
+            tuple: A dict mapping each table to its kind ("r" or "p") and a dict of its columns
+                as (type, not null, default) tuples, a dict mapping each index name to whether
+                the index is valid, a dict mapping each partitioned table to its partitions, and
+                a dict mapping each table to a dict of its check, foreign key and unique
+                constraints and whether they are validated.
+        """
+        tables = {}
+        partitions = {}
+        constraints = {}
+        with self.connection.cursor() as cursor:
+            cursor.execute(COLUMNS_QUERY)
+            for table, kind, column, type_name, not_null, default in cursor.fetchall():
+                tables.setdefault(table, (kind, {}))[1][column] = (type_name, not_null, default)
+            cursor.execute(INDEXES_QUERY)
+            indexes = dict(cursor.fetchall())
+            cursor.execute(PARTITIONS_QUERY)
+            for parent, partition in cursor.fetchall():
+                partitions.setdefault(parent, []).append(partition)
+            cursor.execute(CONSTRAINTS_QUERY)
+            for table, constraint, validated in cursor.fetchall():
+                constraints.setdefault(table, {})[constraint] = validated
+        return tables, indexes, partitions, constraints
+
+    def plan(self):
+        """
+        Returns the MigrationStep list that brings the schema in line with the models.
+
+        Returns:
+            list: The steps in the order they must run.
+        """
+        live_tables, self.live_indexes, partitions, self.live_constraints = self.introspect()
+        live_indexes = self.live_indexes
+        steps = []
+        for table in self.tables:
+            live = live_tables.get(table.name)
+            if live is None:
+                steps.append(MigrationStep(
+                    f"Create table {table.name}", table.create_sql(partitioned=self.partition_history)
+                ))
+                continue
+
+            kind, columns = live
+            for column in table.columns:
+                if column.name not in columns:
+                    steps.extend(self.add_column_steps(table, column))
+                else:
+                    steps.extend(self.alter_column_steps(table, column, columns[column.name], kind == "p"))
+                live_constraints = self.live_constraints.get(table.name, {})
+                # PostgreSQL names a column CHECK <table>_<column>_check, as add_column_steps does.
+                constraint = f"{table.name}_{column.name}_check"
+                if column.check is None and constraint in live_constraints:
+                    steps.append(MigrationStep(
+                        f"Drop constraint {constraint}",
+                        f"ALTER TABLE {table.name} DROP CONSTRAINT IF EXISTS {constraint}"
+                    ))
+                # A unique column added by an earlier migration that stopped before its constraint.
+                if column.unique and column.name in columns and f"{table.name}_{column.name}_key" not in live_constraints:
+                    steps.extend(self.unique_constraint_steps(table, column))
+                # A constraint that an earlier migration added but failed to validate.
+                for suffix, defined in (("check", column.check), ("fkey", column.references)):
+                    constraint = f"{table.name}_{column.name}_{suffix}"
+                    if defined and live_constraints.get(constraint) is False and column.name in columns:
+                        steps.append(MigrationStep(
+                            f"Validate constraint {constraint}",
+                            f"ALTER TABLE {table.name} VALIDATE CONSTRAINT {constraint}"
+                        ))
+            for column_name in columns:
+                if table.column(column_name) is None:
+                    print(f"Column {table.name}.{column_name} is not in the model and is left in place.")
+
+        for index in self.indexes:
+            if live_indexes.get(index.name):
+                continue
+            live = live_tables.get(index.table)
+            if live is not None and live[0] == "p":
+                # An invalid partitioned index is completed rather than dropped, which would
+                # drop the index of every partition with it.
+                steps.extend(self.partitioned_index_steps(index, partitions.get(index.table, []), live_indexes))
+                continue
+            if index.name in live_indexes:
+                steps.append(MigrationStep(
+                    f"Drop invalid index {index.name}", f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"
+                ))
+            steps.append(MigrationStep(f"Build index {index.name}", index.create_sql(concurrently=True)))
+        return steps
+
+    def add_column_steps(self, table, column):
+        """
+        Returns the steps that add a column without rewriting or long-locking the table.
+
+        Args:
+            table (Table): The table model.
+            column (Column): The new column.
+
+        Returns:
+            list: The MigrationStep list.
+        """
+        steps = [MigrationStep(
+            f"Add column {table.name}.{column.name}",
+            f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column.type}"
+        )]
+        if column.default is not None:
+            keys = ", ".join(c.name for c in table.columns if c.primary_key)
+            steps.append(MigrationStep(
+                f"Set default of {table.name}.{column.name}",
+                f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET DEFAULT {column.default}"
+            ))
+            steps.append(MigrationStep(
+                f"Backfill {table.name}.{column.name}",
+                f"UPDATE {table.name} SET {column.name} = {column.default} WHERE ({keys}) IN "
+                f"(SELECT {keys} FROM {table.name} WHERE {column.name} IS NULL LIMIT {self.batch_size})",
+                batched=True
+            ))
+        if column.references:
+            steps.extend(self.validated_constraint_steps(
+                table, f"{table.name}_{column.name}_fkey",
+                f"FOREIGN KEY ({column.name}) REFERENCES {column.references}"
+                + (f" ON DELETE {column.on_delete}" if column.on_delete else "")
+            ))
+        if column.check:
+            steps.extend(self.validated_constraint_steps(table, f"{table.name}_{column.name}_check", f"CHECK ({column.check})"))
+        if column.unique:
+            steps.extend(self.unique_constraint_steps(table, column))
+        if not column.nullable:
+            steps.extend(self.not_null_steps(table, column))
+        return steps
+
+    def alter_column_steps(self, table, column, current, partitioned):
+        """
+        Returns the steps that change an existing column to match its model.
+
+        Args:
+            table (Table): The table model.
+            column (Column): The column model.
+            current (tuple): The live type, NOT NULL flag and default of the column.
+            partitioned (bool): Whether the live table is partitioned.
+
+        Returns:
+            list: The MigrationStep list.
+        """
+        type_name, not_null, default = current
+        steps = []
+
+        target_type = canonical_type(column.type)
+        if type_name != target_type:
+            if is_safe_type_change(type_name, target_type):
+                steps.append(MigrationStep(
+                    f"Change type of {table.name}.{column.name} to {target_type}",
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column.type}"
+                ))
+            else:
+                print(f"Changing {table.name}.{column.name} from {type_name} to {target_type} rewrites the "
+                      f"table and needs a manual migration.")
+
+        # The partition key of a partitioned table is NOT NULL even where the model allows NULL.
+        if not column.nullable and not not_null:
+            steps.extend(self.not_null_steps(table, column))
+        elif column.nullable and not_null and not (partitioned and column.name == table.partition_key):
+            steps.append(MigrationStep(
+                f"Allow NULL in {table.name}.{column.name}",
+                f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"
+            ))
+
+        if column.type.upper() != "SERIAL" and normalize_default(column.default) != normalize_default(default):
+            if column.default is None:
+                steps.append(MigrationStep(
+                    f"Drop default of {table.name}.{column.name}",
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP DEFAULT"
+                ))
+            else:
+                steps.append(MigrationStep(
+                    f"Set default of {table.name}.{column.name}",
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET DEFAULT {column.default}"
+                ))
+        return steps
+
+    def validated_constraint_steps(self, table, constraint, definition):
+        """
+        Returns the steps that add a constraint without scanning the table under a strong lock.
+
+        The constraint is added as NOT VALID, which only checks new rows, and existing rows are
+        validated in a second statement that does not block writes. A constraint that is already
+        in place is only validated, or skipped when it is valid.
+
+        Args:
+            table (Table): The table model.
+            constraint (str): The constraint name.
+            definition (str): The constraint definition.
+
+        Returns:
+            list: The MigrationStep list.
+        """
+        validated = self.live_constraints.get(table.name, {}).get(constraint)
+        steps = []
+        if validated is None:
+            steps.append(MigrationStep(f"Add constraint {constraint}",
+                                       f"ALTER TABLE {table.name} ADD CONSTRAINT {constraint} {definition} NOT VALID"))
+        if not validated:
+            steps.append(MigrationStep(f"Validate constraint {constraint}",
+                                       f"ALTER TABLE {table.name} VALIDATE CONSTRAINT {constraint}"))
+        return steps
+
+    def unique_constraint_steps(self, table, column):
+        """
+        Returns the steps that add a unique constraint without blocking writes while its index builds.
+
+        The unique index is built concurrently and then turned into the constraint. A constraint
+        that is already in place is skipped, and an index left invalid by a failed build is
+        dropped and built again, so a failed migration can be rerun.
+
+        Args:
+            table (Table): The table model.
+            column (Column): The column model.
+
+        Returns:
+            list: The MigrationStep list.
+        """
+        constraint = f"{table.name}_{column.name}_key"
+        if constraint in self.live_constraints.get(table.name, {}):
+            return []
+        steps = []
+        if self.live_indexes.get(constraint) is False:
+            steps.append(MigrationStep(
+                f"Drop invalid index {constraint}", f"DROP INDEX CONCURRENTLY IF EXISTS {constraint}"
+            ))
+        steps.append(MigrationStep(
+            f"Build unique index on {table.name}.{column.name}",
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {constraint} ON {table.name} ({column.name})"
+        ))
+        steps.append(MigrationStep(
+            f"Add unique constraint on {table.name}.{column.name}",
+            f"ALTER TABLE {table.name} ADD CONSTRAINT {constraint} UNIQUE USING INDEX {constraint}"
+        ))
+        return steps
+
+    def not_null_steps(self, table, column):
+        """
+        Returns the steps that make a column NOT NULL without a long exclusive scan.
+
+        A validated CHECK (column IS NOT NULL) lets SET NOT NULL skip its own table scan, and
+        the helper constraint is dropped afterwards.
+
+        Args:
+            table (Table): The table model.
+            column (Column): The column model.
+
+        Returns:
+            list: The MigrationStep list.
+        """
+        constraint = f"{table.name}_{column.name}_not_null"
+        return self.validated_constraint_steps(table, constraint, f"CHECK ({column.name} IS NOT NULL)") + [
+            MigrationStep(f"Set {table.name}.{column.name} NOT NULL",
+                          f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET NOT NULL"),
+            MigrationStep(f"Drop constraint {constraint}",
+                          f"ALTER TABLE {table.name} DROP CONSTRAINT {constraint}")
+        ]
+
+    def partitioned_index_steps(self, index, partitions, live_indexes=None):
+        """
+        Returns the steps that build an index on a partitioned table without blocking writes.
+
+        CREATE INDEX CONCURRENTLY is not supported on a partitioned table, so the index is
+        created on the parent only, built concurrently on every partition, and the partition
+        indexes are attached to it. Partition indexes left invalid by a failed build are dropped
+        and built again.
+
+        Args:
+            index (Index): The index model.
+            partitions (list): The partitions of the table.
+            live_indexes (dict): Maps the existing index names to whether they are valid.
+
+        Returns:
+            list: The MigrationStep list.
+        """
+        unique = "UNIQUE " if index.unique else ""
+        columns = ", ".join(index.columns)
+        where = f" WHERE {index.where}" if index.where else ""
+        steps = [MigrationStep(
+            f"Create index {index.name} on the parent table",
+            f"CREATE {unique}INDEX IF NOT EXISTS {index.name} ON ONLY {index.table} ({columns}){where}"
+        )]
+        for partition in partitions:
+            partition_index = f"{index.name}_{partition[len(index.table) + 1:]}"[:63]
+            if (live_indexes or {}).get(partition_index) is False:
+                steps.append(MigrationStep(
+                    f"Drop invalid index {partition_index}", f"DROP INDEX CONCURRENTLY IF EXISTS {partition_index}"
+                ))
+            steps.append(MigrationStep(
+                f"Build index {partition_index}",
+                f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} ({columns}){where}"
+            ))
+            steps.append(MigrationStep(
+                f"Attach index {partition_index}",
+                f"ALTER INDEX {index.name} ATTACH PARTITION {partition_index}"
+            ))
+        return steps
+
+    def apply(self, dry_run=False):
+        """
+        Runs the migration plan.
+
+        Args:
+            dry_run (bool): Only print the plan.
+
+        Returns:
+            list: The steps of the plan.
+        """
+        steps = self.plan()
+        if not steps:
+            print("Schema matches the table models.")
+            return steps
+        if dry_run:
+            for step in steps:
+                print(f"{step.description}: {step.statement}")
+            return steps
+
+        autocommit = self.connection.autocommit
+        self.connection.autocommit = True
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SET lock_timeout = %s", (self.lock_timeout,))
+                for step in steps:
+                    start = time.perf_counter()
+                    cursor.execute(step.statement)
+                    rows = cursor.rowcount
+                    while step.batched and cursor.rowcount > 0:
+                        cursor.execute(step.statement)
+                        rows += max(cursor.rowcount, 0)
+                    detail = f" ({rows} rows)" if step.batched else ""
+                    print(f"{step.description}{detail} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"Error applying migration: {e}")
+            raise
+        finally:
+            # The connection may be reused, so the timeout is reset even after a failed step.
+            if not self.connection.closed:
+                with self.connection.cursor() as cursor:
+                    cursor.execute("RESET lock_timeout")
+                self.connection.autocommit = autocommit
+        return steps
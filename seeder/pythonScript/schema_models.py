@@ -0,0 +1,302 @@
+class Column:
+    """
+    Describes a table column.
+
+    Methods:
+        definition(primary_key: bool) -> str:
+            Returns the column definition used in CREATE TABLE.
+    """
+
+    def __init__(self, name, type, nullable=True, primary_key=False, unique=False, default=None,
+                 references=None, on_delete=None, check=None):
+        """
+        Initializes the Column.
+
+        Args:
+            name (str): The column name.
+            type (str): The SQL type, such as "VARCHAR(50)" or "SERIAL".
+            nullable (bool): Whether the column accepts NULL.
+            primary_key (bool): Whether the column is the primary key.
+            unique (bool): Whether the column has a UNIQUE constraint.
+            default (str): The SQL default expression.
+            references (str): The referenced column, such as "users(user_id)".
+            on_delete (str): The ON DELETE action of the foreign key, such as "SET NULL".
+            check (str): The CHECK expression.
+        """
+        self.name = name
+        self.type = type
+        self.nullable = nullable and not primary_key
+        self.primary_key = primary_key
+        self.unique = unique
+        self.default = default
+        self.references = references
+        self.on_delete = on_delete
+        self.check = check
+
+    def definition(self, primary_key=True):
+        """
+        Returns the column definition used in CREATE TABLE.
+
+        Args:
+            primary_key (bool): Whether to declare the PRIMARY KEY inline.
+
+        Returns:
+            str: The column definition.
+        """
+        parts = [self.name, self.type]
+        if self.primary_key and primary_key:
+            parts.append("PRIMARY KEY")
+        if self.unique:
+            parts.append("UNIQUE")
+        if not self.nullable and not (self.primary_key and primary_key):
+            parts.append("NOT NULL")
+        if self.default is not None:
+            parts.append(f"DEFAULT {self.default}")
+        if self.references:
+            parts.append(f"REFERENCES {self.references}")
+            if self.on_delete:
+                parts.append(f"ON DELETE {self.on_delete}")
+        if self.check:
+            parts.append(f"CHECK ({self.check})")
+        return " ".join(parts)
+
+
+class Table:
+    """
+    Describes a table as a list of columns.
+
+    Methods:
+        column(name: str) -> Column:
+            Returns a column by name.
+        create_sql(partitioned: bool) -> str:
+            Returns the CREATE TABLE statement.
+    """
+
+    def __init__(self, name, columns, partition_key=None):
+        """
+        Initializes the Table.
+
+        Args:
+            name (str): The table name.
+            columns (list): The Column instances in table order.
+            partition_key (str): The timestamp column the table is range-partitioned on by
+                month when history tables are partitioned.
+        """
+        self.name = name
+        self.columns = columns
+        self.partition_key = partition_key
+
+    def column(self, name):
+        """
+        Returns a column by name.
+
+        Args:
+            name (str): The column name.
+
+        Returns:
+            Column: The column, or None if the table has no such column.
+        """
+        return next((column for column in self.columns if column.name == name), None)
+
+    def create_sql(self, partitioned=False):
+        """
+        Returns the CREATE TABLE statement.
+
+        A partitioned table needs the partition key in its primary key, so the key is declared
+        as a separate constraint and the partition key column is made NOT NULL.
+
+        Args:
+            partitioned (bool): Whether to create the table range-partitioned on partition_key.
+
+        Returns:
+            str: The CREATE TABLE IF NOT EXISTS statement.
+        """
+        partitioned = partitioned and self.partition_key is not None
+        lines = []
+        for column in self.columns:
+            definition = column.definition(primary_key=not partitioned)
+            if partitioned and column.name == self.partition_key and column.nullable:
+                definition = definition.replace(f"{column.name} {column.type}", f"{column.name} {column.type} NOT NULL", 1)
+            lines.append(definition)
+        if partitioned:
+            keys = [column.name for column in self.columns if column.primary_key] + [self.partition_key]
+            lines.append(f"PRIMARY KEY ({', '.join(keys)})")
+
+        body = ",\n            ".join(lines)
+        suffix = f" PARTITION BY RANGE ({self.partition_key})" if partitioned else ""
+        return f"""
+        CREATE TABLE IF NOT EXISTS {self.name} (
+            {body}
+        ){suffix}
+        """
+
+
+class Index:
+    """
+    Describes a secondary index.
+
+    Methods:
+        create_sql(concurrently: bool) -> str:
+            Returns the CREATE INDEX statement.
+    """
+
+    def __init__(self, name, table, columns, unique=False, where=None):
+        """
+        Initializes the Index.
+
+        Args:
+            name (str): The index name.
+            table (str): The indexed table.
+            columns (list): The indexed columns, optionally with a sort order such as "last_updated DESC".
+            unique (bool): Whether the index is unique.
+            where (str): The predicate of a partial index, which only holds the rows matching it.
+        """
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+        self.where = where
+
+    def create_sql(self, concurrently=False):
+        """
+        Returns the CREATE INDEX statement.
+
+        Args:
+            concurrently (bool): Build the index without blocking writes. Such a statement
+                cannot run inside a transaction.
+
+        Returns:
+            str: The CREATE INDEX IF NOT EXISTS statement.
+        """
+        unique = "UNIQUE " if self.unique else ""
+        mode = "CONCURRENTLY " if concurrently else ""
+        where = f" WHERE {self.where}" if self.where else ""
+        return f"CREATE {unique}INDEX {mode}IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)}){where}"
+
+
+TABLES = [
+    Table("users", [
+        Column("user_id", "SERIAL", primary_key=True),
+        Column("username", "VARCHAR(50)", nullable=False, unique=True),
+        Column("email", "VARCHAR(100)", nullable=False, unique=True, check="email LIKE '%@%.%'"),
+        Column("password_hash", "VARCHAR(255)", nullable=False),
+        Column("role", "VARCHAR(20)", nullable=False),
+        Column("created_at", "TIMESTAMP", default="CURRENT_TIMESTAMP"),
+        Column("updated_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ]),
+    Table("households", [
+        Column("household_id", "SERIAL", primary_key=True),
+        Column("household_name", "VARCHAR(100)", nullable=False, unique=True),
+        Column("address", "VARCHAR(255)"),
+        Column("created_at", "TIMESTAMP", default="CURRENT_TIMESTAMP"),
+        Column("updated_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ]),
+    Table("household_users", [
+        Column("household_user_id", "SERIAL", primary_key=True),
+        Column("household_id", "INT", nullable=False, references="households(household_id)"),
+        Column("user_id", "INT", nullable=False, references="users(user_id)"),
+        Column("role", "VARCHAR(20)", default="'member'")
+    ]),
+    Table("ingredient_categories", [
+        Column("category_id", "SERIAL", primary_key=True),
+        Column("category_name", "VARCHAR(50)", nullable=False, unique=True)
+    ]),
+    Table("ingredients", [
+        Column("ingredient_id", "SERIAL", primary_key=True),
+        Column("name", "VARCHAR(100)", nullable=False),
+        Column("category_id", "INT", references="ingredient_categories(category_id)", on_delete="SET NULL")
+    ]),
+    Table("stores", [
+        Column("store_id", "SERIAL", primary_key=True),
+        Column("store_name", "VARCHAR(100)", nullable=False),
+        Column("address", "VARCHAR(255)", nullable=False),
+        Column("rating", "DECIMAL(2,1)", check="rating >= 0 AND rating <= 5"),
+        Column("created_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ]),
+    Table("ingredient_prices", [
+        Column("price_id", "SERIAL", primary_key=True),
+        Column("ingredient_id", "INT", nullable=False, references="ingredients(ingredient_id)"),
+        Column("store_id", "INT", nullable=False, references="stores(store_id)"),
+        Column("price", "DECIMAL(10,2)", nullable=False, check="price >= 0"),
+        Column("unit", "VARCHAR(50)", nullable=False),
+        Column("last_updated", "TIMESTAMP", default="CURRENT_TIMESTAMP"),
+        Column("base_unit_price", "DECIMAL(14,6)", check="base_unit_price >= 0"),
+        Column("base_unit", "VARCHAR(50)")
+    ]),
+    Table("household_ingredients", [
+        Column("household_ingredient_id", "SERIAL", primary_key=True),
+        Column("household_id", "INT", nullable=False, references="households(household_id)"),
+        Column("ingredient_id", "INT", nullable=False, references="ingredients(ingredient_id)"),
+        Column("quantity", "DECIMAL(10,2)", nullable=False, check="quantity >= 0"),
+        Column("unit", "VARCHAR(50)", nullable=False),
+        Column("expiration_date", "DATE"),
+        Column("is_expired", "BOOLEAN", default="FALSE"),
+        Column("base_quantity", "DECIMAL(14,4)", check="base_quantity >= 0"),
+        Column("base_unit", "VARCHAR(50)")
+    ]),
+    Table("recipes", [
+        Column("recipe_id", "SERIAL", primary_key=True),
+        Column("recipe_name", "VARCHAR(100)", nullable=False),
+        Column("cuisine", "VARCHAR(50)"),
+        Column("preparation_time", "INT", check="preparation_time >= 0"),
+        Column("system_rating", "DECIMAL(2,1)", check="system_rating >= 0 AND system_rating <= 5"),
+        Column("is_rated", "BOOLEAN", default="FALSE"),
+        Column("expiration_date", "DATE", check="expiration_date > CURRENT_DATE"),
+        Column("created_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ]),
+    Table("recipe_ingredients", [
+        Column("recipe_ingredient_id", "SERIAL", primary_key=True),
+        Column("recipe_id", "INT", nullable=False, references="recipes(recipe_id)"),
+        Column("ingredient_id", "INT", nullable=False, references="ingredients(ingredient_id)"),
+        Column("quantity", "DECIMAL(10,2)", nullable=False, check="quantity >= 0"),
+        Column("unit", "VARCHAR(50)", nullable=False),
+        Column("base_quantity", "DECIMAL(14,4)", check="base_quantity >= 0"),
+        Column("base_unit", "VARCHAR(50)")
+    ]),
+    Table("user_recipe_history", [
+        Column("history_id", "SERIAL", primary_key=True),
+        Column("user_id", "INT", nullable=False, references="users(user_id)"),
+        Column("recipe_id", "INT", nullable=False, references="recipes(recipe_id)"),
+        Column("cooked_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ], partition_key="cooked_at"),
+    Table("user_ratings", [
+        Column("rating_id", "SERIAL", primary_key=True),
+        Column("user_id", "INT", nullable=False, references="users(user_id)"),
+        Column("recipe_id", "INT", nullable=False, references="recipes(recipe_id)"),
+        Column("rating", "DECIMAL(2,1)", check="rating >= 0 AND rating <= 5"),
+        Column("review", "TEXT"),
+        Column("created_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ], partition_key="created_at"),
+    Table("expiry_sweeps", [
+        Column("sweeper", "VARCHAR(50)", primary_key=True),
+        Column("swept_through", "DATE", nullable=False),
+        Column("rows_expired", "INT", default="0"),
+        Column("updated_at", "TIMESTAMP", default="CURRENT_TIMESTAMP")
+    ])
+]
+
+# Foreign key columns, plus the composite indexes behind expiry and latest-price lookups.
+# ingredient_prices.ingredient_id and household_ingredients.household_id are covered by
+# the leading column of their composite index. Price snapshots refresh through the
+# last_updated index. The partial index on unexpired stock only holds the rows the expiry
+# sweeper has yet to flag, so a sweep reads the rows that crossed their expiration date and
+# nothing else.
+INDEXES = [
+    Index("idx_household_users_household_id", "household_users", ["household_id"]),
+    Index("idx_household_users_user_id", "household_users", ["user_id"]),
+    Index("idx_ingredients_category_id", "ingredients", ["category_id"]),
+    Index("idx_ingredient_prices_latest", "ingredient_prices", ["ingredient_id", "store_id", "last_updated DESC"]),
+    Index("idx_ingredient_prices_store_id", "ingredient_prices", ["store_id"]),
+    Index("idx_ingredient_prices_last_updated", "ingredient_prices", ["last_updated"]),
+    Index("idx_household_ingredients_household_expiration", "household_ingredients",
+          ["household_id", "expiration_date"]),
+    Index("idx_household_ingredients_unexpired", "household_ingredients",
+          ["expiration_date", "household_id"], where="NOT is_expired"),
+    Index("idx_household_ingredients_ingredient_id", "household_ingredients", ["ingredient_id"]),
+    Index("idx_recipe_ingredients_recipe_id", "recipe_ingredients", ["recipe_id"]),
+    Index("idx_recipe_ingredients_ingredient_id", "recipe_ingredients", ["ingredient_id"]),
+    Index("idx_user_recipe_history_user_id", "user_recipe_history", ["user_id"]),
+    Index("idx_user_recipe_history_recipe_id", "user_recipe_history", ["recipe_id"]),
+    Index("idx_user_ratings_user_id", "user_ratings", ["user_id"]),
+    Index("idx_user_ratings_recipe_id", "user_ratings", ["recipe_id"])
+]
@@ -0,0 +1,280 @@
+import cProfile
+import logging
+import os
+import pstats
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from .metrics import registry as metrics
+    from .table_scheduler import dependency_levels
+except ImportError:
+    from metrics import registry as metrics
+    from table_scheduler import dependency_levels
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    A named step of the seeding run and the stages it depends on.
+    """
+
+    def __init__(self, name, description, action, depends_on=()):
+        """
+        Initializes the Stage.
+
+        Args:
+            name (str): The name the stage is selected and checkpointed by.
+            description (str): The stage description used in the log.
+            action (callable): Runs the stage.
+            depends_on (tuple): The names of the stages that must finish first.
+        """
+        self.name = name
+        self.description = description
+        self.action = action
+        self.depends_on = tuple(depends_on)
+
+
+class StageOrchestrator:
+    """
+    Runs seeding stages concurrently as soon as the stages they depend on have finished.
+
+    Stages completed by an earlier run are skipped through the checkpoint. A stage left out
+    with `only` or `skip` counts as satisfied for the stages that depend on it, which still
+    wait for the stages it depends on.
+
+    The wall time and outcome of every stage are recorded in the metrics registry under the
+    stage name. With a profile directory, each stage runs under cProfile and its statistics
+    are written to <stage>.prof and <stage>.txt.
+
+    Methods:
+        select(only: list, skip: list) -> list:
+            Returns the names of the stages to run, in declaration order.
+        run(only: list, skip: list) -> dict:
+            Runs the selected stages and returns their start and end times.
+        run_stage(name: str, run_start: float) -> tuple:
+            Runs a single stage and records it as complete.
+        profile_stage(stage: Stage) -> None:
+            Runs a stage under cProfile and writes its statistics.
+        critical_path(timings: dict) -> list:
+            Returns the chain of stages that determined the total wall time.
+        report(timings: dict, wall_time: float) -> None:
+            Prints the wall time of every stage and the critical path.
+    """
+
+    def __init__(self, stages, checkpoint=None, workers=None, profile_dir=None):
+        """
+        Initializes the StageOrchestrator.
+
+        Args:
+            stages (list): The Stage instances.
+            checkpoint (CheckpointStore): The ledger of completed stages. Every selected
+                stage runs when None.
+            workers (int): The maximum number of stages running at the same time. Defaults
+                to STAGE_WORKERS, or the number of stages.
+            profile_dir (str): The directory that receives the profile of every stage. Stages
+                are not profiled when None. Profiling runs the stages one at a time, since
+                cProfile only sees the thread it runs on and concurrent stages would blur the
+                per-stage numbers.
+
+        Raises:
+            ValueError: If a stage depends on an unknown stage or the dependencies form a cycle.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.checkpoint = checkpoint
+        self.workers = workers or int(os.getenv("STAGE_WORKERS", str(len(stages))))
+        self.profile_dir = profile_dir
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            self.workers = 1
+        for stage in stages:
+            unknown = set(stage.depends_on) - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(sorted(unknown))}")
+        try:
+            dependency_levels(list(self.stages), {stage.name: set(stage.depends_on) for stage in stages})
+        except ValueError:
+            raise ValueError("The stage dependencies form a cycle.") from None
+
+    def select(self, only=None, skip=None):
+        """
+        Returns the names of the stages to run, in declaration order.
+
+        Args:
+            only (list): Run just these stages. All stages when empty.
+            skip (list): Leave these stages out.
+
+        Returns:
+            list: The selected stage names.
+
+        Raises:
+            ValueError: If a name does not match any stage.
+        """
+        unknown = (set(only or ()) | set(skip or ())) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+        return [
+            name for name in self.stages
+            if (not only or name in only) and name not in (skip or ())
+        ]
+
+    def run(self, only=None, skip=None):
+        """
+        Runs the selected stages and returns their start and end times.
+
+        A failed stage stops new stages from starting. Stages already running are allowed to
+        finish, and the first error is raised afterwards.
+
+        Args:
+            only (list): Run just these stages. All stages when empty.
+            skip (list): Leave these stages out.
+
+        Returns:
+            dict: Maps each stage that ran to its start and end time in seconds from the start of the run.
+        """
+        selected = self.select(only, skip)
+        pending = {}
+        for name in selected:
+            if self.checkpoint is not None and self.checkpoint.is_stage_complete(name):
+                logger.info(f"Skipping {self.stages[name].description}, completed by an earlier run.")
+                continue
+            pending[name] = set()
+
+        # A dependency that is not pending, because it was skipped, deselected or completed
+        # earlier, counts as satisfied, but its own pending dependencies still apply.
+        def pending_dependencies(name):
+            deps = set()
+            for dep in self.stages[name].depends_on:
+                deps |= {dep} if dep in pending else pending_dependencies(dep)
+            return deps
+
+        for name in pending:
+            pending[name] = pending_dependencies(name)
+
+        timings = {}
+        errors = []
+        running = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                if not errors:
+                    for name in [name for name, deps in pending.items() if not deps]:
+                        del pending[name]
+                        running[executor.submit(self.run_stage, name, start)] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        timings[name] = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        logger.error(f"{self.stages[name].description} failed: {e}")
+                        continue
+                    for deps in pending.values():
+                        deps.discard(name)
+
+        wall_time = time.perf_counter() - start
+        self.report(timings, wall_time)
+        if errors:
+            raise errors[0]
+        return timings
+
+    def run_stage(self, name, run_start):
+        """
+        Runs a single stage and records it as complete.
+
+        Args:
+            name (str): The name of the stage.
+            run_start (float): The perf_counter value at the start of the run.
+
+        Returns:
+            tuple: The start and end time of the stage in seconds from the start of the run.
+        """
+        stage = self.stages[name]
+        logger.info(f"Starting {stage.description}...")
+        stage_start = time.perf_counter()
+        try:
+            if self.profile_dir is not None:
+                self.profile_stage(stage)
+            else:
+                stage.action()
+        except Exception:
+            metrics.increment(name, "failures")
+            raise
+        finally:
+            metrics.observe(name, "stage", time.perf_counter() - stage_start)
+        stage_end = time.perf_counter()
+        if self.checkpoint is not None:
+            self.checkpoint.mark_stage_complete(name)
+        logger.info(f"{stage.description} completed in {stage_end - stage_start:.2f}s.")
+        return stage_start - run_start, stage_end - run_start
+
+    def profile_stage(self, stage):
+        """
+        Runs a stage under cProfile and writes its statistics.
+
+        The raw statistics go to <stage>.prof, for tools such as snakeviz, and the 30 most
+        expensive functions by cumulative time to <stage>.txt. Work the stage hands to worker
+        threads shows up as time spent waiting for them.
+
+        Args:
+            stage (Stage): The stage to run.
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(stage.action)
+        finally:
+            path = os.path.join(self.profile_dir, stage.name)
+            profiler.dump_stats(f"{path}.prof")
+            with open(f"{path}.txt", "w", encoding="utf-8") as file:
+                pstats.Stats(profiler, stream=file).sort_stats("cumulative").print_stats(30)
+            logger.info(f"Wrote the profile of {stage.description} to {path}.prof")
+
+    def critical_path(self, timings):
+        """
+        Returns the chain of stages that determined the total wall time.
+
+        The chain ends at the stage that finished last and follows, at every step, the
+        dependency that finished last, since that dependency held the stage back.
+
+        Args:
+            timings (dict): Maps each stage that ran to its start and end time.
+
+        Returns:
+            list: The stage names on the critical path, in run order.
+        """
+        if not timings:
+            return []
+        path = [max(timings, key=lambda name: timings[name][1])]
+        while True:
+            deps = [dep for dep in self.stages[path[-1]].depends_on if dep in timings]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda dep: timings[dep][1]))
+        return path[::-1]
+
+    def report(self, timings, wall_time):
+        """
+        Prints the wall time of every stage and the critical path.
+
+        Args:
+            timings (dict): Maps each stage that ran to its start and end time.
+            wall_time (float): The wall time of the whole run in seconds.
+        """
+        lines = ["Stage timings:"]
+        for name, (stage_start, stage_end) in sorted(timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"  {name}: {stage_end - stage_start:.2f}s (started at +{stage_start:.2f}s)")
+        path = self.critical_path(timings)
+        path_time = sum(timings[name][1] - timings[name][0] for name in path)
+        stage_time = sum(stage_end - stage_start for stage_start, stage_end in timings.values())
+        lines.append(f"Ran {len(timings)} stages in {wall_time:.2f}s of wall time "
+                     f"({stage_time:.2f}s of stage time).")
+        if path:
+            lines.append(f"Critical path: {' -> '.join(path)} ({path_time:.2f}s)")
+        for line in lines:
+            print(line)
+            logger.info(line)
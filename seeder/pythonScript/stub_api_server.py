@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubAPIServer:
+    """
+    Serves canned YouTube, Unsplash and Google Custom Search responses over local HTTP.
+
+    The fetch engine, the image resolver and the video resolver read their API roots from
+    YOUTUBE_API_URL, UNSPLASH_API_URL and GOOGLE_API_URL, so pointing them at this server
+    exercises them without API keys or quotas. The server can add latency and reject every n-th request with HTTP 429,
+    and it records the number of requests and the most requests it saw in flight at once, which
+    shows whether the engine keeps to its concurrency bounds.
+
+    Methods:
+        start() -> str:
+            Starts serving in a background thread and returns the server URL.
+        stop() -> None:
+            Stops the server.
+        stats() -> dict:
+            Returns the request counters.
+    """
+
+    def __init__(self, port=0, latency=0.0, throttle_every=0, retry_after="1"):
+        """
+        Initializes the StubAPIServer.
+
+        Args:
+            port (int): The port to listen on. 0 picks a free port.
+            latency (float): The seconds each response is delayed by.
+            throttle_every (int): Rejects every n-th request with HTTP 429. 0 never rejects.
+            retry_after (str): The Retry-After header of a rejected request, a number of seconds,
+                or "date" to send the HTTP date one second ahead.
+        """
+        self.port = port
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def url(self):
+        """
+        Returns the root URL of the running server.
+        """
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        """
+        Starts serving in a background thread and returns the server URL.
+
+        Returns:
+            str: The root URL, to be used as YOUTUBE_API_URL and UNSPLASH_API_URL, and with
+                /customsearch/v1 appended as GOOGLE_API_URL.
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub.handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def stats(self):
+        """
+        Returns the request counters.
+
+        Returns:
+            dict: The number of requests, of rejected requests and the peak number in flight.
+        """
+        with self.lock:
+            return {"requests": self.requests, "throttled": self.throttled, "peak_in_flight": self.peak_in_flight}
+
+    def handle(self, request):
+        """
+        Answers one GET request.
+
+        Args:
+            request (BaseHTTPRequestHandler): The request being handled.
+        """
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            throttle = self.throttle_every and self.requests % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if throttle:
+                if self.retry_after == "date":
+                    header = formatdate(time.time() + 1, usegmt=True)
+                else:
+                    header = self.retry_after
+                request.send_response(429)
+                request.send_header("Retry-After", header)
+                request.end_headers()
+                return
+
+            url = urlparse(request.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            body = self.response(url.path, params)
+            if body is None:
+                request.send_response(404)
+                request.end_headers()
+                return
+            payload = json.dumps(body).encode("utf-8")
+            request.send_response(200)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(payload)))
+            request.end_headers()
+            request.wfile.write(payload)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def response(self, path, params):
+        """
+        Returns the canned response of an endpoint.
+
+        Queries containing "missing" find nothing, to exercise the paths without a result.
+
+        Args:
+            path (str): The request path.
+            params (dict): The query parameters.
+
+        Returns:
+            dict: The decoded response body, or None for an unknown endpoint.
+        """
+        if path.endswith("/customsearch/v1"):
+            query = params.get("q", "")
+            items = [] if "missing" in query else [{"link": f"https://images.example/google/{query}.jpg"}]
+            return {"items": items}
+        if path.endswith("/search/photos"):
+            query = params.get("query", "")
+            results = [] if "missing" in query else [{"urls": {"regular": f"https://images.example/{query}.jpg"}}]
+            return {"results": results}
+        if path.endswith("/search"):
+            query = params.get("q", "")
+            count = int(params.get("maxResults", "1"))
+            if "missing" in query:
+                return {"items": []}
+            return {"items": [
+                {"id": {"videoId": f"{query.replace(' ', '_')}_{rank}"}, "snippet": {"title": query}}
+                for rank in range(count)
+            ]}
+        if path.endswith("/videos"):
+            ids = [video_id for video_id in params.get("id", "").split(",") if video_id]
+            return {"items": [
+                {"id": video_id, "statistics": {"viewCount": str(1000 * (len(ids) - rank))}}
+                for rank, video_id in enumerate(ids)
+            ]}
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves canned YouTube, Unsplash and Google responses for local runs.")
+    parser.add_argument("--port", type=int, default=8765, help="The port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.05, help="The seconds each response is delayed by.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Reject every n-th request with HTTP 429.")
+    parser.add_argument("--retry-after", default="1", help="Retry-After of rejected requests, in seconds or 'date'.")
+    parser.add_argument("--run-engine", action="store_true",
+                        help="Run the fetch engine against the stub. Use a scratch MONGO_DB, as the stub URLs are stored.")
+    args = parser.parse_args()
+
+    with StubAPIServer(args.port, args.latency, args.throttle_every, args.retry_after) as stub:
+        print(f"Serving stub APIs at {stub.url}. Set YOUTUBE_API_URL and UNSPLASH_API_URL to this URL "
+              f"and GOOGLE_API_URL to {stub.url}/customsearch/v1.")
+        if not args.run_engine:
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        else:
+            try:
+                from .fetch_engine import AsyncFetchEngine
+                from .image_resolver import HedgedImageResolver
+                from .response_cache import ResponseCache
+                from .youtube_image_fetch import YouTubeImageFetcher
+            except ImportError:
+                from fetch_engine import AsyncFetchEngine
+                from image_resolver import HedgedImageResolver
+                from response_cache import ResponseCache
+                from youtube_image_fetch import YouTubeImageFetcher
+
+            fetcher = YouTubeImageFetcher()
+            # The environment is loaded by the fetcher, so the stub settings are applied after it.
+            os.environ.update(YOUTUBE_API_URL=stub.url, UNSPLASH_API_URL=stub.url,
+                              GOOGLE_API_URL=f"{stub.url}/customsearch/v1")
+            os.environ.setdefault("UNSPLASH_ACCESS_KEY", "stub")
+            fetcher.youtube_api_key = fetcher.youtube_api_key or "stub"
+            fetcher.unsplash_access_key = fetcher.unsplash_access_key or "stub"
+            # Stub answers must not end up in the real response cache.
+            with tempfile.TemporaryDirectory() as directory:
+                fetcher.close()
+                fetcher.cache = ResponseCache(os.path.join(directory, "stub_cache.db"))
+                fetcher.image_resolver = HedgedImageResolver.from_environment(fetcher.cache)
+                engine = AsyncFetchEngine(fetcher)
+                start = time.perf_counter()
+                updated = engine.run()
+                elapsed = time.perf_counter() - start
+                fetcher.close()
+            limits = {name: settings[1] for name, settings in engine.settings.items()}
+            print(f"Updated {updated} in {elapsed:.2f}s; stub {stub.stats()}; "
+                  f"concurrency limits {limits}, at most {sum(limits.values())} in flight together.")
@@ -0,0 +1,611 @@
+import argparse
+import csv
+import os
+import random
+import time
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+
+from bson import ObjectId, json_util
+
+try:
+    from .data_insertion import DataInsertion
+except ImportError:
+    from data_insertion import DataInsertion
+
+CATEGORIES = [
+    "Vegetables", "Fruits", "Dairy", "Meat", "Seafood", "Grains", "Legumes",
+    "Spices", "Herbs", "Oils", "Baking", "Condiments"
+]
+# Base ingredient names with the index of their category and the unit they are sold in.
+FOODS = [
+    ("Tomato", 0, "g"), ("Potato", 0, "kg"), ("Onion", 0, "g"), ("Garlic", 0, "g"), ("Carrot", 0, "g"),
+    ("Spinach", 0, "g"), ("Bell Pepper", 0, "unit"), ("Zucchini", 0, "unit"), ("Apple", 1, "unit"),
+    ("Banana", 1, "unit"), ("Lemon", 1, "unit"), ("Lime", 1, "unit"), ("Strawberry", 1, "g"),
+    ("Milk", 2, "ml"), ("Butter", 2, "g"), ("Cheddar", 2, "g"), ("Parmesan", 2, "g"), ("Yogurt", 2, "g"),
+    ("Chicken Breast", 3, "g"), ("Ground Beef", 3, "g"), ("Pork Loin", 3, "g"), ("Bacon", 3, "g"),
+    ("Salmon", 4, "g"), ("Shrimp", 4, "g"), ("Tuna", 4, "g"), ("Rice", 5, "kg"), ("Spaghetti", 5, "g"),
+    ("Flour", 5, "kg"), ("Oats", 5, "g"), ("Lentils", 6, "g"), ("Chickpeas", 6, "g"), ("Black Beans", 6, "g"),
+    ("Cumin", 7, "g"), ("Paprika", 7, "g"), ("Black Pepper", 7, "g"), ("Cinnamon", 7, "g"),
+    ("Basil", 8, "g"), ("Parsley", 8, "g"), ("Cilantro", 8, "g"), ("Olive Oil", 9, "ml"),
+    ("Sesame Oil", 9, "ml"), ("Sugar", 10, "kg"), ("Baking Powder", 10, "g"), ("Eggs", 2, "unit"),
+    ("Soy Sauce", 11, "ml"), ("Mustard", 11, "g"), ("Ketchup", 11, "ml"), ("Vinegar", 11, "ml")
+]
+CUISINES = ["Italian", "Mexican", "Indian", "Chinese", "Japanese", "French", "Thai", "American", "Greek", "Spanish"]
+DISHES = ["Curry", "Stew", "Salad", "Soup", "Pasta", "Stir Fry", "Tacos", "Casserole", "Bowl", "Roast", "Pie"]
+STORE_CHAINS = ["Walmart Supercenter", "Target", "Kroger", "Costco", "Whole Foods", "Aldi", "Safeway", "Trader Joe's"]
+STREETS = ["Main St", "Elm St", "Oak Ave", "Maple Dr", "Pine Rd", "Cedar Ln", "Lake Blvd", "Hill St"]
+REVIEWS = [
+    "Delicious and easy to make!", "Good, but needed more seasoning.", "A new family favourite.",
+    "Too salty for my taste.", "Perfect for a weeknight dinner.", "Took longer than expected.",
+    "Would make again.", "Not bad, not great."
+]
+DIETS = ["Vegetarian", "Vegan", "Gluten-Free", "Keto", "Dairy-Free", "Halal"]
+ALLERGIES = ["Nuts", "Dairy", "Gluten", "Shellfish", "Eggs", "Soy"]
+# Leading four bytes of the ObjectIds derived from SQL ids, so every entity type has its own range.
+OBJECT_ID_NAMESPACES = {"user": 1, "household": 2, "ingredient": 3, "recipe": 4}
+
+
+def object_id(namespace, number):
+    """
+    Returns the ObjectId that stands for a SQL id in the MongoDB collections.
+
+    Args:
+        namespace (str): The entity type, a key of OBJECT_ID_NAMESPACES.
+        number (int): The SQL id.
+
+    Returns:
+        ObjectId: The same ObjectId for the same entity on every run.
+    """
+    return ObjectId(OBJECT_ID_NAMESPACES[namespace].to_bytes(4, "big") + number.to_bytes(8, "big"))
+
+
+def zipf_weights(count, exponent=1.1):
+    """
+    Returns the cumulative Zipf weights of `count` ranks, for random.choices(cum_weights=...).
+
+    Args:
+        count (int): The number of ranks.
+        exponent (float): The skew. Rank r is drawn with a probability proportional to 1 / r ** exponent.
+
+    Returns:
+        array: The cumulative weights as doubles.
+    """
+    return array("d", accumulate(1.0 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class SyntheticDataGenerator:
+    """
+    Generates referentially consistent CSV and Extended JSON seed files at any scale.
+
+    Every table in DataInsertion.table_files and every collection in DataInsertion.collection_files
+    gets a file under the same name, so the loader can read the output in place of the checked-in
+    samples. Rows are written as they are generated and the details of a recipe, household or
+    user are derived from a random generator seeded with the run seed and the entity id, so the
+    SQL and MongoDB files agree without holding either in memory.
+
+    Ingredient and recipe popularity follow a Zipf distribution, the number of ingredients per
+    recipe is log-normal, and the numbers of usage events per household and of cooked recipes
+    per user are Pareto distributed, so a few heavy households and users dominate the volume.
+
+    Methods:
+        generate() -> dict:
+            Writes every CSV and JSON file and returns the number of records per file.
+        write_csv(table: str) -> int:
+            Writes the CSV file of a table.
+        write_json(collection_name: str) -> int:
+            Writes the Extended JSON file of a collection.
+        recipe_ingredients(recipe_id: int) -> list:
+            Returns the ingredients, quantities and units of a recipe.
+        household_members(household_id: int) -> list:
+            Returns the user ids of a household.
+        household_usage(household_id: int) -> iterator:
+            Yields the ingredient usage events of a household.
+        user_history(user_id: int) -> list:
+            Returns the recipes a user cooked and when.
+    """
+
+    base_counts = {
+        "users": 10000,
+        "households": 4000,
+        "ingredients": 2000,
+        "stores": 300,
+        "recipes": 20000
+    }
+
+    def __init__(self, scale=None, seed=None, csv_directory=None, json_directory=None, reference_date=None,
+                 counts=None):
+        """
+        Initializes the SyntheticDataGenerator.
+
+        Args:
+            scale (float): Multiplies the base number of users, households, ingredients, stores
+                and recipes. Defaults to SYNTHETIC_SCALE, or 1, which writes about half a million
+                records in total.
+            seed (int): The seed every random choice derives from. Defaults to SYNTHETIC_SEED, or 42.
+            csv_directory (str): The output directory of the CSV files. Defaults to ../synthetic/csv.
+            json_directory (str): The output directory of the JSON files. Defaults to ../synthetic/json.
+            reference_date (date): Timestamps lie before and expiration dates after this day.
+                Defaults to today. Fix it to get byte-identical files across days.
+            counts (dict): Overrides the scaled number of some entities, such as {"stores": 500}.
+        """
+        self.scale = scale if scale is not None else float(os.getenv("SYNTHETIC_SCALE", "1"))
+        self.seed = seed if seed is not None else int(os.getenv("SYNTHETIC_SEED", "42"))
+        self.csv_directory = csv_directory or "../synthetic/csv"
+        self.json_directory = json_directory or "../synthetic/json"
+        self.reference_date = reference_date or date.today()
+        self.reference_time = datetime.combine(self.reference_date, datetime.min.time(), tzinfo=timezone.utc)
+        self.counts = {name: max(1, int(count * self.scale)) for name, count in self.base_counts.items()}
+        self.counts.update(counts or {})
+        self.ingredient_weights = zipf_weights(self.counts["ingredients"])
+        self.recipe_weights = zipf_weights(self.counts["recipes"], exponent=0.9)
+        self.tables = {
+            "users": self.users,
+            "households": self.households,
+            "household_users": self.household_users,
+            "ingredient_categories": self.ingredient_categories,
+            "ingredients": self.ingredients,
+            "stores": self.stores,
+            "ingredient_prices": self.ingredient_prices,
+            "household_ingredients": self.household_ingredients,
+            "recipes": self.recipes,
+            "recipe_ingredients": self.recipe_ingredient_rows,
+            "user_recipe_history": self.user_recipe_history,
+            "user_ratings": self.user_ratings
+        }
+        self.collections = {
+            "recipes_mongo": self.recipe_documents,
+            "ingredients_mongo": self.ingredient_documents,
+            "household_ingredient_usage": self.usage_documents,
+            "recipe_ratings": self.rating_documents,
+            "user_preferences": self.preference_documents
+        }
+
+    def rng(self, *key):
+        """
+        Returns a random generator for one entity, seeded with the run seed and the key.
+
+        Args:
+            *key: Identifies the entity, such as ("recipe", 17).
+
+        Returns:
+            random.Random: The generator, which yields the same values on every run.
+        """
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+    def generate(self):
+        """
+        Writes every CSV and JSON file and returns the number of records per file.
+
+        Returns:
+            dict: Maps each table and collection name to the number of records written.
+        """
+        os.makedirs(self.csv_directory, exist_ok=True)
+        os.makedirs(self.json_directory, exist_ok=True)
+        written = {}
+        for table in DataInsertion.table_files:
+            written[table] = self.write_csv(table)
+        for collection_name in DataInsertion.collection_files:
+            written[collection_name] = self.write_json(collection_name)
+        print(f"Generated {sum(written.values())} records with seed {self.seed} at scale {self.scale}.")
+        return written
+
+    def write_csv(self, table):
+        """
+        Writes the CSV file of a table.
+
+        Args:
+            table (str): A key of DataInsertion.table_files.
+
+        Returns:
+            int: The number of rows written.
+        """
+        path = os.path.join(self.csv_directory, DataInsertion.table_files[table])
+        start = time.perf_counter()
+        headers, rows = self.tables[table]()
+        count = 0
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        print(f"Wrote {count} rows to {path} in {time.perf_counter() - start:.2f}s")
+        return count
+
+    def write_json(self, collection_name):
+        """
+        Writes the Extended JSON file of a collection as a JSON array.
+
+        Args:
+            collection_name (str): A key of DataInsertion.collection_files.
+
+        Returns:
+            int: The number of documents written.
+        """
+        path = os.path.join(self.json_directory, DataInsertion.collection_files[collection_name])
+        start = time.perf_counter()
+        count = 0
+        with open(path, "w") as file:
+            file.write("[")
+            for document in self.collections[collection_name]():
+                file.write(",\n" if count else "\n")
+                file.write(json_util.dumps(document))
+                count += 1
+            file.write("\n]\n")
+        print(f"Wrote {count} documents to {path} in {time.perf_counter() - start:.2f}s")
+        return count
+
+    def timestamp(self, rng, max_days):
+        """
+        Returns a random moment within `max_days` before the reference date.
+
+        Args:
+            rng (random.Random): The entity's generator.
+            max_days (int): How far back the moment may lie.
+
+        Returns:
+            datetime: A UTC timestamp rounded to the minute.
+        """
+        return self.reference_time - timedelta(minutes=rng.randrange(max_days * 1440))
+
+    def pick_ingredients(self, rng, count):
+        """
+        Draws distinct ingredient ids with Zipf popularity.
+
+        Args:
+            rng (random.Random): The entity's generator.
+            count (int): The number of draws. Duplicates are dropped, so fewer ids may be returned.
+
+        Returns:
+            list: The ingredient ids, in draw order.
+        """
+        draws = rng.choices(range(1, self.counts["ingredients"] + 1), cum_weights=self.ingredient_weights, k=count)
+        return list(dict.fromkeys(draws))
+
+    def ingredient(self, ingredient_id):
+        """
+        Returns the name, category id and unit of an ingredient.
+
+        Args:
+            ingredient_id (int): The ingredient id.
+
+        Returns:
+            tuple: The name, the category id and the unit.
+        """
+        name, category, unit = FOODS[(ingredient_id - 1) % len(FOODS)]
+        variant = (ingredient_id - 1) // len(FOODS)
+        return (f"{name} {variant + 1}" if variant else name), category + 1, unit
+
+    def recipe(self, recipe_id):
+        """
+        Returns the name, cuisine, preparation time, rating and creation time of a recipe.
+
+        Args:
+            recipe_id (int): The recipe id.
+
+        Returns:
+            tuple: The recipe attributes.
+        """
+        rng = self.rng("recipe", recipe_id)
+        cuisine = rng.choice(CUISINES)
+        name = f"{cuisine} {rng.choice(DISHES)} #{recipe_id}"
+        return name, cuisine, 5 + int(rng.lognormvariate(3.2, 0.5)), round(rng.uniform(2.5, 5.0), 1), \
+            self.timestamp(rng, 1095)
+
+    def recipe_ingredients(self, recipe_id):
+        """
+        Returns the ingredients, quantities and units of a recipe.
+
+        The number of ingredients is log-normal, around 7, with a tail past 20.
+
+        Args:
+            recipe_id (int): The recipe id.
+
+        Returns:
+            list: (ingredient_id, quantity, unit) tuples.
+        """
+        rng = self.rng("recipe_ingredients", recipe_id)
+        count = min(40, 2 + int(rng.lognormvariate(1.6, 0.6)))
+        result = []
+        for ingredient_id in self.pick_ingredients(rng, count):
+            unit = self.ingredient(ingredient_id)[2]
+            quantity = rng.randint(1, 6) if unit == "unit" else round(rng.lognormvariate(4.5, 0.8), 1)
+            result.append((ingredient_id, quantity, unit))
+        return result
+
+    def household_members(self, household_id):
+        """
+        Returns the user ids of a household, the owner first.
+
+        Args:
+            household_id (int): The household id.
+
+        Returns:
+            list: Between one and six distinct user ids.
+        """
+        rng = self.rng("household_members", household_id)
+        users = self.counts["users"]
+        size = min(6, 1 + int(rng.expovariate(0.9)))
+        return list(dict.fromkeys(rng.randint(1, users) for _ in range(size)))
+
+    def household_usage(self, household_id):
+        """
+        Yields the ingredient usage events of a household over the last year.
+
+        The number of events is Pareto distributed, from 5 for most households to thousands
+        for a few heavy ones.
+
+        Args:
+            household_id (int): The household id.
+
+        Yields:
+            tuple: The ingredient id, the used quantity, the unit and the time of use.
+        """
+        rng = self.rng("household_usage", household_id)
+        count = min(5000, int(5 * rng.paretovariate(1.2)))
+        for ingredient_id in rng.choices(range(1, self.counts["ingredients"] + 1),
+                                         cum_weights=self.ingredient_weights, k=count):
+            unit = self.ingredient(ingredient_id)[2]
+            quantity = float(rng.randint(1, 3)) if unit == "unit" else round(rng.lognormvariate(4.0, 0.7), 1)
+            yield ingredient_id, quantity, unit, self.timestamp(rng, 365)
+
+    def user_history(self, user_id):
+        """
+        Returns the recipes a user cooked and when, oldest first.
+
+        The number of cooked recipes is Pareto distributed and recipes are drawn with Zipf popularity.
+
+        Args:
+            user_id (int): The user id.
+
+        Returns:
+            list: (recipe_id, cooked_at) tuples.
+        """
+        rng = self.rng("user_history", user_id)
+        count = min(2000, int(2 * rng.paretovariate(1.3)))
+        recipes = rng.choices(range(1, self.counts["recipes"] + 1), cum_weights=self.recipe_weights, k=count)
+        return sorted(((recipe_id, self.timestamp(rng, 730)) for recipe_id in recipes), key=lambda item: item[1])
+
+    @staticmethod
+    def format_time(moment):
+        """Formats a timestamp the way the CSV files store it."""
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+    def users(self):
+        """Returns the CSV header and a row iterator of the users table."""
+        def rows():
+            for user_id in range(1, self.counts["users"] + 1):
+                rng = self.rng("user", user_id)
+                created = self.format_time(self.timestamp(rng, 1095))
+                yield (user_id, f"user{user_id}", f"user{user_id}@example.com", f"$2b$12${rng.getrandbits(64):016x}",
+                       "Admin" if user_id % 500 == 1 else "Member", created, created)
+        return ["user_id", "username", "email", "password_hash", "role", "created_at", "updated_at"], rows()
+
+    def households(self):
+        """Returns the CSV header and a row iterator of the households table."""
+        def rows():
+            for household_id in range(1, self.counts["households"] + 1):
+                rng = self.rng("household", household_id)
+                created = self.format_time(self.timestamp(rng, 1095))
+                yield (household_id, f"Household {household_id}",
+                       f"{rng.randint(1, 9999)} {rng.choice(STREETS)}", created, created)
+        return ["household_id", "household_name", "address", "created_at", "updated_at"], rows()
+
+    def household_users(self):
+        """Returns the CSV header and a row iterator of the household_users table."""
+        def rows():
+            household_user_id = 0
+            for household_id in range(1, self.counts["households"] + 1):
+                for position, user_id in enumerate(self.household_members(household_id)):
+                    household_user_id += 1
+                    yield household_user_id, household_id, user_id, "owner" if position == 0 else "member"
+        return ["household_user_id", "household_id", "user_id", "role"], rows()
+
+    def ingredient_categories(self):
+        """Returns the CSV header and a row iterator of the ingredient_categories table."""
+        rows = ((category_id, name) for category_id, name in enumerate(CATEGORIES, start=1))
+        return ["category_id", "category_name"], rows
+
+    def ingredients(self):
+        """Returns the CSV header and a row iterator of the ingredients table."""
+        def rows():
+            for ingredient_id in range(1, self.counts["ingredients"] + 1):
+                name, category_id, _ = self.ingredient(ingredient_id)
+                yield ingredient_id, name, category_id
+        return ["ingredient_id", "name", "category_id"], rows()
+
+    def stores(self):
+        """Returns the CSV header and a row iterator of the stores table."""
+        def rows():
+            for store_id in range(1, self.counts["stores"] + 1):
+                rng = self.rng("store", store_id)
+                yield (store_id, f"{rng.choice(STORE_CHAINS)} #{store_id}",
+                       f"{rng.randint(1, 9999)} {rng.choice(STREETS)}", round(rng.uniform(2.0, 5.0), 1),
+                       self.format_time(self.timestamp(rng, 1095)))
+        return ["store_id", "store_name", "address", "rating", "created_at"], rows()
+
+    def ingredient_prices(self):
+        """Returns the CSV header and a row iterator of the ingredient_prices table."""
+        def rows():
+            # Popular ingredients are stocked by more stores, and every store has a short price history.
+            price_id = 0
+            stores = self.counts["stores"]
+            for ingredient_id in range(1, self.counts["ingredients"] + 1):
+                rng = self.rng("prices", ingredient_id)
+                unit = self.ingredient(ingredient_id)[2]
+                base_price = rng.lognormvariate(1.0, 0.6)
+                store_count = min(stores, max(1, int(stores * 0.5 / ingredient_id ** 0.3)))
+                for store_id in sorted(rng.sample(range(1, stores + 1), store_count)):
+                    updated = self.reference_time - timedelta(days=rng.randrange(720))
+                    for _ in range(1 + int(rng.expovariate(1.0))):
+                        price_id += 1
+                        yield (price_id, ingredient_id, store_id, f"{base_price * rng.uniform(0.8, 1.3):.2f}", unit,
+                               self.format_time(updated))
+                        updated += timedelta(days=rng.randint(7, 90))
+        return ["price_id", "ingredient_id", "store_id", "price", "unit", "last_updated"], rows()
+
+    def household_ingredients(self):
+        """Returns the CSV header and a row iterator of the household_ingredients table."""
+        def rows():
+            household_ingredient_id = 0
+            for household_id in range(1, self.counts["households"] + 1):
+                rng = self.rng("pantry", household_id)
+                for ingredient_id in self.pick_ingredients(rng, min(200, int(rng.lognormvariate(2.8, 0.6)))):
+                    household_ingredient_id += 1
+                    unit = self.ingredient(ingredient_id)[2]
+                    expires = self.reference_date + timedelta(days=rng.randint(1, 120))
+                    yield (household_ingredient_id, household_id, ingredient_id,
+                           f"{rng.lognormvariate(5.0, 1.0):.2f}", unit, expires.isoformat(), "FALSE")
+        return ["household_ingredient_id", "household_id", "ingredient_id", "quantity", "unit",
+                "expiration_date", "is_expired"], rows()
+
+    def recipes(self):
+        """Returns the CSV header and a row iterator of the recipes table."""
+        def rows():
+            for recipe_id in range(1, self.counts["recipes"] + 1):
+                name, cuisine, preparation_time, rating, created = self.recipe(recipe_id)
+                yield recipe_id, name, cuisine, preparation_time, rating, "TRUE", self.format_time(created)
+        return ["recipe_id", "recipe_name", "cuisine", "preparation_time", "system_rating", "is_rated",
+                "created_at"], rows()
+
+    def recipe_ingredient_rows(self):
+        """Returns the CSV header and a row iterator of the recipe_ingredients table."""
+        def rows():
+            recipe_ingredient_id = 0
+            for recipe_id in range(1, self.counts["recipes"] + 1):
+                for ingredient_id, quantity, unit in self.recipe_ingredients(recipe_id):
+                    recipe_ingredient_id += 1
+                    yield recipe_ingredient_id, recipe_id, ingredient_id, quantity, unit
+        return ["recipe_ingredient_id", "recipe_id", "ingredient_id", "quantity", "unit"], rows()
+
+    def user_recipe_history(self):
+        """Returns the CSV header and a row iterator of the user_recipe_history table."""
+        def rows():
+            history_id = 0
+            for user_id in range(1, self.counts["users"] + 1):
+                for recipe_id, cooked_at in self.user_history(user_id):
+                    history_id += 1
+                    yield history_id, user_id, recipe_id, self.format_time(cooked_at)
+        return ["history_id", "user_id", "recipe_id", "cooked_at"], rows()
+
+    def ratings(self):
+        """
+        Yields every rating as (user_id, recipe_id, rating, review, created_at).
+
+        A user rates about a third of the recipes they cooked, an hour after cooking them.
+        """
+        for user_id in range(1, self.counts["users"] + 1):
+            rng = self.rng("ratings", user_id)
+            for recipe_id, cooked_at in self.user_history(user_id):
+                if rng.random() < 0.33:
+                    yield (user_id, recipe_id, round(min(5.0, max(0.0, rng.gauss(4.0, 0.8))), 1),
+                           rng.choice(REVIEWS), cooked_at + timedelta(hours=1))
+
+    def user_ratings(self):
+        """Returns the CSV header and a row iterator of the user_ratings table."""
+        def rows():
+            for rating_id, (user_id, recipe_id, rating, review, created) in enumerate(self.ratings(), start=1):
+                yield rating_id, user_id, recipe_id, rating, review, self.format_time(created)
+        return ["rating_id", "user_id", "recipe_id", "rating", "review", "created_at"], rows()
+
+    def recipe_documents(self):
+        """Yields the documents of the recipes_mongo collection."""
+        for recipe_id in range(1, self.counts["recipes"] + 1):
+            name, cuisine, preparation_time, rating, created = self.recipe(recipe_id)
+            ingredients = self.recipe_ingredients(recipe_id)
+            yield {
+                "_id": object_id("recipe", recipe_id),
+                "recipe_id": recipe_id,
+                "recipe_name": name,
+                "cuisine": cuisine,
+                "preparation_time": preparation_time,
+                "system_rating": float(rating),
+                "is_rated": True,
+                "created_at": created,
+                "ingredients": [
+                    {
+                        "ingredient_id": object_id("ingredient", ingredient_id),
+                        "name": self.ingredient(ingredient_id)[0],
+                        "quantity": float(quantity),
+                        "unit": unit
+                    }
+                    for ingredient_id, quantity, unit in ingredients
+                ],
+                "steps": [f"Step {number}" for number in range(1, len(ingredients) // 2 + 2)],
+                "tags": [cuisine.lower()]
+            }
+
+    def ingredient_documents(self):
+        """Yields the documents of the ingredients_mongo collection."""
+        for ingredient_id in range(1, self.counts["ingredients"] + 1):
+            rng = self.rng("nutrition", ingredient_id)
+            name, category_id, unit = self.ingredient(ingredient_id)
+            yield {
+                "_id": object_id("ingredient", ingredient_id),
+                "ingredient_id": ingredient_id,
+                "name": name,
+                "category": CATEGORIES[category_id - 1],
+                "unit": unit,
+                "value": float(1 if unit == "unit" else rng.choice([100, 250, 500, 1000])),
+                "nutritional_info": {
+                    "calories": float(rng.randint(5, 900)),
+                    "protein": f"{rng.uniform(0, 30):.1f}g",
+                    "fat": f"{rng.uniform(0, 100):.1f}g",
+                    "carbohydrates": f"{rng.uniform(0, 80):.1f}g"
+                }
+            }
+
+    def usage_documents(self):
+        """Yields the documents of the household_ingredient_usage collection."""
+        for household_id in range(1, self.counts["households"] + 1):
+            household = object_id("household", household_id)
+            for ingredient_id, quantity, unit, used_at in self.household_usage(household_id):
+                yield {
+                    "household_id": household,
+                    "ingredient_id": object_id("ingredient", ingredient_id),
+                    "used_quantity": quantity,
+                    "unit": unit,
+                    "used_at": used_at
+                }
+
+    def rating_documents(self):
+        """Yields the documents of the recipe_ratings collection."""
+        for user_id, recipe_id, rating, review, created in self.ratings():
+            yield {
+                "user_id": object_id("user", user_id),
+                "recipe_id": object_id("recipe", recipe_id),
+                "rating": float(rating),
+                "review": review,
+                "created_at": created
+            }
+
+    def preference_documents(self):
+        """Yields the documents of the user_preferences collection."""
+        for user_id in range(1, self.counts["users"] + 1):
+            rng = self.rng("preferences", user_id)
+            favourites = self.pick_ingredients(rng, rng.randint(1, 5))
+            yield {
+                "user_id": object_id("user", user_id),
+                "preferred_cuisines": rng.sample(CUISINES, rng.randint(1, 3)),
+                "allergies": rng.sample(ALLERGIES, int(rng.expovariate(2.0)) % len(ALLERGIES)),
+                "dietary_restrictions": rng.sample(DIETS, int(rng.expovariate(1.5)) % len(DIETS)),
+                "favorite_ingredients": [self.ingredient(ingredient_id)[0] for ingredient_id in favourites],
+                "favorite_recipes": [
+                    object_id("recipe", recipe_id) for recipe_id in rng.choices(
+                        range(1, self.counts["recipes"] + 1), cum_weights=self.recipe_weights, k=rng.randint(0, 4))
+                ]
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic seed data for load testing.")
+    parser.add_argument("--scale", type=float, help="Multiplier of the base entity counts.")
+    parser.add_argument("--seed", type=int, help="Random seed.")
+    parser.add_argument("--csv-dir", help="Output directory of the CSV files.")
+    parser.add_argument("--json-dir", help="Output directory of the JSON files.")
+    parser.add_argument("--reference-date", type=date.fromisoformat,
+                        help="The day timestamps and expiration dates are generated around, as YYYY-MM-DD.")
+    args = parser.parse_args()
+    SyntheticDataGenerator(args.scale, args.seed, args.csv_dir, args.json_dir, args.reference_date).generate()
@@ -0,0 +1,204 @@
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_PATTERN = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+REFERENCES_PATTERN = re.compile(r"REFERENCES\s+(\w+)", re.IGNORECASE)
+
+FOREIGN_KEYS_QUERY = """
+    SELECT DISTINCT tc.table_name, ccu.table_name
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.constraint_column_usage ccu
+        ON tc.constraint_name = ccu.constraint_name
+        AND tc.constraint_schema = ccu.constraint_schema
+    WHERE tc.constraint_type = 'FOREIGN KEY'
+        AND tc.table_schema = current_schema()
+"""
+
+
+def parse_foreign_keys(queries):
+    """
+    Builds the foreign key graph from CREATE TABLE statements.
+
+    Args:
+        queries (list): CREATE TABLE statements, such as PostgreSQLSetup.table_queries.
+
+    Returns:
+        dict: Maps each table name to the set of tables it references.
+    """
+    foreign_keys = {}
+    for query in queries:
+        match = CREATE_TABLE_PATTERN.search(query)
+        if not match:
+            continue
+        table = match.group(1).lower()
+        references = {name.lower() for name in REFERENCES_PATTERN.findall(query)}
+        foreign_keys[table] = references - {table}
+    return foreign_keys
+
+
+def fetch_foreign_keys(connection):
+    """
+    Reads the foreign key graph of the current schema from information_schema.
+
+    Args:
+        connection (psycopg2.extensions.connection): A connection to the PostgreSQL database.
+
+    Returns:
+        dict: Maps each referencing table name to the set of tables it references.
+    """
+    foreign_keys = {}
+    with connection.cursor() as cursor:
+        cursor.execute(FOREIGN_KEYS_QUERY)
+        for table, referenced in cursor.fetchall():
+            if table != referenced:
+                foreign_keys.setdefault(table, set()).add(referenced)
+    return foreign_keys
+
+
+def dependency_levels(tables, foreign_keys):
+    """
+    Groups tables into levels that can be loaded concurrently.
+
+    Every table is placed one level after the deepest table it references, so all of
+    its parents are loaded before it. References to tables outside `tables` are ignored.
+
+    Args:
+        tables (list): The tables to schedule.
+        foreign_keys (dict): Maps each table name to the set of tables it references.
+
+    Returns:
+        list: A list of levels, each a list of table names in their original order.
+
+    Raises:
+        ValueError: If the foreign keys between the tables form a cycle.
+    """
+    pending = {table: set(foreign_keys.get(table, ())) & set(tables) for table in tables}
+    levels = []
+    loaded = set()
+    while pending:
+        level = [table for table in tables if table in pending and pending[table] <= loaded]
+        if not level:
+            raise ValueError(f"Circular foreign keys between tables: {', '.join(sorted(pending))}")
+        for table in level:
+            del pending[table]
+        loaded.update(level)
+        levels.append(level)
+    return levels
+
+
+class TableLoadScheduler:
+    """
+    Loads the tables of a DataInsertion concurrently, one foreign key dependency level at a time.
+
+    Methods:
+        plan() -> list:
+            Computes the dependency levels for the tables in table_files.
+        run(bulk: bool) -> dict:
+            Loads every level concurrently and returns the load time of each table.
+        load_table(table: str, filename: str, bulk: bool) -> float:
+            Loads a single table on a pooled connection and returns its load time.
+    """
+
+    def __init__(self, data_inserter, pool, workers, foreign_keys=None):
+        """
+        Initializes the TableLoadScheduler.
+
+        Args:
+            data_inserter (DataInsertion): Provides table_files and the per-table loader.
+            pool (psycopg2.pool.ThreadedConnectionPool): The pool the workers take connections from.
+            workers (int): The maximum number of tables loaded at the same time.
+            foreign_keys (dict): The foreign key graph to schedule by. Read from
+                information_schema at runtime when not given.
+        """
+        self.data_inserter = data_inserter
+        self.pool = pool
+        self.workers = workers
+        self.foreign_keys = foreign_keys
+
+    def plan(self):
+        """
+        Computes the dependency levels for the tables in table_files.
+
+        Returns:
+            list: A list of levels, each a list of table names.
+        """
+        if self.foreign_keys is None:
+            connection = self.pool.getconn()
+            try:
+                self.foreign_keys = fetch_foreign_keys(connection)
+            finally:
+                self.pool.putconn(connection)
+        return dependency_levels(list(self.data_inserter.table_files), self.foreign_keys)
+
+    def run(self, bulk=False):
+        """
+        Loads every level concurrently and returns the load time of each table.
+
+        A level only starts after every table in the previous level has loaded, and
+        the run stops at the first level with a failed table.
+
+        Args:
+            bulk (bool): Use COPY FROM STDIN for files that pass validation.
+
+        Returns:
+            dict: Maps each table name to its load time in seconds.
+        """
+        timings = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for number, level in enumerate(self.plan(), start=1):
+                logger.info(f"Loading level {number}: {', '.join(level)}")
+                print(f"Loading level {number} with {len(level)} tables: {', '.join(level)}")
+                level_start = time.perf_counter()
+                futures = {
+                    table: executor.submit(self.load_table, table, self.data_inserter.table_files[table], bulk)
+                    for table in level
+                }
+                errors = []
+                for table, future in futures.items():
+                    try:
+                        timings[table] = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        logger.error(f"Loading table {table} failed: {e}")
+                if errors:
+                    raise errors[0]
+                logger.info(f"Level {number} loaded in {time.perf_counter() - level_start:.2f}s")
+
+        logger.info(f"Loaded {len(timings)} tables in {time.perf_counter() - start:.2f}s with {self.workers} workers")
+        return timings
+
+    def load_table(self, table, filename, bulk=False):
+        """
+        Loads a single table on a pooled connection and returns its load time.
+
+        Args:
+            table (str): The name of the target table.
+            filename (str): The name of the CSV file in the ../csv directory.
+            bulk (bool): Use COPY FROM STDIN when the file passes validation.
+
+        Returns:
+            float: The load time in seconds.
+        """
+        connection = self.pool.getconn()
+        try:
+            connection.autocommit = True
+            start = time.perf_counter()
+            rows = self.data_inserter.load_table(table, filename, bulk, connection)
+            elapsed = time.perf_counter() - start
+            logger.info(f"Loaded table {table}: {rows} rows in {elapsed:.2f}s")
+            return elapsed
+        finally:
+            self.pool.putconn(connection)
+
+
+if __name__ == "__main__":
+    from postgresql_setup import PostgreSQLSetup
+
+    ddl_foreign_keys = parse_foreign_keys(PostgreSQLSetup.table_queries)
+    for number, level in enumerate(dependency_levels(list(ddl_foreign_keys), ddl_foreign_keys), start=1):
+        print(f"Level {number}: {', '.join(level)}")
@@ -0,0 +1,174 @@
+# Every known spelling of a unit, with its base unit and how many base units it holds.
+# Mass is kept in grams, volume in millilitres and counted items in units.
+UNITS = {
+    "g": ("g", 1.0), "gr": ("g", 1.0), "gram": ("g", 1.0), "grams": ("g", 1.0),
+    "mg": ("g", 0.001), "milligram": ("g", 0.001), "milligrams": ("g", 0.001),
+    "kg": ("g", 1000.0), "kilo": ("g", 1000.0), "kilogram": ("g", 1000.0), "kilograms": ("g", 1000.0),
+    "oz": ("g", 28.349523125), "ounce": ("g", 28.349523125), "ounces": ("g", 28.349523125),
+    "lb": ("g", 453.59237), "lbs": ("g", 453.59237), "pound": ("g", 453.59237), "pounds": ("g", 453.59237),
+    "ml": ("ml", 1.0), "milliliter": ("ml", 1.0), "milliliters": ("ml", 1.0),
+    "millilitre": ("ml", 1.0), "millilitres": ("ml", 1.0),
+    "cl": ("ml", 10.0), "dl": ("ml", 100.0),
+    "l": ("ml", 1000.0), "liter": ("ml", 1000.0), "liters": ("ml", 1000.0),
+    "litre": ("ml", 1000.0), "litres": ("ml", 1000.0),
+    "tsp": ("ml", 4.92892159375), "teaspoon": ("ml", 4.92892159375), "teaspoons": ("ml", 4.92892159375),
+    "tbsp": ("ml", 14.78676478125), "tablespoon": ("ml", 14.78676478125), "tablespoons": ("ml", 14.78676478125),
+    "fl oz": ("ml", 29.5735295625), "cup": ("ml", 236.5882365), "cups": ("ml", 236.5882365),
+    "pint": ("ml", 473.176473), "pints": ("ml", 473.176473),
+    "quart": ("ml", 946.352946), "quarts": ("ml", 946.352946),
+    "gallon": ("ml", 3785.411784), "gallons": ("ml", 3785.411784),
+    "unit": ("unit", 1.0), "units": ("unit", 1.0), "piece": ("unit", 1.0), "pieces": ("unit", 1.0),
+    "pc": ("unit", 1.0), "pcs": ("unit", 1.0), "each": ("unit", 1.0), "ea": ("unit", 1.0),
+    "item": ("unit", 1.0), "items": ("unit", 1.0), "dozen": ("unit", 12.0)
+}
+
+
+def normalize_unit(unit):
+    """
+    Normalizes the spelling of a unit so it can be looked up.
+
+    Args:
+        unit (str): The unit as written, such as " Kg" or "Tbsp.".
+
+    Returns:
+        str: The unit in lower case without surrounding or repeated whitespace or a trailing dot.
+    """
+    return " ".join(str(unit).casefold().split()).rstrip(".")
+
+
+class UnitRegistry:
+    """
+    Converts free-text units and quantities to canonical base units.
+
+    Mass is expressed in grams, volume in millilitres and counted items in units. A unit the
+    registry does not know is its own base unit, so a quantity can always be converted and
+    only compares equal to quantities written in the same unit.
+
+    The scalar methods only use the standard library, so seeding does not depend on numpy.
+    to_base_arrays and convert_arrays need numpy, which they import when first called; it is
+    required by the numpy-based tools built on them, PriceSnapshot, PantryMatcher and the
+    basket optimizer.
+
+    Methods:
+        lookup(unit: str) -> tuple:
+            Returns the base unit of a unit and how many base units it holds.
+        is_known(unit: str) -> bool:
+            Checks whether the registry knows a unit.
+        to_base(quantity: float, unit: str) -> tuple:
+            Converts a quantity to its base unit.
+        base_code(base_unit: str) -> int:
+            Returns the integer code of a base unit.
+        to_base_arrays(quantities, units) -> tuple:
+            Converts whole arrays of quantities to base units.
+        convert_arrays(quantities, units, target_unit: str) -> numpy.ndarray:
+            Converts whole arrays of quantities to one target unit.
+    """
+
+    def __init__(self, units=None):
+        """
+        Initializes the UnitRegistry.
+
+        Args:
+            units (dict): Maps unit spellings to their base unit and factor. Defaults to UNITS.
+        """
+        self.units = {normalize_unit(unit): definition for unit, definition in (units or UNITS).items()}
+        self.base_codes = {}
+        for base_unit, _ in self.units.values():
+            self.base_code(base_unit)
+
+    def lookup(self, unit):
+        """
+        Returns the base unit of a unit and how many base units it holds.
+
+        Args:
+            unit (str): The unit as written.
+
+        Returns:
+            tuple: The base unit and the factor. An unknown unit is returned normalized with a factor of 1.
+        """
+        normalized = normalize_unit(unit)
+        return self.units.get(normalized, (normalized, 1.0))
+
+    def is_known(self, unit):
+        """
+        Checks whether the registry knows a unit.
+
+        Args:
+            unit (str): The unit as written.
+
+        Returns:
+            bool: True if the unit has a conversion.
+        """
+        return normalize_unit(unit) in self.units
+
+    def to_base(self, quantity, unit):
+        """
+        Converts a quantity to its base unit.
+
+        Args:
+            quantity (float): The quantity.
+            unit (str): The unit as written.
+
+        Returns:
+            tuple: The quantity in the base unit and the base unit.
+        """
+        base_unit, factor = self.lookup(unit)
+        return float(quantity) * factor, base_unit
+
+    def base_code(self, base_unit):
+        """
+        Returns the integer code of a base unit, assigning one to a unit seen for the first time.
+
+        Args:
+            base_unit (str): The base unit.
+
+        Returns:
+            int: The code. Quantities with equal codes are directly comparable.
+        """
+        return self.base_codes.setdefault(base_unit, len(self.base_codes))
+
+    def to_base_arrays(self, quantities, units):
+        """
+        Converts whole arrays of quantities to base units.
+
+        Every distinct unit is looked up once, and the conversion itself is a single vectorised
+        multiplication.
+
+        Args:
+            quantities (array-like): The quantities.
+            units (array-like): The unit of each quantity as written.
+
+        Returns:
+            tuple: The quantities in their base units as a float64 array, and the base unit code
+                of each quantity as an int32 array.
+        """
+        import numpy as np
+
+        quantities = np.asarray(quantities, dtype=np.float64)
+        distinct, inverse = np.unique(np.asarray(units, dtype=object).astype(str), return_inverse=True)
+        factors = np.empty(len(distinct), dtype=np.float64)
+        codes = np.empty(len(distinct), dtype=np.int32)
+        for index, unit in enumerate(distinct):
+            base_unit, factors[index] = self.lookup(unit)
+            codes[index] = self.base_code(base_unit)
+        inverse = inverse.reshape(quantities.shape)
+        return quantities * factors[inverse], codes[inverse]
+
+    def convert_arrays(self, quantities, units, target_unit):
+        """
+        Converts whole arrays of quantities to one target unit.
+
+        Args:
+            quantities (array-like): The quantities.
+            units (array-like): The unit of each quantity as written.
+            target_unit (str): The unit to convert to, such as "kg".
+
+        Returns:
+            numpy.ndarray: The quantities in the target unit, NaN where a unit cannot be
+                converted to it, such as grams to millilitres.
+        """
+        import numpy as np
+
+        base_quantities, codes = self.to_base_arrays(quantities, units)
+        target_base, target_factor = self.lookup(target_unit)
+        return np.where(codes == self.base_code(target_base), base_quantities / target_factor, np.nan)
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    from .metrics import registry as metrics
+except ImportError:
+    from metrics import registry as metrics
+
+VIDEO_URL_TEMPLATE = "https://www.youtube.com/watch?v={}"
+
+
+class RateLimiter:
+    """
+    Spaces out requests from any number of threads so no more than `rate` are sent per second.
+
+    Methods:
+        acquire() -> None:
+            Blocks until the next request may be sent.
+    """
+
+    def __init__(self, rate):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            rate (float): The maximum number of requests per second. 0 disables the limit.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until the next request may be sent.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RankedVideoResolver:
+    """
+    Picks the most watched YouTube video for many recipes with batched statistics lookups.
+
+    Every recipe gets one search call returning a few candidate videos. The statistics of all
+    candidates across the recipes are then fetched with videos.list calls of up to 50 IDs each,
+    instead of one statistics call per recipe. Search and statistics calls together are held to
+    the YouTube rate limit, and every worker thread uses its own HTTP session.
+
+    Methods:
+        resolve(queries: list) -> dict:
+            Returns the URL of the best ranked video for each query.
+        search_candidates(query: str) -> list:
+            Returns the IDs of the top search results for a query.
+        fetch_statistics(video_ids: list) -> dict:
+            Returns the statistics of the given videos in batches of 50 IDs.
+        get(path: str, params: dict) -> requests.Response:
+            Sends a GET request on the calling thread's own session.
+    """
+
+    batch_size = 50
+
+    def __init__(self, api_key, cache=None, candidates=None, concurrency=None, base_url=None, rate=None):
+        """
+        Initializes the RankedVideoResolver.
+
+        Args:
+            api_key (str): The YouTube Data API key.
+            cache (ResponseCache): Caches search candidates and video statistics.
+            candidates (int): The number of search results ranked per recipe. Defaults to
+                YOUTUBE_CANDIDATES, or 5.
+            concurrency (int): The number of search calls in flight. Defaults to
+                YOUTUBE_MAX_CONCURRENCY, or 8.
+            base_url (str): The API root. Defaults to YOUTUBE_API_URL.
+            rate (float): The maximum number of requests per second. Defaults to
+                YOUTUBE_RATE_LIMIT, or 10. 0 disables the limit.
+        """
+        self.api_key = api_key
+        self.cache = cache
+        self.candidates = candidates or int(os.getenv("YOUTUBE_CANDIDATES", "5"))
+        self.concurrency = concurrency or int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "8"))
+        self.base_url = (base_url or os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")).rstrip("/")
+        if rate is None:
+            rate = float(os.getenv("YOUTUBE_RATE_LIMIT", "10"))
+        self.limiter = RateLimiter(rate)
+        # requests.Session is not thread safe, so every search thread gets its own.
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.search_calls = 0
+        self.statistics_calls = 0
+
+    def resolve(self, queries):
+        """
+        Returns the URL of the best ranked video for each query.
+
+        Videos are ranked by view count, then by like count.
+
+        Args:
+            queries (list): The search queries, such as recipe names.
+
+        Returns:
+            dict: Maps each query to its video URL. Queries without any search result are left out.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            candidates = dict(zip(queries, executor.map(self.search_candidates, queries)))
+
+        video_ids = list(dict.fromkeys(video_id for ids in candidates.values() for video_id in ids))
+        statistics = self.fetch_statistics(video_ids)
+
+        def score(video_id):
+            stats = statistics.get(video_id, {})
+            return int(stats.get("viewCount", 0)), int(stats.get("likeCount", 0))
+
+        return {
+            query: VIDEO_URL_TEMPLATE.format(max(ids, key=score))
+            for query, ids in candidates.items() if ids
+        }
+
+    def search_candidates(self, query):
+        """
+        Returns the IDs of the top search results for a query.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            list: The candidate video IDs, empty if the search found nothing or failed.
+        """
+        if self.cache is not None:
+            found, video_ids = self.cache.get("youtube_candidates", query)
+            if found:
+                return video_ids or []
+
+        with self.lock:
+            self.search_calls += 1
+        metrics.increment("youtube_fetch", "api_calls")
+        try:
+            self.limiter.acquire()
+            with metrics.timer("youtube_fetch", "youtube_search"):
+                response = self.get("search", {
+                    "part": "snippet",
+                    "q": query,
+                    "type": "video",
+                    "order": "viewCount",
+                    "maxResults": self.candidates,
+                    "key": self.api_key
+                })
+            if response.status_code != 200:
+                metrics.increment("youtube_fetch", "api_errors")
+                print(f"Error fetching YouTube search results for query '{query}': {response.status_code}")
+                return []
+            video_ids = [item["id"]["videoId"] for item in response.json().get("items", [])]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            metrics.increment("youtube_fetch", "api_errors")
+            print(f"Error fetching YouTube search results for query '{query}': {e}")
+            return []
+
+        if self.cache is not None:
+            self.cache.set("youtube_candidates", query, video_ids or None)
+        return video_ids
+
+    def fetch_statistics(self, video_ids):
+        """
+        Returns the statistics of the given videos in batches of 50 IDs.
+
+        A batch whose request fails is skipped, so its videos have no statistics.
+
+        Args:
+            video_ids (list): The video IDs to look up.
+
+        Returns:
+            dict: Maps each video ID to its statistics.
+        """
+        statistics = {}
+        missing = []
+        for video_id in video_ids:
+            found, stats = self.cache.get("youtube_statistics", video_id) if self.cache is not None else (False, None)
+            if found and stats is not None:
+                statistics[video_id] = stats
+            else:
+                missing.append(video_id)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            with self.lock:
+                self.statistics_calls += 1
+            metrics.increment("youtube_fetch", "api_calls")
+            try:
+                self.limiter.acquire()
+                with metrics.timer("youtube_fetch", "youtube_videos"):
+                    response = self.get("videos", {
+                        "part": "statistics",
+                        "id": ",".join(batch),
+                        "key": self.api_key
+                    })
+                if response.status_code != 200:
+                    metrics.increment("youtube_fetch", "api_errors")
+                    print(f"Error fetching YouTube video statistics: {response.status_code}")
+                    continue
+                items = [item for item in response.json().get("items", []) if "statistics" in item]
+            except (requests.RequestException, ValueError) as e:
+                metrics.increment("youtube_fetch", "api_errors")
+                print(f"Error fetching YouTube video statistics: {e}")
+                continue
+            for item in items:
+                statistics[item["id"]] = item["statistics"]
+                if self.cache is not None:
+                    self.cache.set("youtube_statistics", item["id"], item["statistics"])
+        return statistics
+
+    def get(self, path, params):
+        """
+        Sends a GET request on the calling thread's own session.
+
+        Args:
+            path (str): The endpoint path below the API root.
+            params (dict): The query parameters.
+
+        Returns:
+            requests.Response: The response.
+
+        Raises:
+            requests.RequestException: If the request fails.
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session.get(f"{self.base_url}/{path}", params=params, timeout=30)
@@ -6,11 +6,27 @@ Created on Thu Aug 15 18:26:56 2024
 """
 
 import os
-import requests
 from googleapiclient.discovery import build
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
+try:
+    from .bulk_writer import BulkUpdateWriter
+    from .fetch_engine import AsyncFetchEngine
+    from .image_resolver import HedgedImageResolver
+    from .metrics import registry as metrics
+    from .query_normalizer import group_documents, normalize_ingredient_name
+    from .response_cache import ResponseCache, normalize_query
+    from .video_resolver import RankedVideoResolver
+except ImportError:
+    from bulk_writer import BulkUpdateWriter
+    from fetch_engine import AsyncFetchEngine
+    from image_resolver import HedgedImageResolver
+    from metrics import registry as metrics
+    from query_normalizer import group_documents, normalize_ingredient_name
+    from response_cache import ResponseCache, normalize_query
+    from video_resolver import RankedVideoResolver
+
 class YouTubeImageFetcher:
     """
     Manages the fetching and updating of YouTube video URLs and Unsplash image URLs in MongoDB collections.
@@ -18,23 +34,35 @@ class YouTubeImageFetcher:
     Methods:
         connect_mongodb() -> MongoClient:
             Establishes a connection to the MongoDB database.
-        fetch_youtube_urls() -> None:
+        fetch_youtube_urls(concurrent: bool, ranked: bool) -> None:
             Fetches YouTube video URLs using the YouTube API and updates the MongoDB recipes collection.
-        fetch_image_urls() -> None:
+        fetch_ranked_youtube_urls(window: int) -> None:
+            Fetches the most viewed YouTube video for every recipe without a video URL.
+        fetch_image_urls(concurrent: bool) -> None:
             Fetches image URLs from Unsplash API and updates the MongoDB ingredients collection.
+        search_youtube(youtube, query: str) -> str:
+            Searches YouTube for a video matching the query and returns the video URL.
         update_collection(collection_name: str, filter: dict, update: dict) -> None:
             Updates a MongoDB collection with the given filter and update parameters.
+        close() -> None:
+            Shuts down the image resolver's worker threads and closes the response cache.
     """
 
-    def __init__(self):
+    def __init__(self, connections=None):
         """
         Initializes the YouTubeImageFetcher class by loading environment variables and connecting to MongoDB.
+
+        Args:
+            connections (ConnectionManager): Provides the shared MongoDB client. The class opens
+                its own client when None.
         """
         load_dotenv(override=True)
-        self.mongo_client = self.connect_mongodb()
+        self.mongo_client = connections.mongo_client() if connections is not None else self.connect_mongodb()
         self.mongo_db = self.mongo_client[os.getenv("MONGO_DB")]
         self.youtube_api_key = os.getenv("YOUTUBE_API_KEY")
         self.unsplash_access_key = os.getenv("UNSPLASH_ACCESS_KEY")
+        self.cache = ResponseCache()
+        self.image_resolver = HedgedImageResolver.from_environment(self.cache)
 
     def connect_mongodb(self):
         """
@@ -57,69 +85,132 @@ class YouTubeImageFetcher:
             print(f"Error connecting to MongoDB: {e}")
             raise
 
-    def fetch_youtube_urls(self):
+    def fetch_youtube_urls(self, concurrent=False, ranked=False):
         """
         Fetches YouTube video URLs using the YouTube API and updates the MongoDB recipes collection.
+
+        Args:
+            concurrent (bool): Run the lookups on the AsyncFetchEngine instead of one at a time.
+            ranked (bool): Pick the most viewed of several candidate videos per recipe, using
+                batched statistics lookups. Takes precedence over `concurrent`.
         """
+        if ranked:
+            self.fetch_ranked_youtube_urls()
+            return
+        if concurrent:
+            AsyncFetchEngine(self).run(["youtube"])
+            return
+
         youtube = build('youtube', 'v3', developerKey=self.youtube_api_key)
         recipes_collection = self.mongo_db['recipes_mongo']
 
         recipes = recipes_collection.find({"video_url": {"$exists": False}})
-        for recipe in recipes:
-            query = recipe["recipe_name"] + " recipe"
-            request = youtube.search().list(q=query, part="snippet", type="video", maxResults=1)
-            response = request.execute()
+        with BulkUpdateWriter(self.mongo_db) as writer:
+            for recipe in recipes:
+                query = recipe["recipe_name"] + " recipe"
+                video_url = self.search_youtube(youtube, query)
+
+                if video_url:
+                    writer.add(
+                        "recipes_mongo",
+                        {"_id": recipe["_id"]},
+                        {"$set": {"video_url": video_url}}
+                    )
+                    print(f"Updated recipe '{recipe['recipe_name']}' with YouTube URL: {video_url}")
+
+    def fetch_ranked_youtube_urls(self, window=None):
+        """
+        Fetches the most viewed YouTube video for every recipe without a video URL.
 
-            if response["items"]:
-                video_url = "https://www.youtube.com/watch?v=" + response["items"][0]["id"]["videoId"]
-                self.update_collection(
-                    "recipes_mongo",
-                    {"_id": recipe["_id"]},
-                    {"$set": {"video_url": video_url}}
-                )
-                print(f"Updated recipe '{recipe['recipe_name']}' with YouTube URL: {video_url}")
+        Recipes are resolved in windows so the statistics of all candidates in a window are
+        fetched in shared videos.list calls of up to 50 IDs.
 
-    def fetch_image_urls(self):
+        Args:
+            window (int): The number of distinct recipe queries per window. Defaults to
+                YOUTUBE_RANK_WINDOW, or 500.
+        """
+        window = window or int(os.getenv("YOUTUBE_RANK_WINDOW", "500"))
+        resolver = RankedVideoResolver(self.youtube_api_key, self.cache)
+        recipes = self.mongo_db['recipes_mongo'].find({"video_url": {"$exists": False}}, {"recipe_name": 1})
+        groups, count = group_documents(recipes, "recipe_name", normalize_query, lambda name: name + " recipe")
+        queries = list(groups)
+
+        with BulkUpdateWriter(self.mongo_db) as writer:
+            for start in range(0, len(queries), window):
+                video_urls = resolver.resolve(queries[start:start + window])
+                for query, video_url in video_urls.items():
+                    writer.add(
+                        "recipes_mongo",
+                        {"_id": {"$in": groups[query]}},
+                        {"$set": {"video_url": video_url}},
+                        many=True
+                    )
+                    print(f"Updated recipe '{query}' with YouTube URL: {video_url}")
+
+        print(f"Ranked videos for {count} recipes with {resolver.search_calls} search calls "
+              f"and {resolver.statistics_calls} statistics calls.")
+
+    def fetch_image_urls(self, concurrent=False):
         """
         Fetches image URLs from Unsplash API and updates the MongoDB ingredients collection.
+
+        Ingredient names that only differ in case, plurals or qualifiers such as "fresh" are
+        looked up once, by one of their original names, and the result is applied to all of
+        them with a single update_many.
+        Lookups go through the hedged image resolver, which falls back to Google Custom Search
+        when it is configured.
+
+        Args:
+            concurrent (bool): Run the lookups on the AsyncFetchEngine instead of one at a time.
         """
-        ingredients_collection = self.mongo_db['ingredients_mongo']
+        if concurrent:
+            AsyncFetchEngine(self).run(["unsplash"])
+            self.image_resolver.report()
+            return
 
-        ingredients = ingredients_collection.find({"image_url": {"$exists": False}})
-        for ingredient in ingredients:
-            query = ingredient["name"]
-            image_url = self.search_unsplash(query)
-            if image_url:
-                self.update_collection(
-                    "ingredients_mongo",
-                    {"_id": ingredient["_id"]},
-                    {"$set": {"image_url": image_url}}
-                )
-                print(f"Updated ingredient '{ingredient['name']}' with image URL: {image_url}")
+        ingredients_collection = self.mongo_db['ingredients_mongo']
 
-    def search_unsplash(self, query):
+        ingredients = ingredients_collection.find({"image_url": {"$exists": False}}, {"name": 1})
+        groups, count = group_documents(ingredients, "name", normalize_ingredient_name)
+        print(f"Looking up {len(groups)} distinct names for {count} ingredients, "
+              f"saving {count - len(groups)} API calls.")
+        with BulkUpdateWriter(self.mongo_db) as writer:
+            for query, ids in groups.items():
+                image_url = self.image_resolver.resolve(query)
+                if image_url:
+                    writer.add(
+                        "ingredients_mongo",
+                        {"_id": {"$in": ids}},
+                        {"$set": {"image_url": image_url}},
+                        many=True
+                    )
+                    print(f"Updated {len(ids)} ingredients named '{query}' with image URL: {image_url}")
+        self.image_resolver.report()
+
+    def search_youtube(self, youtube, query):
         """
-        Searches Unsplash for an image matching the query and returns the image URL.
+        Searches YouTube for a video matching the query and returns the video URL.
 
         Args:
-            query (str): The search query for Unsplash.
+            youtube (googleapiclient.discovery.Resource): The YouTube Data API client.
+            query (str): The search query for YouTube.
 
         Returns:
-            str: The URL of the first image result from Unsplash, or None if not found.
-        """
-        url = f"https://api.unsplash.com/search/photos?query={query}&client_id={self.unsplash_access_key}&per_page=1"
-        response = requests.get(url)
-
-        if response.status_code == 200:
-            data = response.json()
-            if data['results']:
-                return data['results'][0]['urls']['regular']
-            else:
-                print(f"No images found for query: {query}")
-                return None
-        else:
-            print(f"Error fetching image from Unsplash: {response.status_code}")
-            return None
+            str: The URL of the first video result, or None if not found.
+        """
+        found, video_url = self.cache.get("youtube", query)
+        if found:
+            return video_url
+
+        request = youtube.search().list(q=query, part="snippet", type="video", maxResults=1)
+        metrics.increment("youtube_fetch", "api_calls")
+        with metrics.timer("youtube_fetch", "youtube_search"):
+            response = request.execute()
+        video_url = None
+        if response["items"]:
+            video_url = "https://www.youtube.com/watch?v=" + response["items"][0]["id"]["videoId"]
+        self.cache.set("youtube", query, video_url)
+        return video_url
 
     def update_collection(self, collection_name, filter, update):
         """
@@ -134,7 +225,17 @@ class YouTubeImageFetcher:
         collection.update_one(filter, update)
         print(f"Updated collection '{collection_name}' with filter: {filter} and update: {update}")
 
+    def close(self):
+        """
+        Shuts down the image resolver's worker threads and closes the response cache.
+        """
+        self.image_resolver.close()
+        self.cache.close()
+
 if __name__ == "__main__":
     fetcher = YouTubeImageFetcher()
-    fetcher.fetch_youtube_urls()
-    fetcher.fetch_image_urls()
+    try:
+        fetcher.fetch_youtube_urls()
+        fetcher.fetch_image_urls()
+    finally:
+        fetcher.close()